@@ -1,5 +1,85 @@
 from django.contrib import admin
-from .models import DoctorProfile, Appointment
+from django.core.paginator import Paginator
+from django.db.models import Max, Min
+from django.utils.functional import cached_property
+from .models import Appointment, DoctorProfile, PatientProfile
+from .search import filter_patients
 
-admin.site.register(DoctorProfile)
-admin.site.register(Appointment)
+# The changelists below read each page with one joined query (list_select_related and __str__s
+# that stay on it), filter and order on indexed columns, pick related rows through autocomplete
+# instead of <select>s of every row, and never count a huge table exactly.
+
+COUNT_LIMIT = 10000
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Counts at most count_limit rows. Past that, an unfiltered changelist is sized from the id range
+    (two index lookups; deleted rows leave its last pages short) and a filtered one stops at
+    count_limit rows, so narrow it down to see the rest.
+    """
+    count_limit = COUNT_LIMIT
+
+    @cached_property
+    def count(self):
+        counted = self.object_list.order_by()[:self.count_limit].count()
+        if counted < self.count_limit or self.object_list.query.where:
+            return counted
+        ids = self.object_list.model._default_manager.aggregate(first=Min('pk'), last=Max('pk'))
+        return max(ids['last'] - ids['first'] + 1, self.count_limit)
+
+
+class SpecializationFilter(admin.SimpleListFilter):
+    # Choices from the doctors' specialization index, not a DISTINCT over every appointment
+    title = 'specialization'
+    parameter_name = 'specialization'
+
+    def lookups(self, request, model_admin):
+        specializations = DoctorProfile.objects.order_by('specialization').values_list('specialization', flat=True).distinct()
+        return [(specialization, specialization) for specialization in specializations]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(doctor__specialization=self.value())
+        return queryset
+
+
+@admin.register(DoctorProfile)
+class DoctorProfileAdmin(admin.ModelAdmin):
+    list_display = ['__str__', 'specialization', 'city', 'consultation_fee', 'experience_years']
+    list_select_related = ['user']
+    list_filter = ['specialization']
+    search_fields = ['^user__last_name', '^user__first_name', '^specialization']
+    raw_id_fields = ['user']
+    ordering = ['id']
+    show_full_result_count = False
+
+
+@admin.register(PatientProfile)
+class PatientProfileAdmin(admin.ModelAdmin):
+    list_display = ['__str__', 'phone', 'gender', 'dob']
+    list_select_related = ['user']
+    search_fields = ['first_name', 'last_name', 'phone']  # see get_search_results
+    raw_id_fields = ['user']
+    ordering = ['id']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        # The registry's prefix search, which the LOWER() and phone indexes serve, instead of LIKE '%term%'
+        if not search_term.strip():
+            return queryset, False
+        return queryset & filter_patients({'q': search_term}), False
+
+
+@admin.register(Appointment)
+class AppointmentAdmin(admin.ModelAdmin):
+    list_display = ['date', 'time', 'doctor', 'patient']
+    list_select_related = ['doctor__user', 'patient__user']
+    # No doctor sidebar filter, which would list every doctor; one doctor's appointments are
+    # ?doctor__id__exact=<id>, served by the (doctor, date, time) unique index
+    list_filter = ['date', SpecializationFilter]
+    autocomplete_fields = ['doctor', 'patient']
+    ordering = ['-date', '-time']  # the (date, time) index
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
@@ -0,0 +1,110 @@
+import asyncio
+from asgiref.sync import sync_to_async
+from django.db.models import Prefetch
+from django.http import JsonResponse
+from django.views import View
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from . import availability, caching
+from .authentication import adoctor_id_for, apatient_id_for
+from .conditional import conditional_get
+from .models import Appointment, DoctorProfile
+from .pagination import DoctorDirectoryPagination
+from .serializers import AppointmentSerializer, DoctorDirectorySerializer, DoctorSerializer
+
+# Async (ASGI) versions of the heavy read endpoints. They answer the same query parameters
+# with the same bodies as their APIView counterparts in views.py, using the async ORM.
+
+
+async def authenticate(request):
+    """JWT authentication without DRF's synchronous request wrapper. Returns a ClaimsUser or None."""
+    auth = JWTStatelessUserAuthentication()
+    header = auth.get_header(request)
+    raw_token = auth.get_raw_token(header) if header else None
+    if raw_token is None:
+        return None
+    # The user is built from the token claims, so there's no query to move off the event loop
+    return auth.get_user(auth.get_validated_token(raw_token))
+
+
+class AsyncAPIView(View):
+    http_method_names = ['get', 'options']
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            user = await authenticate(request)
+        except (InvalidToken, AuthenticationFailed) as exc:
+            return JsonResponse(exc.detail, status=status.HTTP_401_UNAUTHORIZED)
+        if user is None or not user.is_active:
+            return JsonResponse({"detail": "Authentication credentials were not provided."}, status=status.HTTP_401_UNAUTHORIZED)
+        request.user = user
+        return await super().dispatch(request, *args, **kwargs)
+
+
+class AsyncDoctorListView(AsyncAPIView):
+    @conditional_get('doctors', 'users', 'appointments', 'patients')
+    async def get(self, request):
+        doctors = DoctorProfile.objects.select_related('user')
+        if request.GET.get('view') == 'directory':
+            # Cursor pagination is synchronous DRF code; run it (and its single query) off the event loop
+            return await sync_to_async(self.directory_page)(request, doctors)
+
+        appointments = Appointment.objects.select_related('patient').order_by('date', 'time')
+        doctors = [doctor async for doctor in doctors.prefetch_related(Prefetch('appointments', queryset=appointments))]
+        return JsonResponse(DoctorSerializer(doctors, many=True).data, safe=False)
+
+    def directory_page(self, request, doctors):
+        paginator = DoctorDirectoryPagination()
+        page = paginator.paginate_queryset(doctors, Request(request), view=self)
+        response = paginator.get_paginated_response(DoctorDirectorySerializer(page, many=True).data)
+        return JsonResponse(response.data)
+
+
+class AsyncAppointmentView(AsyncAPIView):
+    async def get(self, request):
+        user = request.user
+        doctor_id = None if user.is_staff else await adoctor_id_for(user)
+        if user.is_staff:
+            role, principal_id = 'staff', None
+            qs = Appointment.objects.all()
+        elif doctor_id:
+            role, principal_id = 'doctor', doctor_id
+            qs = Appointment.objects.filter(doctor_id=doctor_id)
+        else:
+            role, principal_id = 'patient', await apatient_id_for(user)
+            qs = Appointment.objects.filter(patient_id=principal_id)
+        qs = qs.select_related('doctor__user', 'patient').order_by('date', 'time')
+
+        async def build():
+            # Everything the serializer touches is joined in, so serializing does no I/O
+            return AppointmentSerializer([appointment async for appointment in qs], many=True).data
+
+        return JsonResponse(await caching.aget_timeline(role, principal_id, build), safe=False)
+
+
+class AsyncAvailableSlotsView(AsyncAPIView):
+    @conditional_get('doctors', 'appointments')
+    async def get(self, request):
+        try:
+            doctor_ids, start, end, single_day = availability.parse_slot_query(request.GET)
+        except ValueError as exc:
+            return JsonResponse({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # The doctor rows and the booked-slot range query only need the ids, so run them concurrently
+        doctors, rows = await asyncio.gather(
+            self.fetch_doctors(doctor_ids),
+            self.fetch_booked(doctor_ids, start, end),
+        )
+        if len(doctors) != len(set(doctor_ids)):
+            return JsonResponse({"detail": "Doctor not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        slots = availability.free_slots(doctors, availability.group_booked(rows), start, end)
+        return JsonResponse(availability.slots_payload(doctors, slots, start, end, single_day))
+
+    async def fetch_doctors(self, doctor_ids):
+        return [doctor async for doctor in DoctorProfile.objects.filter(id__in=doctor_ids)]
+
+    async def fetch_booked(self, doctor_ids, start, end):
+        return [row async for row in availability.booked_rows(doctor_ids, start, end)]
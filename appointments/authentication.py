@@ -0,0 +1,108 @@
+from django.contrib.auth.models import User
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+from . import revocation
+from .models import DoctorProfile, PatientProfile
+
+# Access tokens carry the claims role checks need (see CustomTokenObtainPairSerializer), so
+# JWTStatelessUserAuthentication can build request.user from the token alone. TOKEN_USER_CLASS
+# points it at ClaimsUser below.
+
+
+def profile_claims(user):
+    """The doctor_id / patient_id claims for a user, added to tokens at login."""
+    return {
+        'doctor_id': DoctorProfile.objects.filter(user=user).values_list('id', flat=True).first(),
+        'patient_id': PatientProfile.objects.filter(user=user).values_list('id', flat=True).first(),
+    }
+
+
+class ClaimsUser(TokenUser):
+    """
+    Request user backed by the signed token. id, username, is_staff, is_superuser, doctor_id and
+    patient_id come from the claims; any other User attribute (email, names, ...) loads the row
+    once, on first access.
+    """
+
+    def __str__(self):
+        return self.username
+
+    @cached_property
+    def user(self):
+        return User.objects.get(pk=self.id)
+
+    @cached_property
+    def doctor_id(self):
+        return self._profile_claim('doctor_id', DoctorProfile)
+
+    @cached_property
+    def patient_id(self):
+        return self._profile_claim('patient_id', PatientProfile)
+
+    def _profile_claim(self, claim, model):
+        if claim in self.token:
+            return self.token[claim]
+        # Tokens issued before the claim existed: one lookup
+        return model.objects.filter(user_id=self.id).values_list('id', flat=True).first()
+
+    def __getattr__(self, attr):
+        if attr.startswith('_') or attr == 'token':
+            raise AttributeError(attr)
+        if attr in self.token:
+            return self.token[attr]
+        return getattr(self.user, attr)
+
+
+def model_user(user):
+    """The User instance behind request.user, for code that saves it or needs a real model."""
+    return user.user if isinstance(user, ClaimsUser) else user
+
+
+def doctor_id_for(user):
+    if isinstance(user, ClaimsUser):
+        return user.doctor_id
+    return DoctorProfile.objects.filter(user=user).values_list('id', flat=True).first()
+
+
+def patient_id_for(user):
+    if isinstance(user, ClaimsUser):
+        return user.patient_id
+    return PatientProfile.objects.filter(user=user).values_list('id', flat=True).first()
+
+
+async def adoctor_id_for(user):
+    if isinstance(user, ClaimsUser) and 'doctor_id' in user.token:
+        return user.token['doctor_id']
+    return await DoctorProfile.objects.filter(user_id=user.pk).values_list('id', flat=True).afirst()
+
+
+async def apatient_id_for(user):
+    if isinstance(user, ClaimsUser) and 'patient_id' in user.token:
+        return user.token['patient_id']
+    return await PatientProfile.objects.filter(user_id=user.pk).values_list('id', flat=True).afirst()
+
+
+class RevocableRefreshToken(RefreshToken):
+    """
+    Refresh token checked against appointments.revocation. simplejwt's own blacklist app keeps an
+    outstanding row for every token ever issued; this stores only revoked ids until they expire.
+    """
+
+    def verify(self, *args, **kwargs):
+        # Expiry first: an expired token needs no revocation lookup
+        super().verify(*args, **kwargs)
+        if revocation.is_revoked(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError("Token is blacklisted")
+
+    def blacklist(self):
+        # Called by TokenRefreshSerializer when BLACKLIST_AFTER_ROTATION is set
+        revocation.revoke(self.payload[api_settings.JTI_CLAIM], datetime_from_epoch(self.payload['exp']))
+
+
+class RevocableTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = RevocableRefreshToken
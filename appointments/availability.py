@@ -0,0 +1,147 @@
+import datetime
+from collections import defaultdict
+from .models import Appointment
+from .schedules import schedule_for
+
+MAX_RANGE_DAYS = 92  # roughly a quarter; keeps a single response bounded
+
+
+def is_bookable(doctor, date, time):
+    """Whether `time` starts one of the doctor's slots on `date`; taken or not is the unique constraint's call."""
+    return schedule_for(doctor).day(date).is_slot(time)
+
+
+def date_range(start, end):
+    # Counted rather than stepping past `end`, which overflows when end is date.max
+    for offset in range((end - start).days + 1):
+        yield start + datetime.timedelta(days=offset)
+
+
+def parse_slot_query(params):
+    """
+    Validate ?doctor=<id>[,<id>...] with either ?date= or ?start=&end=.
+    Returns (doctor_ids, start, end, single_day) or raises ValueError with a client-facing message.
+    """
+    doctor_param = params.get('doctor')
+    date_str = params.get('date')
+    start_str = params.get('start', date_str)
+    end_str = params.get('end', start_str)
+    if not doctor_param or not start_str:
+        raise ValueError("Doctor and date are required")
+    try:
+        doctor_ids = [int(value) for value in doctor_param.split(',')]
+    except ValueError:
+        raise ValueError("Invalid doctor id")
+    try:
+        start = datetime.datetime.strptime(start_str, "%Y-%m-%d").date()
+        end = datetime.datetime.strptime(end_str, "%Y-%m-%d").date()
+    except ValueError:
+        raise ValueError("Invalid date format, use YYYY-MM-DD")
+    if end < start or (end - start).days >= MAX_RANGE_DAYS:
+        raise ValueError(f"Date range must span 1 to {MAX_RANGE_DAYS} days")
+    return doctor_ids, start, end, bool(date_str) and len(doctor_ids) == 1
+
+
+def booked_rows(doctor_ids, start, end):
+    """One range query over Appointment(doctor, date) for every requested doctor."""
+    return Appointment.objects.filter(
+        doctor__in=doctor_ids, date__range=(start, end)
+    ).values_list('doctor_id', 'date', 'time')
+
+
+def group_booked(rows):
+    booked = defaultdict(set)
+    for doctor_id, date, time in rows:
+        booked[(doctor_id, date)].add(time)
+    return booked
+
+
+def booked_slots(doctors, start, end):
+    """Booked times keyed by (doctor_id, date), loaded with one range query."""
+    return group_booked(booked_rows([doctor.id for doctor in doctors], start, end))
+
+
+def day_free(plan, taken):
+    return plan.free(plan.occupied(taken) if taken else 0)
+
+
+def free_slots(doctors, booked, start, end):
+    days = list(date_range(start, end))
+    result = {}
+    for doctor in doctors:
+        schedule = schedule_for(doctor)
+        result[doctor.id] = {day: day_free(schedule.day(day), booked.get((doctor.id, day))) for day in days}
+    return result
+
+
+def available_slots(doctors, start, end=None):
+    """
+    Free slots for one or more doctors over an inclusive date range.
+    Returns {doctor_id: {date: [time, ...]}}.
+    """
+    if not isinstance(doctors, (list, tuple)):
+        doctors = [doctors]
+    end = end or start
+    return free_slots(doctors, booked_slots(doctors, start, end), start, end)
+
+
+def earliest_free_slots(doctors, booked, start, end, after=None):
+    """
+    First free slot of each doctor between start and end, skipping slots before `after` (a naive datetime).
+    Returns {doctor_id: datetime or None}.
+    """
+    days = list(date_range(start, end))
+    result = {}
+    for doctor in doctors:
+        schedule = schedule_for(doctor)
+        result[doctor.id] = next(
+            (
+                moment
+                for day in days
+                for moment in (datetime.datetime.combine(day, slot) for slot in day_free(schedule.day(day), booked.get((doctor.id, day))))
+                if after is None or moment >= after
+            ),
+            None,
+        )
+    return result
+
+
+def slots_payload(doctors, slots, start, end, single_day):
+    """Response body for AvailableSlotsView; the single doctor/day shape predates date ranges."""
+    if single_day:
+        free = slots[doctors[0].id][start]
+        return {"doctor": doctors[0].id, "date": start.isoformat(), "available_slots": [t.strftime("%H:%M") for t in free]}
+    return {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "doctors": [
+            {
+                "doctor": doctor.id,
+                "slot_minutes": doctor.slot_minutes,
+                "available_slots": {
+                    day.isoformat(): [t.strftime("%H:%M") for t in times]
+                    for day, times in slots[doctor.id].items()
+                },
+            }
+            for doctor in doctors
+        ],
+    }
+
+
+def nearest_free_slots(doctor, date, time, limit=3, days=7):
+    """The `limit` free slots closest to the requested one, looking `days` either side (never in the past)."""
+    today = datetime.date.today()
+    # Clamped to the calendar's ends, where date ± days would overflow
+    start = max(date - datetime.timedelta(days=min(days, (date - datetime.date.min).days)), today)
+    end = max(date + datetime.timedelta(days=min(days, (datetime.date.max - date).days)), start)
+    requested = datetime.datetime.combine(date, time)
+    candidates = [
+        datetime.datetime.combine(day, slot)
+        for day, slots in available_slots(doctor, start, end)[doctor.id].items()
+        for slot in slots
+    ]
+    candidates.sort(key=lambda candidate: abs(candidate - requested))
+    return [
+        {'date': candidate.date().isoformat(), 'time': candidate.time().strftime("%H:%M")}
+        for candidate in candidates[:limit]
+    ]
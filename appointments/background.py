@@ -0,0 +1,39 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundTask:
+    """
+    Runs `function(*args)` off the request path on its own single worker thread, or inline when the
+    boolean `setting` is off (e.g. in tests). Failures are logged rather than raised. Tasks write
+    their results with update() rather than save(), so no post_save can schedule them again.
+    """
+
+    def __init__(self, name, function, setting):
+        self.name = name
+        self.function = function
+        self.setting = setting
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+
+    def __call__(self, *args):
+        if getattr(settings, self.setting, True):
+            self._executor.submit(self._run_in_thread, *args)
+        else:
+            self._run(*args)
+
+    def _run(self, *args):
+        try:
+            self.function(*args)
+        except Exception:
+            logger.exception("%s failed for %r", self.name, args)
+
+    def _run_in_thread(self, *args):
+        try:
+            self._run(*args)
+        finally:
+            # The worker thread has its own connection; don't leave it open
+            connection.close()
@@ -0,0 +1,164 @@
+import datetime
+import json
+import math
+import platform
+import subprocess
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from .models import Appointment, DoctorProfile, PatientProfile
+from .views import CustomTokenObtainPairSerializer
+
+PASSWORD = 'bench-password'
+SPECIALIZATIONS = ['General', 'Cardiology', 'Pediatrics', 'Dermatology', 'Neurology', 'Orthopedics']
+CITIES = ['Boston', 'Chicago', 'Denver', 'Seattle', 'Austin', 'Miami']
+FIRST_NAMES = ['Ana', 'Ben', 'Chen', 'Dara', 'Eli', 'Farah', 'Gus', 'Hana', 'Ivan', 'Jo', 'Kofi', 'Lena']
+LAST_NAMES = ['Adams', 'Baker', 'Costa', 'Diaz', 'Evans', 'Fischer', 'Garcia', 'Haddad', 'Ito', 'Jensen', 'Khan']
+QUALIFICATIONS = ['MBBS', 'MD', 'MBBS MD', 'DO', 'MD PhD']
+
+
+@contextmanager
+def benchmark_database():
+    """Run against a throwaway copy of the test database, never the development one."""
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def seed_hospital(doctors, patients, appointments, batch_size=2000):
+    """Bulk-create a synthetic hospital. Every user shares one password hash, so seeding skips PBKDF2."""
+    password = make_password(PASSWORD)
+    users = User.objects.bulk_create(
+        [
+            User(
+                username=f'doctor{i}', first_name=FIRST_NAMES[i % len(FIRST_NAMES)],
+                last_name=LAST_NAMES[i // len(FIRST_NAMES) % len(LAST_NAMES)], password=password, is_staff=True,
+            )
+            for i in range(doctors)
+        ]
+        + [User(username=f'patient{i}', first_name='Patient', last_name=str(i), password=password) for i in range(patients)],
+        batch_size=batch_size,
+    )
+    doctor_profiles = DoctorProfile.objects.bulk_create(
+        [
+            DoctorProfile(
+                user=user, working_start=datetime.time(9, 0), working_end=datetime.time(17, 0),
+                specialization=SPECIALIZATIONS[i % len(SPECIALIZATIONS)], city=CITIES[i % len(CITIES)],
+                consultation_fee=50 + (i % 10) * 10, experience_years=i % 30,
+                clinic_name=f'{CITIES[i % len(CITIES)]} {SPECIALIZATIONS[i % len(SPECIALIZATIONS)]} Clinic {i % 97}',
+                qualification=QUALIFICATIONS[i % len(QUALIFICATIONS)],
+            )
+            for i, user in enumerate(users[:doctors])
+        ],
+        batch_size=batch_size,
+    )
+    patient_profiles = PatientProfile.objects.bulk_create(
+        [PatientProfile(user=user, first_name='Patient', last_name=str(i)) for i, user in enumerate(users[doctors:])],
+        batch_size=batch_size,
+    )
+
+    if doctors and patients:
+        slots = [datetime.time(9, 0), datetime.time(11, 0), datetime.time(13, 0), datetime.time(15, 0)]
+        start = datetime.date.today() + datetime.timedelta(days=1)
+        rows = []
+        for n in range(appointments):
+            doctor = doctor_profiles[n % doctors]
+            index = n // doctors
+            rows.append(Appointment(
+                doctor=doctor,
+                patient=patient_profiles[n % patients],
+                date=start + datetime.timedelta(days=index // len(slots)),
+                time=slots[index % len(slots)],
+            ))
+            if len(rows) >= batch_size:
+                Appointment.objects.bulk_create(rows)
+                rows = []
+        Appointment.objects.bulk_create(rows)
+    return doctor_profiles, patient_profiles
+
+
+def access_token(user):
+    """An access token with the same claims as one issued by the login endpoint."""
+    return str(CustomTokenObtainPairSerializer.get_token(user).access_token)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def summarize(latencies, elapsed, queries=(), statuses=None):
+    """Latency percentiles in milliseconds, throughput and query counts for one scenario."""
+    ordered = sorted(latencies)
+    result = {
+        'requests': len(ordered),
+        'throughput_rps': round(len(ordered) / elapsed, 1) if elapsed else None,
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 2) if ordered else None,
+        'p50_ms': round(percentile(ordered, 50) * 1000, 2) if ordered else None,
+        'p95_ms': round(percentile(ordered, 95) * 1000, 2) if ordered else None,
+        'p99_ms': round(percentile(ordered, 99) * 1000, 2) if ordered else None,
+    }
+    queries = [count for count in queries if count is not None]
+    if queries:
+        result['queries_mean'] = round(sum(queries) / len(queries), 1)
+        result['queries_max'] = max(queries)
+    if statuses is not None:
+        result['statuses'] = {str(code): count for code, count in sorted(statuses.items())}
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(path, name, parameters, scenarios):
+    results = {
+        'benchmark': name,
+        'revision': git_revision(),
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'database': connection.vendor,
+        'parameters': parameters,
+        'scenarios': scenarios,
+    }
+    with open(path, 'w') as fileobj:
+        json.dump(results, fileobj, indent=2)
+    return results
+
+
+def compare(previous_path, scenarios):
+    """Lines describing the p95 change of each scenario against an earlier results file."""
+    with open(previous_path) as fileobj:
+        previous = json.load(fileobj)
+    lines = [f"Compared with {previous.get('revision') or previous_path}:"]
+    for name, result in scenarios.items():
+        before = previous.get('scenarios', {}).get(name, {}).get('p95_ms')
+        after = result.get('p95_ms')
+        if before and after:
+            lines.append(f"  {name}: p95 {before}ms -> {after}ms ({(after - before) / before:+.0%})")
+    return lines
+
+
+class Timer:
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.started
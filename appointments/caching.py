@@ -0,0 +1,126 @@
+import time
+from django.conf import settings
+from django.core.cache import caches
+
+CACHE_ALIAS = getattr(settings, 'APPOINTMENT_CACHE_ALIAS', 'default')
+TIMEOUT = getattr(settings, 'APPOINTMENT_CACHE_TIMEOUT', 300)
+
+GENERATION_KEY = 'timeline:generation'
+HITS_KEY = 'timeline:stats:hits'
+MISSES_KEY = 'timeline:stats:misses'
+
+# A timeline's key carries the generation (bumped when names in every timeline change) and its
+# principal's own version (bumped when their appointments change). Both are read before a miss is
+# built, so a timeline built from rows that changed meanwhile is stored under a key that is no
+# longer read, instead of being served until it expires. Counters are seeded from the clock so an
+# evicted one never comes back as an older value.
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def version_key(role, principal_id=None):
+    if role == 'staff':
+        return 'timeline:version:staff'
+    return f'timeline:version:{role}:{principal_id}'
+
+
+def timeline_key(role, principal_id, generation, version):
+    if role == 'staff':
+        return f'timeline:{generation}:{version}:staff'
+    return f'timeline:{generation}:{version}:{role}:{principal_id}'
+
+
+def _current_key(cache, role, principal_id):
+    versions = version_key(role, principal_id)
+    found = cache.get_many([GENERATION_KEY, versions])
+    generation = found.get(GENERATION_KEY) or cache.get_or_set(GENERATION_KEY, time.time_ns, None)
+    version = found.get(versions) or cache.get_or_set(versions, time.time_ns, None)
+    return timeline_key(role, principal_id, generation, version)
+
+
+async def _acurrent_key(cache, role, principal_id):
+    versions = version_key(role, principal_id)
+    found = await cache.aget_many([GENERATION_KEY, versions])
+    generation = found.get(GENERATION_KEY) or await cache.aget_or_set(GENERATION_KEY, time.time_ns, None)
+    version = found.get(versions) or await cache.aget_or_set(versions, time.time_ns, None)
+    return timeline_key(role, principal_id, generation, version)
+
+
+def _bump(cache, key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+def _count(cache, key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Counter missing or evicted
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+
+def get_timeline(role, principal_id, build):
+    """Serialized timeline for a role ('staff', 'doctor' or 'patient') and principal, built on a miss."""
+    cache = get_cache()
+    key = _current_key(cache, role, principal_id)
+    data = cache.get(key)
+    if data is not None:
+        _count(cache, HITS_KEY)
+        return data
+    _count(cache, MISSES_KEY)
+    data = build()
+    cache.set(key, data, TIMEOUT)
+    return data
+
+
+async def _acount(cache, key):
+    try:
+        await cache.aincr(key)
+    except ValueError:
+        if not await cache.aadd(key, 1, None):
+            await cache.aincr(key)
+
+
+async def aget_timeline(role, principal_id, build):
+    """Async get_timeline for the ASGI views; `build` is a coroutine function."""
+    cache = get_cache()
+    key = await _acurrent_key(cache, role, principal_id)
+    data = await cache.aget(key)
+    if data is not None:
+        await _acount(cache, HITS_KEY)
+        return data
+    await _acount(cache, MISSES_KEY)
+    data = await build()
+    await cache.aset(key, data, TIMEOUT)
+    return data
+
+
+def invalidate_timelines(doctor_ids=(), patient_ids=()):
+    cache = get_cache()
+    keys = [version_key('staff')]
+    keys += [version_key('doctor', doctor_id) for doctor_id in doctor_ids if doctor_id]
+    keys += [version_key('patient', patient_id) for patient_id in patient_ids if patient_id]
+    for key in keys:
+        _bump(cache, key)
+
+
+def invalidate_all_timelines():
+    _bump(get_cache(), GENERATION_KEY)
+
+
+def stats():
+    cache = get_cache()
+    counts = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits = counts.get(HITS_KEY, 0)
+    misses = counts.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / total, 4) if total else None,
+    }
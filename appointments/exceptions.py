@@ -0,0 +1,26 @@
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class SlotUnavailable(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'This time slot is already booked for the selected doctor.'
+    default_code = 'slot_unavailable'
+
+    def __init__(self, suggested_slots=()):
+        super().__init__({
+            'detail': self.default_detail,
+            'suggested_slots': list(suggested_slots),
+        })
+
+
+class SeriesUnavailable(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'Some dates in this series are already booked for the selected doctor.'
+    default_code = 'series_unavailable'
+
+    def __init__(self, conflicts=()):
+        super().__init__({
+            'detail': self.default_detail,
+            'conflicts': list(conflicts),
+        })
@@ -0,0 +1,58 @@
+import csv
+import json
+from .models import Appointment
+
+CHUNK_SIZE = 2000
+
+EXPORT_FIELDS = [
+    ('id', 'id'),
+    ('date', 'date'),
+    ('time', 'time'),
+    ('doctor', 'doctor_id'),
+    ('doctor_first_name', 'doctor__user__first_name'),
+    ('doctor_last_name', 'doctor__user__last_name'),
+    ('specialization', 'doctor__specialization'),
+    ('patient', 'patient_id'),
+    ('patient_first_name', 'patient__first_name'),
+    ('patient_last_name', 'patient__last_name'),
+]
+HEADER = [name for name, _ in EXPORT_FIELDS]
+
+
+class Echo:
+    """File-like object whose write() hands the line back instead of buffering it (for csv.writer)."""
+
+    def write(self, value):
+        return value
+
+
+def export_queryset(start=None, end=None, doctor_id=None):
+    qs = Appointment.objects.all()
+    if start:
+        qs = qs.filter(date__gte=start)
+    if end:
+        qs = qs.filter(date__lte=end)
+    if doctor_id:
+        qs = qs.filter(doctor_id=doctor_id)
+    # Ordered by the (date, time) index; values_list avoids building model instances
+    return qs.order_by('date', 'time', 'id').values_list(*[lookup for _, lookup in EXPORT_FIELDS])
+
+
+def rows(qs):
+    # Server-side cursor, fetched CHUNK_SIZE rows at a time, so memory stays flat
+    return qs.iterator(chunk_size=CHUNK_SIZE)
+
+
+def stream_csv(qs):
+    writer = csv.writer(Echo())
+    yield writer.writerow(HEADER)
+    for row in rows(qs):
+        yield writer.writerow([value.isoformat() if hasattr(value, 'isoformat') else value for value in row])
+
+
+def stream_ndjson(qs):
+    for row in rows(qs):
+        record = dict(zip(HEADER, row))
+        record['date'] = record['date'].isoformat()
+        record['time'] = record['time'].isoformat()
+        yield json.dumps(record) + '\n'
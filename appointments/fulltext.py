@@ -0,0 +1,315 @@
+import bisect
+import heapq
+import math
+import re
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+from operator import itemgetter
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models.expressions import RawSQL
+from .caching import get_cache
+from .models import DoctorProfile
+
+# Free-text doctor search ("pediatric cardio Boston"). Uses an SQLite FTS5 table when the database
+# has one (created by migration 0015) and an in-process inverted index otherwise.
+
+FTS_TABLE = 'appointments_doctor_fts'
+FIELDS = ('name', 'specialization', 'clinic_name', 'qualification', 'city')
+WEIGHTS = {'name': 10.0, 'specialization': 5.0, 'city': 3.0, 'clinic_name': 2.0, 'qualification': 1.0}
+MAX_RESULTS = getattr(settings, 'DOCTOR_SEARCH_MAX_RESULTS', 1000)
+MIN_PREFIX = 2  # shorter terms only match whole tokens
+BATCH_SIZE = 2000
+VERSION_KEY = 'doctor-search:version'  # bumped by every process that changes its inverted index
+
+_TOKEN = re.compile(r'\w+')
+
+
+def tokenize(text):
+    """Lowercase words with diacritics stripped, the same folding FTS5's unicode61 tokenizer applies."""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return _TOKEN.findall(text.lower())
+
+
+def documents(doctors):
+    """(doctor_id, {field: text}) for every doctor in the queryset, from one query."""
+    rows = doctors.values_list(
+        'id', 'user__first_name', 'user__last_name', 'specialization', 'clinic_name', 'qualification', 'city',
+    ).order_by('id')
+    for doctor_id, first, last, specialization, clinic_name, qualification, city in rows.iterator(chunk_size=BATCH_SIZE):
+        yield doctor_id, {
+            'name': f'{first} {last}',
+            'specialization': specialization,
+            'clinic_name': clinic_name,
+            'qualification': qualification,
+            'city': city,
+        }
+
+
+_fts5_tables = {}
+
+
+def fts5_available():
+    """Whether this database has the FTS5 table, looked up once per database."""
+    if connection.vendor != 'sqlite':
+        return False
+    name = connection.settings_dict['NAME']
+    if name not in _fts5_tables:
+        _fts5_tables[name] = FTS_TABLE in connection.introspection.table_names()
+    return _fts5_tables[name]
+
+
+class Fts5Index:
+    """Rows of the FTS5 table are keyed by rowid = DoctorProfile.id and ranked with bm25()."""
+
+    def search(self, text, restrict=None, limit=MAX_RESULTS):
+        phrases = self._phrases(text)
+        if not phrases:
+            return []
+        results = self._query(' AND '.join(phrases), restrict, limit)
+        if not results and len(phrases) > 1:
+            results = self._query(' OR '.join(phrases), restrict, limit)
+        return results
+
+    def filter(self, doctors, text):
+        """The queryset narrowed to every match, through a subquery on the FTS5 table rather than an id list."""
+        phrases = self._phrases(text)
+        if not phrases:
+            return doctors.none()
+        match = ' AND '.join(phrases)
+        if len(phrases) > 1 and not self._query(match, doctors if doctors.query.has_filters() else None, 1):
+            match = ' OR '.join(phrases)
+        return doctors.filter(id__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match]))
+
+    def _phrases(self, text):
+        # Terms are already \w-only, so quoting cannot break out of the phrase
+        return [f'"{term}"*' if len(term) >= MIN_PREFIX else f'"{term}"' for term in tokenize(text)]
+
+    def _query(self, match, restrict, limit):
+        weights = ', '.join(str(WEIGHTS[field]) for field in FIELDS)
+        sql = f'SELECT rowid, bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s'
+        params = [match]
+        if restrict is not None:
+            subquery, subparams = restrict.values('id').query.sql_with_params()
+            sql += f' AND rowid IN ({subquery})'
+            params += list(subparams)
+        sql += ' ORDER BY 2, rowid LIMIT %s'
+        params.append(limit)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            # bm25 is lower-is-better; flip it so every backend returns higher-is-better scores
+            return [(doctor_id, -score) for doctor_id, score in cursor.fetchall()]
+
+    def update(self, doctor_ids):
+        with transaction.atomic():
+            self.remove(doctor_ids)
+            self._insert(documents(DoctorProfile.objects.filter(id__in=doctor_ids)))
+
+    def remove(self, doctor_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(doctor_id,) for doctor_id in doctor_ids])
+
+    def rebuild(self):
+        # One transaction, not a commit per row
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            self._insert(documents(DoctorProfile.objects.all()))
+
+    def _insert(self, docs):
+        columns = ', '.join(('rowid',) + FIELDS)
+        placeholders = ', '.join(['%s'] * (len(FIELDS) + 1))
+        sql = f'INSERT INTO {FTS_TABLE} ({columns}) VALUES ({placeholders})'
+        batch = []
+        with connection.cursor() as cursor:
+            for doctor_id, fields in docs:
+                batch.append([doctor_id] + [fields[field] for field in FIELDS])
+                if len(batch) >= BATCH_SIZE:
+                    cursor.executemany(sql, batch)
+                    batch = []
+            if batch:
+                cursor.executemany(sql, batch)
+
+
+class InvertedIndex:
+    """
+    Pure-Python fallback: token -> {doctor_id: field-weighted term frequency}, with a sorted
+    vocabulary for prefix matches. Each process holds its own copy, built from the database on first
+    search and kept current by signals. A change another process made (VERSION_KEY moved past the
+    version this copy reflects) rebuilds it before the next search.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.built = False
+        self.version = None  # of VERSION_KEY, when this copy is known to reflect every change up to it
+        self.postings = defaultdict(dict)
+        self.doc_tokens = {}
+        self.vocabulary = []
+
+    def search(self, text, restrict=None, limit=MAX_RESULTS):
+        """Best matches first; every match when limit is None."""
+        terms = tokenize(text)
+        if not terms:
+            return []
+        allowed = set(restrict.values_list('id', flat=True)) if restrict is not None else None
+        with self.lock:
+            self._ensure_current()
+            per_term = [self._term_scores(term) for term in terms]
+        # Every term must match; when nothing does, any term may (as the FTS5 backend does)
+        scores = self._combine(per_term, require_all=True)
+        if not scores and len(per_term) > 1:
+            scores = self._combine(per_term, require_all=False)
+        if allowed is not None:
+            scores = {doctor_id: score for doctor_id, score in scores.items() if doctor_id in allowed}
+        top = list(scores.items()) if limit is None else heapq.nlargest(limit, scores.items(), key=itemgetter(1))
+        top.sort(key=lambda item: (-item[1], item[0]))
+        return top
+
+    def filter(self, doctors, text):
+        """The queryset narrowed to every match."""
+        matches = self.search(text, restrict=doctors if doctors.query.has_filters() else None, limit=None)
+        return doctors.filter(id__in=[doctor_id for doctor_id, _ in matches])
+
+    def _term_scores(self, term):
+        """{doctor_id: score} for one query term, through each doctor's best matching token."""
+        total = len(self.doc_tokens) or 1
+        best = {}
+        for token in self._expand(term):
+            postings = self.postings[token]
+            idf = math.log(1 + total / len(postings))
+            if not best:
+                best = {doctor_id: weight * idf for doctor_id, weight in postings.items()}
+                continue
+            for doctor_id, weight in postings.items():
+                score = weight * idf
+                if score > best.get(doctor_id, 0.0):
+                    best[doctor_id] = score
+        return best
+
+    def _combine(self, per_term, require_all):
+        if require_all:
+            if not all(per_term):
+                return {}
+            # Intersect starting from the rarest term so the candidate set stays small
+            ordered = sorted(per_term, key=len)
+            scores = dict(ordered[0])
+            for term_scores in ordered[1:]:
+                scores = {doctor_id: score + term_scores[doctor_id] for doctor_id, score in scores.items() if doctor_id in term_scores}
+            return scores
+        scores = defaultdict(float)
+        for term_scores in per_term:
+            for doctor_id, score in term_scores.items():
+                scores[doctor_id] += score
+        return scores
+
+    def update(self, doctor_ids):
+        with self.lock:
+            if self.built:  # otherwise the first search builds everything
+                self._remove(doctor_ids)
+                for doctor_id, fields in documents(DoctorProfile.objects.filter(id__in=doctor_ids)):
+                    self._add(doctor_id, fields)
+            self._changed()
+
+    def remove(self, doctor_ids):
+        with self.lock:
+            if self.built:
+                self._remove(doctor_ids)
+            self._changed()
+
+    def _changed(self):
+        # Tell the other processes. This copy stays current only if nobody else changed theirs since
+        cache = get_cache()
+        try:
+            version = cache.incr(VERSION_KEY)
+        except ValueError:
+            cache.set(VERSION_KEY, time.time_ns(), None)
+            version = None
+        self.version = version if self.version is not None and version == self.version + 1 else None
+
+    def _shared_version(self):
+        return get_cache().get_or_set(VERSION_KEY, time.time_ns, None)
+
+    def rebuild(self):
+        with self.lock:
+            # Read before the rows, so a change made during the build triggers another
+            version = self._shared_version()
+            self.postings.clear()
+            self.doc_tokens.clear()
+            self.vocabulary = []
+            for doctor_id, fields in documents(DoctorProfile.objects.all()):
+                self._add(doctor_id, fields, sort=False)
+            self.vocabulary = sorted(self.postings)
+            self.built = True
+            self.version = version
+
+    def _ensure_current(self):
+        if not self.built or self.version != self._shared_version():
+            self.rebuild()
+
+    def _expand(self, term):
+        if len(term) < MIN_PREFIX:
+            return [term] if term in self.postings else []
+        start = bisect.bisect_left(self.vocabulary, term)
+        end = bisect.bisect_left(self.vocabulary, term + '\uffff')
+        return self.vocabulary[start:end]
+
+    def _add(self, doctor_id, fields, sort=True):
+        weights = defaultdict(float)
+        for field, text in fields.items():
+            for token in tokenize(text):
+                weights[token] += WEIGHTS[field]
+        for token, weight in weights.items():
+            if sort and token not in self.postings:
+                bisect.insort(self.vocabulary, token)
+            self.postings[token][doctor_id] = weight
+        self.doc_tokens[doctor_id] = set(weights)
+
+    def _remove(self, doctor_ids):
+        for doctor_id in doctor_ids:
+            for token in self.doc_tokens.pop(doctor_id, ()):
+                postings = self.postings[token]
+                postings.pop(doctor_id, None)
+                if not postings:
+                    del self.postings[token]
+                    self.vocabulary.pop(bisect.bisect_left(self.vocabulary, token))
+
+
+_python_index = InvertedIndex()
+_fts5_index = Fts5Index()
+
+
+def get_index():
+    """DOCTOR_SEARCH_BACKEND picks 'fts5' or 'python'; the default 'auto' prefers FTS5 when its table exists."""
+    backend = getattr(settings, 'DOCTOR_SEARCH_BACKEND', 'auto')
+    if backend == 'fts5' or (backend == 'auto' and fts5_available()):
+        return _fts5_index
+    return _python_index
+
+
+def search(text, restrict=None, limit=MAX_RESULTS):
+    """Best matches first as [(doctor_id, score), ...], optionally only among a DoctorProfile queryset."""
+    return get_index().search(text, restrict=restrict, limit=limit)
+
+
+def filter(doctors, text):
+    """A DoctorProfile queryset narrowed to every full-text match, for orderings other than relevance."""
+    return get_index().filter(doctors, text)
+
+
+def reindex(doctor_ids):
+    doctor_ids = list(doctor_ids)
+    index = get_index()
+    # Chunked so bulk imports stay under the database's bound-parameter limit
+    for start in range(0, len(doctor_ids), BATCH_SIZE):
+        index.update(doctor_ids[start:start + BATCH_SIZE])
+
+
+def unindex(doctor_ids):
+    get_index().remove(list(doctor_ids))
+
+
+def rebuild():
+    get_index().rebuild()
@@ -0,0 +1,231 @@
+import hashlib
+import json
+import math
+import threading
+import time
+import urllib.parse
+import urllib.request
+from django.conf import settings
+from django.db.models import Q
+from django.utils.module_loading import import_string
+from . import conditional
+from .background import BackgroundTask
+from .models import DoctorProfile, GeocodedAddress
+
+# Clinic coordinates are geocoded once per distinct address (GeocodedAddress is the cache) and
+# stored on DoctorProfile together with a grid cell: the world cut into GRID_DEGREES squares,
+# numbered row by row. A radius query turns its bounding box into one contiguous cell range per
+# row, so it reads only nearby clinics from the geo_cell index instead of computing every distance.
+
+GRID_DEGREES = 0.05  # ~5.5km of latitude
+ROWS = round(180 / GRID_DEGREES)
+COLUMNS = round(360 / GRID_DEGREES)
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+MAX_RADIUS_KM = getattr(settings, 'NEARBY_MAX_RADIUS_KM', 250)
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+DEFAULT_GEOCODER = {'BACKEND': 'appointments.geocoding.NominatimGeocoder', 'OPTIONS': {}}
+
+_geocoders = {}
+
+
+class NominatimGeocoder:
+    """OpenStreetMap Nominatim. Its usage policy asks for an identifying User-Agent and at most one request a second."""
+
+    def __init__(self, url='https://nominatim.openstreetmap.org/search', user_agent='appt-booking-app', timeout=10, min_interval=1.0):
+        self.url = url
+        self.user_agent = user_agent
+        self.timeout = timeout
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._last_request = 0.0
+
+    def geocode(self, address):
+        query = urllib.parse.urlencode({'q': address, 'format': 'json', 'limit': 1})
+        request = urllib.request.Request(f'{self.url}?{query}', headers={'User-Agent': self.user_agent})
+        with self._lock:
+            time.sleep(max(0.0, self._last_request + self.min_interval - time.monotonic()))
+            try:
+                with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                    results = json.load(response)
+            finally:
+                self._last_request = time.monotonic()
+        if not results:
+            return None
+        return float(results[0]['lat']), float(results[0]['lon'])
+
+
+class LocalGeocoder:
+    """
+    Offline stand-in for tests, benchmarks and development: addresses in `places` resolve to the
+    given coordinates, any other address to a stable pseudo-random point inside `bounds`.
+    """
+
+    def __init__(self, places=None, bounds=(24.5, -124.8, 49.4, -66.9)):  # contiguous United States
+        self.places = {normalize(address): tuple(point) for address, point in (places or {}).items()}
+        self.bounds = bounds
+
+    def geocode(self, address):
+        key = normalize(address)
+        if key in self.places:
+            return self.places[key]
+        digest = hashlib.sha256(key.encode()).digest()
+        south, west, north, east = self.bounds
+        lat = south + (north - south) * int.from_bytes(digest[:8], 'big') / 2 ** 64
+        lng = west + (east - west) * int.from_bytes(digest[8:16], 'big') / 2 ** 64
+        return lat, lng
+
+
+def get_geocoder():
+    """The geocoder configured by GEOCODER = {'BACKEND': <dotted path>, 'OPTIONS': {...}}."""
+    config = getattr(settings, 'GEOCODER', DEFAULT_GEOCODER)
+    key = json.dumps(config, sort_keys=True, default=str)
+    if key not in _geocoders:
+        _geocoders[key] = import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+    return _geocoders[key]
+
+
+def normalize(address):
+    return ' '.join(address.lower().replace(',', ' ').split())
+
+
+def full_address(doctor):
+    return ', '.join(part for part in (doctor.clinic_address, doctor.city, doctor.state, doctor.zipcode) if part)
+
+
+def locate(address):
+    """(latitude, longitude) of an address or None, asking the geocoder only for addresses never seen before."""
+    key = normalize(address)
+    cached = GeocodedAddress.objects.filter(address=key).values_list('latitude', 'longitude').first()
+    if cached is None:
+        # Geocoder errors propagate and aren't cached; "not found" is
+        point = get_geocoder().geocode(address)
+        cached = point or (None, None)
+        GeocodedAddress.objects.update_or_create(address=key, defaults={'latitude': cached[0], 'longitude': cached[1]})
+    return None if cached[0] is None else cached
+
+
+def cell(lat, lng):
+    row = min(int((lat + 90) // GRID_DEGREES), ROWS - 1)
+    column = int((lng + 180) // GRID_DEGREES) % COLUMNS
+    return row * COLUMNS + column
+
+
+def is_stale(doctor):
+    return full_address(doctor) != doctor.geocoded_address
+
+
+def update_location(doctor, force=False):
+    """Geocode the doctor's clinic if its address changed. Returns True when the row was updated."""
+    if not force and not is_stale(doctor):
+        return False
+    address = full_address(doctor)
+    point = locate(address) if address else None
+    lat, lng = point or (None, None)
+    geo_cell = cell(lat, lng) if point else None
+    DoctorProfile.objects.filter(pk=doctor.pk).update(latitude=lat, longitude=lng, geo_cell=geo_cell, geocoded_address=address)
+    doctor.latitude, doctor.longitude, doctor.geo_cell, doctor.geocoded_address = lat, lng, geo_cell, address
+    conditional.bump_versions('doctors')
+    return True
+
+
+def _geocode(pk):
+    doctor = DoctorProfile.objects.filter(pk=pk).first()
+    if doctor is not None:
+        update_location(doctor)
+
+
+_geocode_later = BackgroundTask('geocoding', _geocode, 'GEOCODER_ASYNC')
+
+
+def schedule(doctor):
+    """Geocode off the request path (inline when GEOCODER_ASYNC is off, e.g. in tests)."""
+    _geocode_later(doctor.pk)
+
+
+def distance_km(lat1, lng1, lat2, lng2):
+    """Great-circle (haversine) distance."""
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def cell_ranges(lat, lng, radius_km):
+    """Inclusive (first, last) geo_cell ranges covering every point within radius_km, merged where contiguous."""
+    lat_span = radius_km / KM_PER_DEGREE
+    south, north = max(lat - lat_span, -90.0), min(lat + lat_span, 90.0)
+    # Longitude degrees shrink towards the poles; size the span for the band's most poleward edge
+    widest = max(abs(south), abs(north))
+    lng_span = 180.0 if widest >= 90.0 else radius_km / (KM_PER_DEGREE * math.cos(math.radians(widest)))
+    ranges = []
+    for row in range(cell(south, 0) // COLUMNS, cell(north, 0) // COLUMNS + 1):
+        base = row * COLUMNS
+        first = int((lng - lng_span + 180) // GRID_DEGREES)
+        last = int((lng + lng_span + 180) // GRID_DEGREES)
+        if last - first + 1 >= COLUMNS:
+            spans = [(0, COLUMNS - 1)]
+        elif first < 0 or last >= COLUMNS:
+            # Crosses the antimeridian
+            spans = [(0, last % COLUMNS), (first % COLUMNS, COLUMNS - 1)]
+        else:
+            spans = [(first, last)]
+        for start, end in spans:
+            if ranges and ranges[-1][1] + 1 == base + start:
+                ranges[-1] = (ranges[-1][0], base + end)
+            else:
+                ranges.append((base + start, base + end))
+    return ranges
+
+
+def within(doctors, lat, lng, radius_km):
+    """Sorted (distance km, doctor id) of the doctors in the queryset within radius_km of the point."""
+    cells = Q()
+    for first, last in cell_ranges(lat, lng, radius_km):
+        cells |= Q(geo_cell__range=(first, last))
+    rows = doctors.filter(cells).values_list('id', 'latitude', 'longitude')
+    matches = []
+    for doctor_id, doctor_lat, doctor_lng in rows:
+        distance = distance_km(lat, lng, doctor_lat, doctor_lng)
+        if distance <= radius_km:
+            matches.append((distance, doctor_id))
+    matches.sort()
+    return matches
+
+
+def nearest(doctors, lat, lng, limit=DEFAULT_LIMIT, max_radius_km=MAX_RADIUS_KM):
+    """The `limit` nearest doctors within max_radius_km, searching outwards from one grid cell."""
+    radius = min(GRID_DEGREES * KM_PER_DEGREE, max_radius_km)
+    while True:
+        matches = within(doctors, lat, lng, radius)
+        # Everything within `radius` was read, so the first `limit` are the nearest overall
+        if len(matches) >= limit or radius >= max_radius_km:
+            return matches[:limit]
+        radius = min(radius * 2, max_radius_km)
+
+
+def parse_nearby_query(params):
+    """
+    Validate ?lat=&lng=[&radius=<km>][&limit=].
+    Returns (lat, lng, radius_km or None, limit) or raises ValueError with a client-facing message.
+    """
+    try:
+        lat = float(params['lat'])
+        lng = float(params['lng'])
+    except KeyError:
+        raise ValueError("lat and lng are required")
+    except ValueError:
+        raise ValueError("Invalid coordinates")
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError("Invalid coordinates")
+    try:
+        radius = float(params['radius']) if params.get('radius') else None
+        limit = int(params.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise ValueError("Invalid number")
+    if radius is not None and not 0 < radius <= MAX_RADIUS_KM:
+        raise ValueError(f"radius must be more than 0 and at most {MAX_RADIUS_KM} km")
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ValueError(f"limit must be 1 to {MAX_LIMIT}")
+    return lat, lng, radius, limit
@@ -0,0 +1,232 @@
+import datetime
+from django.conf import settings
+from django.core import signing
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare, get_random_string
+from . import pruning
+from .models import Appointment, DeletedAppointment, DoctorProfile
+from .schedules import clock, schedule_for
+
+# Per-doctor iCalendar (RFC 5545) feeds, streamed row by row. A sync token is a timestamp: a client
+# that sends the last one back gets only the appointments changed since, plus cancellations for the
+# ones deleted, instead of the whole calendar.
+
+PRODID = '-//Appt Booking App//Doctor calendar//EN'
+UID_DOMAIN = 'appt-booking-app'
+CHUNK_SIZE = 2000
+HISTORY = getattr(settings, 'CALENDAR_HISTORY', datetime.timedelta(days=90))  # past appointments in a full feed
+SYNC_WINDOW = getattr(settings, 'CALENDAR_SYNC_WINDOW', datetime.timedelta(days=30))  # older sync tokens get a full feed
+# Issued tokens lag the clock, so a row saved during a request but committed after it is re-sent, never missed
+SYNC_OVERLAP = datetime.timedelta(seconds=60)
+PRUNE_KEY = 'calendar:pruned'
+PRUNE_INTERVAL = 3600
+PRUNE_BATCH_SIZE = 5000
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+MICROSECOND = datetime.timedelta(microseconds=1)
+
+
+def feed_token(doctor):
+    """Secret for the feed URL, for calendar apps that can't send a bearer token."""
+    # Links issued before nonces existed stay valid until the doctor first resets theirs
+    value = f'{doctor.id}:{doctor.calendar_nonce}' if doctor.calendar_nonce else str(doctor.id)
+    return signing.Signer(salt='appointments.ics').signature(value)
+
+
+def check_feed_token(doctor, token):
+    return doctor is not None and bool(token) and constant_time_compare(token, feed_token(doctor))
+
+
+def reset_feed_token(doctor):
+    """Revoke every feed URL handed out so far; returns the new token."""
+    doctor.calendar_nonce = get_random_string(16)
+    # update(): the feed's content didn't change, so neither should updated_at and the sync tokens
+    DoctorProfile.objects.filter(pk=doctor.pk).update(calendar_nonce=doctor.calendar_nonce)
+    return feed_token(doctor)
+
+
+def encode_sync_token(moment):
+    return str((moment - EPOCH) // MICROSECOND)
+
+
+def decode_sync_token(token):
+    try:
+        return EPOCH + int(token) * MICROSECOND
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError("Invalid sync token")
+
+
+def resolve_since(doctor, token, now=None):
+    """
+    The moment a delta feed starts from, or None when the client needs the full feed: no or a
+    garbled token, one older than the deletions still kept, or a profile or schedule change since
+    (hours, slot lengths and address are in every event).
+    """
+    if not token:
+        return None
+    try:
+        since = decode_sync_token(token)
+    except ValueError:
+        return None
+    if since < (now or timezone.now()) - SYNC_WINDOW or doctor.updated_at > since:
+        return None
+    return since
+
+
+def last_modified(doctor):
+    """Latest change to anything in the doctor's feed; both lookups are index range ends."""
+    changed = Appointment.objects.filter(doctor_id=doctor.id).aggregate(latest=Max('updated_at'))['latest']
+    deleted = DeletedAppointment.objects.filter(doctor_id=doctor.id).aggregate(latest=Max('deleted_at'))['latest']
+    return max(moment for moment in (doctor.updated_at, changed, deleted) if moment)
+
+
+def escape(text):
+    return text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+
+def fold(line):
+    """Content line split into 75-octet pieces, continuation lines starting with a space."""
+    encoded = line.encode()
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    pieces = []
+    while encoded:
+        size = 75 if not pieces else 74
+        # Never split a multi-byte character
+        while size < len(encoded) and (encoded[size] & 0xC0) == 0x80:
+            size -= 1
+        pieces.append(encoded[:size].decode())
+        encoded = encoded[size:]
+    return '\r\n '.join(pieces) + '\r\n'
+
+
+def utc_stamp(moment):
+    return moment.astimezone(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def local_moment(date, time):
+    # Appointment dates and times are wall-clock times in TIME_ZONE
+    return datetime.datetime.combine(date, time, tzinfo=timezone.get_default_timezone())
+
+
+def component(name, properties):
+    return ''.join(fold(line) for line in [f'BEGIN:{name}', *properties, f'END:{name}'])
+
+
+WEEKDAYS = ['MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU']
+FIRST_MONDAY = datetime.date(2000, 1, 3)
+
+
+def working_hours(doctor):
+    # VAVAILABILITY (RFC 7953): clients that don't know it skip it. Exceptions and holidays aren't in it
+    tzid = timezone.get_default_timezone_name()
+    stamp = utc_stamp(doctor.updated_at)
+    schedule = schedule_for(doctor)
+    if schedule.weekly:
+        hours = [
+            (
+                f'{WEEKDAYS[weekday]}-{index}', FIRST_MONDAY + datetime.timedelta(days=weekday),
+                clock(start), clock(end), f'FREQ=WEEKLY;BYDAY={WEEKDAYS[weekday]}',
+            )
+            for weekday, plan in enumerate(schedule.week)
+            for index, (start, end, _) in enumerate(plan.blocks)
+        ]
+    else:
+        hours = [('daily', datetime.date(2000, 1, 1), doctor.working_start, doctor.working_end, 'FREQ=DAILY')]
+    available = [
+        component('AVAILABLE', [
+            f'UID:working-hours-{doctor.id}-{name}@{UID_DOMAIN}',
+            f'DTSTAMP:{stamp}',
+            f'DTSTART;TZID={tzid}:{day:%Y%m%d}T{start:%H%M%S}',
+            f'DTEND;TZID={tzid}:{day:%Y%m%d}T{end:%H%M%S}',
+            f'RRULE:{rule}',
+            'SUMMARY:Working hours',
+        ])
+        for name, day, start, end, rule in hours
+    ]
+    return ''.join([
+        fold('BEGIN:VAVAILABILITY'),
+        fold(f'UID:working-hours-{doctor.id}@{UID_DOMAIN}'),
+        fold(f'DTSTAMP:{stamp}'),
+        *available,
+        fold('END:VAVAILABILITY'),
+    ])
+
+
+def event(doctor, appointment_id, date, time, updated_at, first_name, last_name):
+    start = local_moment(date, time)
+    length = schedule_for(doctor).day(date).slot_minutes(time) or doctor.slot_minutes
+    stamp = utc_stamp(updated_at)
+    properties = [
+        f'UID:appointment-{appointment_id}@{UID_DOMAIN}',
+        f'DTSTAMP:{stamp}',
+        f'LAST-MODIFIED:{stamp}',
+        f'DTSTART:{utc_stamp(start)}',
+        f'DTEND:{utc_stamp(start + datetime.timedelta(minutes=length))}',
+        f'SUMMARY:{escape(f"Appointment: {first_name} {last_name}")}',
+        'STATUS:CONFIRMED',
+    ]
+    if doctor.clinic_address:
+        properties.append(f'LOCATION:{escape(doctor.clinic_address)}')
+    return component('VEVENT', properties)
+
+
+def cancellation(appointment_id, date, time, deleted_at):
+    return component('VEVENT', [
+        f'UID:appointment-{appointment_id}@{UID_DOMAIN}',
+        f'DTSTAMP:{utc_stamp(deleted_at)}',
+        f'DTSTART:{utc_stamp(local_moment(date, time))}',
+        'SUMMARY:Cancelled appointment',
+        'STATUS:CANCELLED',
+    ])
+
+
+def stream_calendar(doctor, since=None):
+    """
+    The feed as an iterator of text chunks, one per component, read through a chunked cursor so
+    memory stays flat however long the calendar is. With `since`, only changes after it.
+    """
+    yield ''.join(fold(line) for line in [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        f'PRODID:{PRODID}',
+        'CALSCALE:GREGORIAN',
+        f'X-WR-CALNAME:{escape(f"Dr. {doctor.user.get_full_name()}")}',
+        f'X-WR-TIMEZONE:{timezone.get_default_timezone_name()}',
+        'REFRESH-INTERVAL;VALUE=DURATION:PT15M',
+        'X-PUBLISHED-TTL:PT15M',
+    ])
+    appointments = Appointment.objects.filter(doctor_id=doctor.id)
+    if since is None:
+        yield working_hours(doctor)
+        appointments = appointments.filter(date__gte=timezone.localdate() - HISTORY)
+    else:
+        appointments = appointments.filter(updated_at__gt=since)
+    rows = appointments.order_by('date', 'time').values_list(
+        'id', 'date', 'time', 'updated_at', 'patient__first_name', 'patient__last_name',
+    )
+    sent = set()
+    for row in rows.iterator(chunk_size=CHUNK_SIZE):
+        if since is not None:
+            sent.add(row[0])
+        yield event(doctor, *row)
+    if since is not None:
+        deleted = DeletedAppointment.objects.filter(doctor_id=doctor.id, deleted_at__gt=since)
+        rows = deleted.order_by('deleted_at').values_list('appointment_id', 'date', 'time', 'deleted_at')
+        for appointment_id, date, time, deleted_at in rows.iterator(chunk_size=CHUNK_SIZE):
+            # Moved away and back again: the event above is current
+            if appointment_id not in sent:
+                yield cancellation(appointment_id, date, time, deleted_at)
+    yield fold('END:VCALENDAR')
+
+
+def prune(now=None, batch_size=PRUNE_BATCH_SIZE, max_batches=None):
+    """Delete deletion records older than SYNC_WINDOW, in batches. Returns the count."""
+    cutoff = (now or timezone.now()) - SYNC_WINDOW
+    return pruning.prune_before(DeletedAppointment.objects.all(), 'deleted_at', cutoff, batch_size, max_batches)
+
+
+def maybe_prune():
+    pruning.maybe_prune(PRUNE_KEY, PRUNE_INTERVAL, prune)
+
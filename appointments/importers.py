@@ -0,0 +1,197 @@
+import csv
+import io
+import json
+from concurrent.futures import ProcessPoolExecutor
+import django
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from . import conditional, fulltext, schedules
+from .models import DoctorProfile, PatientProfile
+
+BATCH_SIZE = 500
+# Rows the HTTP endpoint takes; it hashes passwords inline in the request, so bigger files go
+# through the import_users command and its process pool
+MAX_UPLOAD_ROWS = getattr(settings, 'IMPORT_MAX_UPLOAD_ROWS', 100)
+
+USER_FIELDS = ['username', 'email', 'password', 'first_name', 'last_name']
+PROFILE_FIELDS = {
+    'doctors': [
+        'clinic_name', 'clinic_address', 'city', 'state', 'zipcode', 'specialization', 'gender', 'phone',
+        'working_start', 'working_end', 'slot_minutes', 'qualification', 'experience_years', 'consultation_fee',
+    ],
+    'patients': [
+        'first_name', 'last_name', 'phone', 'gender', 'dob', 'blood_group', 'chronic_conditions',
+        'allergies', 'current_medications', 'emergency_contact',
+    ],
+}
+PROFILE_MODELS = {'doctors': DoctorProfile, 'patients': PatientProfile}
+
+
+class BadRow:
+    """A line read_rows could not turn into a row; import_rows reports it like any other invalid row."""
+
+    def __init__(self, message):
+        self.message = message
+
+
+def read_rows(fileobj, file_type):
+    """Yield dict rows (or BadRow for unreadable JSONL lines) from a CSV or JSONL file opened in text or binary mode."""
+    if file_type == 'csv':
+        if isinstance(fileobj.read(0), bytes):
+            fileobj = io.TextIOWrapper(fileobj, encoding='utf-8')
+        yield from csv.DictReader(fileobj)
+    elif file_type == 'jsonl':
+        for line in fileobj:
+            try:
+                line = line.decode('utf-8') if isinstance(line, bytes) else line
+                row = json.loads(line) if line.strip() else None
+            except ValueError as exc:  # UnicodeDecodeError and JSONDecodeError alike
+                yield BadRow(f"Invalid JSON line: {exc}")
+                continue
+            if row is None:
+                continue
+            yield row if isinstance(row, dict) else BadRow("Each line must be a JSON object.")
+    else:
+        raise ValueError("file type must be csv or jsonl")
+
+
+def _init_worker():
+    # Spawned (non-forked) workers need the app registry before hashing
+    if not apps.ready:
+        django.setup()
+
+
+def hash_passwords(passwords, pool):
+    if pool is None:
+        return [make_password(password) for password in passwords]
+    return list(pool.map(make_password, passwords, chunksize=max(1, len(passwords) // 32)))
+
+
+def build_row(kind, row):
+    """Validate one input row. Returns unsaved (user, profile, raw_password) or raises ValidationError."""
+    if isinstance(row, BadRow):
+        raise ValidationError({'non_field_errors': [row.message]})
+    row = {key: value for key, value in row.items() if value not in (None, '')}
+    errors = {}
+    if not row.get('password'):
+        errors['password'] = ['This field is required.']
+    user = User(**{field: row.get(field, '') for field in USER_FIELDS if field != 'password'})
+    user.is_staff = kind == 'doctors'
+    try:
+        user.full_clean(exclude=['password'], validate_unique=False)
+    except ValidationError as exc:
+        errors.update(exc.message_dict)
+
+    profile = PROFILE_MODELS[kind](**{field: row[field] for field in PROFILE_FIELDS[kind] if field in row})
+    try:
+        profile.full_clean(exclude=['user'], validate_unique=False)
+    except ValidationError as exc:
+        errors.update(exc.message_dict)
+    else:
+        if kind == 'doctors':
+            try:
+                schedules.check_block(profile.working_start, profile.working_end, profile.slot_minutes)
+            except ValueError as exc:
+                errors['working_hours'] = [str(exc)]
+
+    if errors:
+        raise ValidationError(errors)
+    return user, profile, row['password']
+
+
+def import_rows(kind, rows, batch_size=BATCH_SIZE, workers=None):
+    """
+    Create users and doctor/patient profiles with bulk_create, one transaction per batch.
+    Returns {"created": <count>, "errors": [{"row": <1-based row>, "errors": {...}}]}.
+    """
+    if kind not in PROFILE_MODELS:
+        raise ValueError("kind must be doctors or patients")
+    report = {'created': 0, 'errors': []}
+    created = []
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) if workers != 0 else None
+    try:
+        batch = []
+        for number, row in enumerate(rows, start=1):
+            batch.append((number, row))
+            if len(batch) >= batch_size:
+                _import_batch(kind, batch, pool, report, created)
+                batch = []
+        if batch:
+            _import_batch(kind, batch, pool, report, created)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    if report['created']:
+        # bulk_create sends no signals. Clinics aren't geocoded here: at the geocoder's rate limit a
+        # large import would hold the worker for hours, so geocode_doctors backfills them.
+        transaction.on_commit(lambda: conditional.bump_versions(kind, 'users'))
+        if kind == 'doctors':
+            transaction.on_commit(lambda: fulltext.reindex(created))
+            transaction.on_commit(lambda: schedules.compile_schedules(created))
+    return report
+
+
+def _import_batch(kind, batch, pool, report, created):
+    valid = []
+    seen = set()
+    for number, row in batch:
+        try:
+            user, profile, password = build_row(kind, row)
+        except ValidationError as exc:
+            report['errors'].append({'row': number, 'errors': exc.message_dict})
+            continue
+        if user.username in seen:
+            report['errors'].append({'row': number, 'errors': {'username': ['Duplicate username in file.']}})
+            continue
+        seen.add(user.username)
+        valid.append((number, user, profile, password))
+
+    # One lookup per batch for usernames that already exist
+    taken = set(User.objects.filter(username__in=seen).values_list('username', flat=True))
+    if taken:
+        for number, user, _, _ in valid:
+            if user.username in taken:
+                report['errors'].append({'row': number, 'errors': {'username': ['A user with that username already exists.']}})
+        valid = [entry for entry in valid if entry[1].username not in taken]
+    if not valid:
+        return
+
+    for (_, user, _, _), hashed in zip(valid, hash_passwords([entry[3] for entry in valid], pool)):
+        user.password = hashed
+
+    try:
+        with transaction.atomic():
+            created += _save(valid)
+        report['created'] += len(valid)
+    except IntegrityError:
+        # Lost a race with a concurrent writer: fall back to row-by-row so only the bad rows fail
+        for entry in valid:
+            entry[1].pk = None
+            try:
+                with transaction.atomic():
+                    created += _save([entry])
+                report['created'] += 1
+            except IntegrityError as exc:
+                report['errors'].append({'row': entry[0], 'errors': {'non_field_errors': [str(exc)]}})
+
+
+def _save(entries):
+    users = User.objects.bulk_create([user for _, user, _, _ in entries])
+    if users[0].pk is None:
+        # Backends that cannot return ids from a bulk insert
+        ids = dict(User.objects.filter(username__in=[user.username for user in users]).values_list('username', 'id'))
+        for user in users:
+            user.pk = ids[user.username]
+    profiles = []
+    for (_, _, profile, _), user in zip(entries, users):
+        profile.user = user
+        profiles.append(profile)
+    model = type(profiles[0])
+    profiles = model.objects.bulk_create(profiles)
+    if profiles[0].pk is None:
+        return list(model.objects.filter(user__in=users).values_list('id', flat=True))
+    return [profile.pk for profile in profiles]
@@ -0,0 +1,82 @@
+import asyncio
+import datetime
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import AsyncClient, Client
+from appointments import benchmarking
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare concurrent throughput of the async (ASGI) read endpoints against the synchronous (WSGI) ones. "
+        "Both stacks are driven in-process: WSGI through Django's Client on a thread pool, ASGI through "
+        "AsyncClient on one event loop, with the same number of requests in flight."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctors', type=int, default=200)
+        parser.add_argument('--patients', type=int, default=1000)
+        parser.add_argument('--appointments', type=int, default=10000)
+        parser.add_argument('--requests', type=int, default=200, help="Requests per endpoint and stack.")
+        parser.add_argument('--concurrency', type=int, default=16, help="Requests in flight at once.")
+        parser.add_argument('--output', default='bench-asgi-results.json')
+
+    def handle(self, *args, **options):
+        with benchmarking.benchmark_database():
+            doctors, patients = benchmarking.seed_hospital(options['doctors'], options['patients'], options['appointments'])
+            headers = [{'Authorization': f'Bearer {benchmarking.access_token(patient.user)}'} for patient in patients[:50]]
+            today = datetime.date.today()
+            ids = ','.join(str(doctor.id) for doctor in doctors[:20])
+            endpoints = {
+                'doctors_directory': ('/api/doctors/?view=directory', '/api/async/doctors/?view=directory'),
+                'appointments': ('/api/appointments/', '/api/async/appointments/'),
+                'available_month_20_doctors': (
+                    f'/api/appointments/available/?doctor={ids}&start={today}&end={today + datetime.timedelta(days=30)}',
+                    f'/api/async/appointments/available/?doctor={ids}&start={today}&end={today + datetime.timedelta(days=30)}',
+                ),
+            }
+            results = {}
+            for name, (sync_url, async_url) in endpoints.items():
+                results[f'{name}_wsgi'] = self.run_wsgi(sync_url, headers, options['requests'], options['concurrency'])
+                results[f'{name}_asgi'] = asyncio.run(self.run_asgi(async_url, headers, options['requests'], options['concurrency']))
+                for stack in ('wsgi', 'asgi'):
+                    result = results[f'{name}_{stack}']
+                    self.stdout.write(
+                        f"{name:<28} {stack}  {result['throughput_rps']:>8} req/s  p50 {result['p50_ms']}ms  "
+                        f"p95 {result['p95_ms']}ms  {result['statuses']}"
+                    )
+            parameters = {key: options[key] for key in ('doctors', 'patients', 'appointments', 'requests', 'concurrency')}
+            benchmarking.write_results(options['output'], 'bench_asgi', parameters, results)
+        self.stdout.write(f"Results written to {options['output']}")
+
+    def run_wsgi(self, url, headers, requests, concurrency):
+        def call(i):
+            try:
+                with benchmarking.Timer() as timer:
+                    response = Client().get(url, headers=headers[i % len(headers)])
+                return timer.elapsed, response.status_code
+            finally:
+                connection.close()
+
+        with benchmarking.Timer() as timer:
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                samples = list(pool.map(call, range(requests)))
+        latencies, statuses = zip(*samples)
+        return benchmarking.summarize(latencies, timer.elapsed, statuses=Counter(statuses))
+
+    async def run_asgi(self, url, headers, requests, concurrency):
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def call(i):
+            async with semaphore:
+                with benchmarking.Timer() as timer:
+                    response = await client.get(url, headers=headers[i % len(headers)])
+                return timer.elapsed, response.status_code
+
+        with benchmarking.Timer() as timer:
+            samples = await asyncio.gather(*(call(i) for i in range(requests)))
+        latencies, statuses = zip(*samples)
+        return benchmarking.summarize(latencies, timer.elapsed, statuses=Counter(statuses))
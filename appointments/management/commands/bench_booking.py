@@ -0,0 +1,112 @@
+import datetime
+import logging
+import random
+import threading
+from collections import Counter
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test import Client
+from appointments import benchmarking
+from backend import databases
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare concurrent booking throughput on a local SQLite file under the development database "
+        "settings (connection per request, rollback journal, deferred transactions) and the production "
+        "profile (persistent connections, WAL, busy_timeout, BEGIN IMMEDIATE)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctors', type=int, default=50)
+        parser.add_argument('--patients', type=int, default=500)
+        parser.add_argument('--appointments', type=int, default=5000)
+        parser.add_argument('--requests', type=int, default=400, help="Requests per profile and scenario.")
+        parser.add_argument('--concurrency', type=int, default=16, help="Client threads, each keeping its own connection.")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', default='bench-booking-results.json')
+        parser.add_argument('--compare', help="Earlier results file to compare p95 latencies against.")
+
+    def handle(self, *args, **options):
+        with benchmarking.benchmark_database():
+            doctors, patients = benchmarking.seed_hospital(options['doctors'], options['patients'], options['appointments'])
+            headers = [{'HTTP_AUTHORIZATION': f'Bearer {benchmarking.access_token(patient.user)}'} for patient in patients[:50]]
+            name = connection.settings_dict['NAME']
+            profiles = {
+                'baseline': {key: settings.DATABASES['default'][key] for key in ('CONN_MAX_AGE', 'OPTIONS')},
+                'production': {key: value for key, value in databases.sqlite(name).items() if key != 'NAME'},
+            }
+            results = {}
+            # Every booking conflict is otherwise logged as a warning
+            logging.getLogger('django.request').setLevel(logging.ERROR)
+            for profile, overrides in profiles.items():
+                self.use_profile(overrides, wal=profile == 'production')
+                for scenario, write_every in (('book', 1), ('mixed', 4)):
+                    # Each run books its own year of dates, so runs don't collide with each other's bookings
+                    first_day = datetime.date.today() + datetime.timedelta(days=400 + 365 * len(results))
+                    rng = random.Random(options['seed'])
+                    result = self.run(doctors, headers, rng, first_day, options['requests'], options['concurrency'], write_every)
+                    results[f'{scenario}_{profile}'] = result
+                    self.stdout.write(
+                        f"{scenario:<6} {profile:<11} {result['throughput_rps']:>8} req/s  p50 {result['p50_ms']}ms  "
+                        f"p95 {result['p95_ms']}ms  p99 {result['p99_ms']}ms  {result['statuses']}"
+                    )
+
+            parameters = {key: options[key] for key in ('doctors', 'patients', 'appointments', 'requests', 'concurrency', 'seed')}
+            benchmarking.write_results(options['output'], 'bench_booking', parameters, results)
+        self.stdout.write(f"Results written to {options['output']}")
+        if options['compare']:
+            for line in benchmarking.compare(options['compare'], results):
+                self.stdout.write(line)
+
+    def use_profile(self, overrides, wal):
+        # Connections are built from this dict, so worker threads pick the profile up on connect
+        connections.close_all()
+        connections.settings['default'].update(overrides)
+        with connection.cursor() as cursor:
+            # The journal mode is stored in the database file, so switch it back explicitly
+            cursor.execute('PRAGMA journal_mode=%s' % ('WAL' if wal else 'DELETE'))
+
+    def run(self, doctors, headers, rng, first_day, requests, concurrency, write_every):
+        today = datetime.date.today()
+        jobs = []
+        for i in range(requests):
+            doctor = rng.choice(doctors).id
+            if i % write_every == 0:
+                # Beyond the seeded range; two clients picking the same slot come back as a 409
+                day = first_day + datetime.timedelta(days=rng.randrange(365))
+                jobs.append(('book', doctor, str(day), rng.choice(['09:00', '11:00', '13:00', '15:00'])))
+            else:
+                jobs.append(('read', doctor, str(today), None))
+        samples = []
+        lock = threading.Lock()
+
+        def worker(offset):
+            client = Client()
+            try:
+                for i in range(offset, requests, concurrency):
+                    kind, doctor, day, time = jobs[i]
+                    with benchmarking.Timer() as timer:
+                        if kind == 'book':
+                            response = client.post(
+                                '/api/appointments/', {'doctor': doctor, 'date': day, 'time': time},
+                                content_type='application/json', **headers[i % len(headers)],
+                            )
+                        else:
+                            response = client.get(
+                                '/api/appointments/available/', {'doctor': doctor, 'date': day}, **headers[i % len(headers)],
+                            )
+                    with lock:
+                        samples.append((timer.elapsed, response.status_code))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(offset,)) for offset in range(concurrency)]
+        with benchmarking.Timer() as timer:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        latencies, statuses = zip(*samples)
+        return benchmarking.summarize(latencies, timer.elapsed, statuses=Counter(statuses))
@@ -0,0 +1,56 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from appointments import importers
+
+
+class Rollback(Exception):
+    pass
+
+
+def synthetic_rows(kind, count, prefix):
+    for i in range(count):
+        row = {
+            'username': f'{prefix}{kind}{i}',
+            'email': f'{prefix}{kind}{i}@example.com',
+            'password': f'Secret-{i}-password',
+            'first_name': 'Bench',
+            'last_name': f'{kind}{i}',
+        }
+        if kind == 'doctors':
+            row.update({'working_start': '09:00', 'working_end': '17:00', 'specialization': 'General', 'city': 'Boston'})
+        else:
+            row.update({'gender': 'O', 'dob': '1990-01-01'})
+        yield row
+
+
+class Command(BaseCommand):
+    help = "Measure bulk import throughput on synthetic rows. Everything is rolled back afterwards."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctors', type=int, default=1000)
+        parser.add_argument('--patients', type=int, default=5000)
+        parser.add_argument('--batch-size', type=int, default=importers.BATCH_SIZE)
+        parser.add_argument('--workers', type=int, default=None, help="Password hashing processes (0 hashes inline).")
+
+    def handle(self, *args, **options):
+        prefix = f'bench{int(time.time())}_'
+        try:
+            with transaction.atomic():
+                for kind in ('doctors', 'patients'):
+                    count = options[kind]
+                    if not count:
+                        continue
+                    started = time.perf_counter()
+                    report = importers.import_rows(
+                        kind, synthetic_rows(kind, count, prefix),
+                        batch_size=options['batch_size'], workers=options['workers'],
+                    )
+                    elapsed = time.perf_counter() - started
+                    self.stdout.write(
+                        f"{kind}: {report['created']} created, {len(report['errors'])} failed "
+                        f"in {elapsed:.2f}s ({report['created'] / elapsed:.0f} rows/s)"
+                    )
+                raise Rollback
+        except Rollback:
+            pass
@@ -0,0 +1,101 @@
+import random
+from django.core.management.base import BaseCommand
+from django.test import Client
+from appointments import benchmarking, geocoding
+from appointments.models import DoctorProfile
+
+# Query points, and the metro areas most seeded clinics cluster around
+METROS = {
+    'boston': (42.3601, -71.0589),
+    'chicago': (41.8781, -87.6298),
+    'denver': (39.7392, -104.9903),
+    'seattle': (47.6062, -122.3321),
+    'austin': (30.2672, -97.7431),
+    'miami': (25.7617, -80.1918),
+    'rural_kansas': (38.5, -98.5),
+}
+SCENARIOS = [('radius_10km', {'radius': 10}), ('radius_50km', {'radius': 50}), ('nearest_20', {})]
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure nearby-doctor queries over many geocoded clinics: the grid-cell index against a baseline "
+        "that computes the distance to every clinic."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctors', type=int, default=100000)
+        parser.add_argument('--repeat', type=int, default=20, help="Times each query point is run per scenario.")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', default='bench-nearby-results.json')
+
+    def handle(self, *args, **options):
+        with benchmarking.benchmark_database():
+            doctors, _ = benchmarking.seed_hospital(options['doctors'], 0, 0)
+            with benchmarking.Timer() as timer:
+                self.locate(doctors, random.Random(options['seed']))
+            self.stdout.write(f"Located {len(doctors)} clinics in {timer.elapsed:.1f}s")
+
+            results = {}
+            queryset = DoctorProfile.objects.all()
+            for name, params in SCENARIOS:
+                for method in ('grid', 'scan'):
+                    latencies = []
+                    sizes = []
+                    with benchmarking.Timer() as total:
+                        for _ in range(options['repeat']):
+                            for lat, lng in METROS.values():
+                                with benchmarking.Timer() as sample:
+                                    matches = self.query(method, queryset, lat, lng, params.get('radius'))
+                                latencies.append(sample.elapsed)
+                                sizes.append(len(matches))
+                    result = benchmarking.summarize(latencies, total.elapsed)
+                    result['mean_results'] = round(sum(sizes) / len(sizes), 1)
+                    results[f'{name}_{method}'] = result
+                    self.stdout.write(
+                        f"{name:<12} {method:<5} p50 {result['p50_ms']}ms  p95 {result['p95_ms']}ms  "
+                        f"p99 {result['p99_ms']}ms  ~{result['mean_results']} results"
+                    )
+
+            client = Client()
+            client.defaults['HTTP_AUTHORIZATION'] = f'Bearer {benchmarking.access_token(doctors[0].user)}'
+            latencies = []
+            with benchmarking.Timer() as total:
+                for _ in range(options['repeat']):
+                    for lat, lng in METROS.values():
+                        with benchmarking.Timer() as sample:
+                            client.get('/api/doctors/nearby/', {'lat': lat, 'lng': lng, 'limit': 20})
+                        latencies.append(sample.elapsed)
+            results['endpoint_nearest_20'] = benchmarking.summarize(latencies, total.elapsed)
+            self.stdout.write(f"endpoint     nearest 20  p50 {results['endpoint_nearest_20']['p50_ms']}ms  p95 {results['endpoint_nearest_20']['p95_ms']}ms")
+
+            parameters = {key: options[key] for key in ('doctors', 'repeat', 'seed')}
+            benchmarking.write_results(options['output'], 'bench_nearby', parameters, results)
+        self.stdout.write(f"Results written to {options['output']}")
+
+    def locate(self, doctors, rng):
+        # Four in five clinics within ~30km of a metro, the rest anywhere in the contiguous US
+        south, west, north, east = geocoding.LocalGeocoder().bounds
+        centers = list(METROS.values())[:-1]
+        for doctor in doctors:
+            if rng.random() < 0.8:
+                lat, lng = rng.choice(centers)
+                lat, lng = rng.gauss(lat, 0.25), rng.gauss(lng, 0.3)
+            else:
+                lat, lng = rng.uniform(south, north), rng.uniform(west, east)
+            doctor.latitude, doctor.longitude, doctor.geo_cell = lat, lng, geocoding.cell(lat, lng)
+        DoctorProfile.objects.bulk_update(doctors, ['latitude', 'longitude', 'geo_cell'], batch_size=2000)
+
+    def query(self, method, queryset, lat, lng, radius):
+        if method == 'grid':
+            if radius is None:
+                return geocoding.nearest(queryset, lat, lng, 20)
+            return geocoding.within(queryset, lat, lng, radius)
+        # Baseline: every clinic's distance
+        matches = sorted(
+            (geocoding.distance_km(lat, lng, doctor_lat, doctor_lng), doctor_id)
+            for doctor_id, doctor_lat, doctor_lng in queryset.exclude(geo_cell=None).values_list('id', 'latitude', 'longitude')
+        )
+        if radius is None:
+            return matches[:20]
+        return [match for match in matches if match[0] <= radius]
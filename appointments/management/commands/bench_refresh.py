@@ -0,0 +1,78 @@
+import datetime
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client
+from django.utils import timezone
+from appointments import benchmarking, revocation
+from appointments.models import RevokedToken
+
+SEED_BATCH = 100000
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure /api/auth/refresh/ latency with a large revocation table: once with every rotated token "
+        "ever issued still stored, then after pruning the expired ones."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tokens', type=int, default=10_000_000, help="Rotated refresh tokens issued so far.")
+        parser.add_argument('--days', type=int, default=90, help="Period the tokens were issued over.")
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--output', default='bench-refresh-results.json')
+
+    def handle(self, *args, **options):
+        with benchmarking.benchmark_database():
+            _, patients = benchmarking.seed_hospital(1, 20, 0)
+            with benchmarking.Timer() as timer:
+                self.seed_revocations(options['tokens'], options['days'])
+            self.stdout.write(f"Seeded {options['tokens']} revoked tokens in {timer.elapsed:.1f}s; {revocation.stats()}")
+
+            results = {}
+            results['unpruned'] = self.measure(patients, options['requests'])
+            with benchmarking.Timer() as timer:
+                pruned = revocation.prune()
+            self.stdout.write(f"Pruned {pruned} expired rows in {timer.elapsed:.1f}s; {revocation.stats()}")
+            results['pruned'] = self.measure(patients, options['requests'])
+            results['pruned']['prune_seconds'] = round(timer.elapsed, 2)
+            for name, result in results.items():
+                self.stdout.write(
+                    f"{name:<9} {result['throughput_rps']:>8} req/s  p50 {result['p50_ms']}ms  "
+                    f"p95 {result['p95_ms']}ms  p99 {result['p99_ms']}ms  {result['statuses']}"
+                )
+            parameters = {key: options[key] for key in ('tokens', 'days', 'requests')}
+            benchmarking.write_results(options['output'], 'bench_refresh', parameters, results)
+        self.stdout.write(f"Results written to {options['output']}")
+
+    def seed_revocations(self, count, days):
+        # Issued evenly over `days`; each expires a refresh lifetime after issue, so most are long expired
+        lifetime = datetime.timedelta(days=7)
+        start = timezone.now() - datetime.timedelta(days=days)
+        step = datetime.timedelta(days=days) / max(count, 1)
+        table = RevokedToken._meta.db_table
+        with transaction.atomic(), connection.cursor() as cursor:
+            for offset in range(0, count, SEED_BATCH):
+                cursor.executemany(
+                    f'INSERT INTO {table} (jti, expires_at) VALUES (%s, %s)',
+                    [(f'{i:032x}', start + step * i + lifetime) for i in range(offset, min(offset + SEED_BATCH, count))],
+                )
+
+    def measure(self, patients, requests):
+        revocation.get_cache().clear()
+        client = Client()
+        tokens = [self.login(client, patient.user.username) for patient in patients]
+        latencies = []
+        statuses = {}
+        with benchmarking.Timer() as total:
+            for i in range(requests):
+                with benchmarking.Timer() as timer:
+                    response = client.post('/api/auth/refresh/', {'refresh': tokens[i % len(tokens)]}, content_type='application/json')
+                latencies.append(timer.elapsed)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                if response.status_code == 200:
+                    tokens[i % len(tokens)] = response.json()['refresh']
+        return benchmarking.summarize(latencies, total.elapsed, statuses=statuses)
+
+    def login(self, client, username):
+        response = client.post('/api/auth/', {'username': username, 'password': benchmarking.PASSWORD}, content_type='application/json')
+        return response.json()['refresh']
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from appointments import benchmarking, fulltext
+
+QUERIES = [
+    'pediatric cardio Boston',
+    'cardiology',
+    'ana diaz',
+    'derm miami',
+    'neuro MD PhD',
+    'orthopedics clinic 42',
+    'khan',
+    'seattle general',
+]
+
+
+class Command(BaseCommand):
+    help = "Measure full-text doctor search (index build and ranked query latency) for each available backend."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctors', type=int, default=100000)
+        parser.add_argument('--repeat', type=int, default=20, help="Times each query is run per backend.")
+        parser.add_argument('--output', default='bench-search-results.json')
+
+    def handle(self, *args, **options):
+        with benchmarking.benchmark_database():
+            benchmarking.seed_hospital(options['doctors'], 0, 0)
+            backends = ['python'] + (['fts5'] if fulltext.fts5_available() else [])
+            results = {}
+            for backend in backends:
+                with override_settings(DOCTOR_SEARCH_BACKEND=backend):
+                    with benchmarking.Timer() as build:
+                        fulltext.rebuild()
+                    latencies = []
+                    with benchmarking.Timer() as timer:
+                        for _ in range(options['repeat']):
+                            for query in QUERIES:
+                                with benchmarking.Timer() as sample:
+                                    fulltext.search(query)
+                                latencies.append(sample.elapsed)
+                    result = benchmarking.summarize(latencies, timer.elapsed)
+                    result['build_seconds'] = round(build.elapsed, 2)
+                    results[backend] = result
+                    self.stdout.write(
+                        f"{backend:<7} build {result['build_seconds']}s  p50 {result['p50_ms']}ms  "
+                        f"p95 {result['p95_ms']}ms  p99 {result['p99_ms']}ms"
+                    )
+            parameters = {key: options[key] for key in ('doctors', 'repeat')}
+            benchmarking.write_results(options['output'], 'bench_search', parameters, results)
+        self.stdout.write(f"Results written to {options['output']}")
@@ -0,0 +1,80 @@
+import datetime
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, Sum
+from django.test import Client
+from appointments import benchmarking, rollups
+from appointments.models import Appointment
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure /api/stats/ range queries over years of appointments: the daily rollups against a baseline "
+        "that aggregates the appointments table itself."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctors', type=int, default=200)
+        parser.add_argument('--patients', type=int, default=2000)
+        parser.add_argument('--appointments', type=int, default=1_000_000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--output', default='bench-stats-results.json')
+
+    def handle(self, *args, **options):
+        with benchmarking.benchmark_database():
+            doctors, _ = benchmarking.seed_hospital(options['doctors'], options['patients'], options['appointments'])
+            with benchmarking.Timer() as timer:
+                rows = rollups.rebuild()
+            self.stdout.write(f"Rebuilt {rows} rollup rows from {options['appointments']} appointments in {timer.elapsed:.1f}s")
+
+            start = datetime.date.today()
+            everything = (start, start + datetime.timedelta(days=rollups.MAX_RANGE_DAYS - 1))
+            one_year = (start, start + datetime.timedelta(days=364))
+            scenarios = [
+                ('all_by_month', everything, 'month', {}),
+                ('year_by_specialization', one_year, 'specialization', {}),
+                ('year_one_doctor_by_month', one_year, 'month', {'doctor_id__in': [doctors[0].id]}),
+            ]
+            results = {}
+            for name, (first, last), group_by, filters in scenarios:
+                for method in ('rollup', 'scan'):
+                    latencies = []
+                    with benchmarking.Timer() as total:
+                        for _ in range(options['repeat']):
+                            with benchmarking.Timer() as sample:
+                                self.query(method, first, last, group_by, filters)
+                            latencies.append(sample.elapsed)
+                    results[f'{name}_{method}'] = benchmarking.summarize(latencies, total.elapsed)
+                    self.stdout.write(
+                        f"{name:<25} {method:<6} p50 {results[f'{name}_{method}']['p50_ms']}ms  "
+                        f"p95 {results[f'{name}_{method}']['p95_ms']}ms"
+                    )
+
+            client = Client()
+            client.defaults['HTTP_AUTHORIZATION'] = f'Bearer {benchmarking.access_token(doctors[0].user)}'
+            latencies = []
+            with benchmarking.Timer() as total:
+                for _ in range(options['repeat']):
+                    with benchmarking.Timer() as sample:
+                        client.get('/api/stats/', {'start': everything[0], 'end': everything[1], 'group_by': 'month'})
+                    latencies.append(sample.elapsed)
+            results['endpoint_all_by_month'] = benchmarking.summarize(latencies, total.elapsed)
+            self.stdout.write(f"endpoint all by month     p50 {results['endpoint_all_by_month']['p50_ms']}ms")
+
+            parameters = {key: options[key] for key in ('doctors', 'patients', 'appointments', 'repeat')}
+            benchmarking.write_results(options['output'], 'bench_stats', parameters, results)
+        self.stdout.write(f"Results written to {options['output']}")
+
+    def query(self, method, start, end, group_by, filters):
+        if method == 'rollup':
+            return rollups.stats(start, end, group_by, filters)
+        # Baseline: count and price every appointment in the range, folding days into months the same way
+        appointments = Appointment.objects.filter(date__range=(start, end), **filters)
+        key = F('date') if group_by in rollups.PERIODS else F(f'doctor__{group_by}')
+        rows = appointments.annotate(key=key).values('key').annotate(count=Count('id'), revenue=Sum('doctor__consultation_fee'))
+        if group_by not in rollups.PERIODS:
+            return list(rows)
+        sums = {}
+        for row in rows:
+            count, revenue = sums.get(rollups.PERIODS[group_by](row['key']), (0, 0))
+            sums[rollups.PERIODS[group_by](row['key'])] = (count + row['count'], revenue + row['revenue'])
+        return sums
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from appointments import thumbnails
+from appointments.models import DoctorProfile, PatientProfile
+
+
+class Command(BaseCommand):
+    help = "Generate missing or stale profile thumbnails (backfills existing media/ uploads)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Regenerate every thumbnail, not just stale ones.")
+
+    def handle(self, *args, **options):
+        for model in (DoctorProfile, PatientProfile):
+            updated = failed = 0
+            for profile in model.objects.exclude(profile_image='').exclude(profile_image=None).iterator():
+                try:
+                    updated += thumbnails.update_thumbnail(profile, force=options['force'])
+                except (OSError, ValueError) as exc:
+                    failed += 1
+                    self.stderr.write(f"{model.__name__} {profile.pk}: {exc}")
+            self.stdout.write(f"{model.__name__}: {updated} thumbnails generated, {failed} failed")
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from appointments import geocoding
+from appointments.models import DoctorProfile
+
+
+class Command(BaseCommand):
+    help = (
+        "Geocode clinic addresses that changed since they were last geocoded (backfills existing doctors). "
+        "Each distinct address reaches the geocoder once; repeats come from the GeocodedAddress cache."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Re-resolve every doctor, not just stale ones.")
+
+    def handle(self, *args, **options):
+        updated = failed = 0
+        for doctor in DoctorProfile.objects.iterator():
+            try:
+                updated += geocoding.update_location(doctor, force=options['force'])
+            except OSError as exc:
+                # Network and HTTP errors: nothing was cached, so the next run retries
+                failed += 1
+                self.stderr.write(f"Doctor {doctor.pk}: {exc}")
+        located = DoctorProfile.objects.exclude(geo_cell=None).count()
+        self.stdout.write(f"{updated} doctors geocoded, {failed} failed; {located} have coordinates")
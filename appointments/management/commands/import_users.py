@@ -0,0 +1,34 @@
+import json
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+from appointments import importers
+
+
+class Command(BaseCommand):
+    help = "Bulk import doctors or patients from a CSV or JSONL file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=['doctors', 'patients'])
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=importers.BATCH_SIZE)
+        parser.add_argument('--workers', type=int, default=None, help="Password hashing processes (0 hashes inline).")
+        parser.add_argument('--report', help="Write the per-row error report to this JSON file.")
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        file_type = path.suffix.lstrip('.').lower()
+        if file_type not in ('csv', 'jsonl'):
+            raise CommandError("File must end in .csv or .jsonl")
+        with path.open(encoding='utf-8', newline='') as fileobj:
+            report = importers.import_rows(
+                options['kind'], importers.read_rows(fileobj, file_type),
+                batch_size=options['batch_size'], workers=options['workers'],
+            )
+        if options['report']:
+            Path(options['report']).write_text(json.dumps(report, indent=2))
+        else:
+            for error in report['errors']:
+                self.stderr.write(f"Row {error['row']}: {json.dumps(error['errors'])}")
+        self.stdout.write(f"Created {report['created']} {options['kind']}, {len(report['errors'])} rows failed")
+        if options['kind'] == 'doctors' and report['created']:
+            self.stdout.write("Run geocode_doctors to locate the new clinics for nearby search.")
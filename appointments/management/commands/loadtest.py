@@ -0,0 +1,120 @@
+import datetime
+import json
+import random
+import re
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from appointments import benchmarking
+
+QUERIES_RE = re.compile(r'desc="(\d+) queries"')
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a synthetic hospital in a throwaway database, drive the main API endpoints "
+        "and report latency percentiles, throughput and query counts as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctors', type=int, default=200)
+        parser.add_argument('--patients', type=int, default=2000)
+        parser.add_argument('--appointments', type=int, default=20000)
+        parser.add_argument('--requests', type=int, default=200, help="Requests per scenario.")
+        parser.add_argument('--concurrency', type=int, default=1, help="Client threads per scenario.")
+        parser.add_argument('--scenario', action='append', help="Only run the named scenario(s).")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', default='loadtest-results.json')
+        parser.add_argument('--compare', help="Earlier results file to compare p95 latencies against.")
+
+    def handle(self, *args, **options):
+        with benchmarking.benchmark_database():
+            with benchmarking.Timer() as timer:
+                doctors, patients = benchmarking.seed_hospital(options['doctors'], options['patients'], options['appointments'])
+            self.stdout.write(f"Seeded {len(doctors)} doctors, {len(patients)} patients, {options['appointments']} appointments in {timer.elapsed:.1f}s")
+
+            scenarios = self.build_scenarios(doctors, patients, random.Random(options['seed']))
+            selected = options['scenario'] or list(scenarios)
+            results = {}
+            for name in selected:
+                results[name] = self.run_scenario(scenarios[name], options['requests'], options['concurrency'])
+                result = results[name]
+                self.stdout.write(
+                    f"{name:<24} {result['throughput_rps']:>8} req/s  p50 {result['p50_ms']}ms  "
+                    f"p95 {result['p95_ms']}ms  p99 {result['p99_ms']}ms  queries {result.get('queries_mean')}  {json.dumps(result['statuses'])}"
+                )
+
+            parameters = {key: options[key] for key in ('doctors', 'patients', 'appointments', 'requests', 'concurrency', 'seed')}
+            benchmarking.write_results(options['output'], 'loadtest', parameters, results)
+        self.stdout.write(f"Results written to {options['output']}")
+        if options['compare']:
+            for line in benchmarking.compare(options['compare'], results):
+                self.stdout.write(line)
+
+    def build_scenarios(self, doctors, patients, rng):
+        def auth(user):
+            return {'HTTP_AUTHORIZATION': f'Bearer {benchmarking.access_token(user)}'}
+
+        patient_headers = [auth(patient.user) for patient in patients[:50]]
+        doctor = doctors[0]
+        doctor.user.is_staff = False  # doctors created as staff see everything; benchmark the doctor-only path
+        doctor.user.save(update_fields=['is_staff'])
+        doctor_headers = auth(doctor.user)
+        staff_headers = auth(doctors[1].user) if len(doctors) > 1 else doctor_headers
+        today = datetime.date.today()
+
+        def book(client, i):
+            # Far beyond the seeded range; collisions between clients come back as 409s
+            day = today + datetime.timedelta(days=400 + rng.randrange(365))
+            return client.post(
+                '/api/appointments/',
+                {'doctor': rng.choice(doctors).id, 'date': str(day), 'time': '09:00'},
+                content_type='application/json', **patient_headers[i % len(patient_headers)],
+            )
+
+        return {
+            'doctors_full': lambda client, i: client.get('/api/doctors/', **patient_headers[i % len(patient_headers)]),
+            'doctors_directory': lambda client, i: client.get('/api/doctors/?view=directory', **patient_headers[i % len(patient_headers)]),
+            'appointments_patient': lambda client, i: client.get('/api/appointments/', **patient_headers[i % len(patient_headers)]),
+            'appointments_doctor': lambda client, i: client.get('/api/appointments/', **doctor_headers),
+            'appointments_staff': lambda client, i: client.get('/api/appointments/', **staff_headers),
+            'available_day': lambda client, i: client.get(
+                f'/api/appointments/available/?doctor={rng.choice(doctors).id}&date={today}',
+                **patient_headers[i % len(patient_headers)]),
+            'available_month': lambda client, i: client.get(
+                f'/api/appointments/available/?doctor={rng.choice(doctors).id}&start={today}&end={today + datetime.timedelta(days=30)}',
+                **patient_headers[i % len(patient_headers)]),
+            'patients_page': lambda client, i: client.get('/api/patients/', **staff_headers),
+            'patients_expanded': lambda client, i: client.get('/api/patients/?expand=appointments', **staff_headers),
+            'patients_search': lambda client, i: client.get(
+                f'/api/patients/?q={rng.randrange(len(patients))}', **staff_headers),
+            'auth': lambda client, i: client.post(
+                '/api/auth/', {'username': patients[i % len(patients)].user.username, 'password': benchmarking.PASSWORD},
+                content_type='application/json'),
+            'book': book,
+        }
+
+    def run_scenario(self, scenario, requests, concurrency):
+        def call(i):
+            client = Client()
+            with benchmarking.Timer() as timer:
+                response = scenario(client, i)
+            match = QUERIES_RE.search(response.get('Server-Timing', ''))
+            return timer.elapsed, response.status_code, int(match.group(1)) if match else None
+
+        def call_in_thread(i):
+            try:
+                return call(i)
+            finally:
+                connection.close()
+
+        with benchmarking.Timer() as timer:
+            if concurrency > 1:
+                with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                    samples = list(pool.map(call_in_thread, range(requests)))
+            else:
+                samples = [call(i) for i in range(requests)]
+        latencies, statuses, queries = zip(*samples) if samples else ((), (), ())
+        return benchmarking.summarize(latencies, timer.elapsed, queries, Counter(statuses))
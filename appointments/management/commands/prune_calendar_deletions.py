@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from appointments import ics
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete records of deleted appointments older than the calendar sync window; clients with older "
+        "sync tokens get the full feed anyway. Safe to run from cron at any interval."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=ics.PRUNE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        deleted = ics.prune(batch_size=options['batch_size'])
+        self.stdout.write(f"Pruned {deleted} appointment deletion records")
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from appointments import revocation
+
+
+class Command(BaseCommand):
+    help = "Delete revoked refresh-token rows whose tokens have expired. Safe to run from cron at any interval."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=revocation.PRUNE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        deleted = revocation.prune(batch_size=options['batch_size'])
+        self.stdout.write(f"Pruned {deleted} expired revoked tokens")
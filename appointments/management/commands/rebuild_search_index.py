@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from appointments import fulltext
+from appointments.models import DoctorProfile
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text doctor search index (after raw SQL loads or restoring a backup)."
+
+    def handle(self, *args, **options):
+        index = fulltext.get_index()
+        index.rebuild()
+        self.stdout.write(f"Indexed {DoctorProfile.objects.count()} doctors with {type(index).__name__}")
@@ -0,0 +1,19 @@
+import datetime
+from django.core.management.base import BaseCommand
+from appointments import rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the daily appointment rollups behind /api/stats/ from the appointments table: the "
+        "first time, and after appointments were written without signals (bulk loads, raw SQL)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=datetime.date.fromisoformat, help="First day to rebuild (YYYY-MM-DD); default all.")
+        parser.add_argument('--end', type=datetime.date.fromisoformat, help="Last day to rebuild (YYYY-MM-DD); default all.")
+        parser.add_argument('--batch-size', type=int, default=rollups.REBUILD_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        created = rollups.rebuild(options['start'], options['end'], options['batch_size'])
+        self.stdout.write(f"Rebuilt {created} daily rollup rows")
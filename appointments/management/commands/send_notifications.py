@@ -0,0 +1,22 @@
+import time
+from django.core.management.base import BaseCommand
+from appointments import notifications
+
+
+class Command(BaseCommand):
+    help = "Deliver queued emails from the outbox in batches over one SMTP connection."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Drain the outbox once and exit instead of polling.")
+        parser.add_argument('--batch-size', type=int, default=notifications.BATCH_SIZE)
+        parser.add_argument('--interval', type=float, default=5.0, help="Seconds to sleep when the outbox is empty.")
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = notifications.send_pending(options['batch_size'])
+            if sent or failed:
+                self.stdout.write(f"Sent {sent}, failed {failed}")
+            elif options['once']:
+                return
+            else:
+                time.sleep(options['interval'])
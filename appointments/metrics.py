@@ -0,0 +1,68 @@
+import bisect
+import threading
+from collections import defaultdict
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+METRICS = {
+    # name: (help text, buckets)
+    'http_request_duration_seconds': ('Request latency by URL name', LATENCY_BUCKETS),
+    'http_request_sql_queries': ('SQL queries per request by URL name', QUERY_BUCKETS),
+    'http_request_sql_duration_seconds': ('Time spent in SQL per request by URL name', LATENCY_BUCKETS),
+    'http_response_size_bytes': ('Response body size by URL name', SIZE_BUCKETS),
+}
+
+
+class Histogram:
+    """Cumulative Prometheus-style histogram; rates over a window come from the scraper."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = defaultdict(dict)  # metric -> {url_name: Histogram}
+
+    def observe(self, url_name, **values):
+        with self._lock:
+            for metric, value in values.items():
+                series = self._histograms[metric]
+                if url_name not in series:
+                    series[url_name] = Histogram(METRICS[metric][1])
+                series[url_name].observe(value)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def render(self):
+        """Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for metric, (help_text, buckets) in METRICS.items():
+                lines.append(f'# HELP {metric} {help_text}')
+                lines.append(f'# TYPE {metric} histogram')
+                for url_name, histogram in sorted(self._histograms.get(metric, {}).items()):
+                    label = f'url_name="{url_name}"'
+                    cumulative = 0
+                    for bound, count in zip(buckets + ('+Inf',), histogram.counts):
+                        cumulative += count
+                        lines.append(f'{metric}_bucket{{{label},le="{bound}"}} {cumulative}')
+                    lines.append(f'{metric}_sum{{{label}}} {histogram.sum}')
+                    lines.append(f'{metric}_count{{{label}}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
@@ -0,0 +1,144 @@
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+
+class QueryCounter:
+    """execute_wrapper hook that counts queries and the time spent in them."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+
+# The request's counter. A context variable rather than a wrapper on this thread's connection, because
+# asgiref copies the context into the sync_to_async threads where the async ORM runs its queries on
+# their own connections.
+current_counter = ContextVar('query_counter', default=None)
+
+
+def count_query(execute, sql, params, many, context):
+    counter = current_counter.get()
+    if counter is None:
+        return execute(sql, params, many, context)
+    return counter(execute, sql, params, many, context)
+
+
+def install_query_counter(sender=None, connection=None, **kwargs):
+    """connection_created receiver: every connection, on every thread, reports to the current request's counter."""
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+
+class RequestMetricsMiddleware:
+    """
+    Records latency, SQL query count, SQL time and response size per resolved URL name,
+    adds a Server-Timing header and warns when a request goes over QUERY_BUDGET queries.
+    Streamed responses (exports, calendar feeds) are recorded once their body is exhausted, with
+    the queries run while streaming; their Server-Timing can only cover the time to the headers.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        counter = QueryCounter()
+        started = time.perf_counter()
+        with self.counting(counter):
+            response = self.get_response(request)
+        return self.finish(request, response, counter, started)
+
+    async def __acall__(self, request):
+        counter = QueryCounter()
+        started = time.perf_counter()
+        with self.counting(counter):
+            response = await self.get_response(request)
+        return self.finish(request, response, counter, started)
+
+    @contextmanager
+    def counting(self, counter):
+        for connection in connections.all(initialized_only=True):
+            install_query_counter(connection=connection)  # opened before the receiver was connected
+        token = current_counter.set(counter)
+        try:
+            yield
+        finally:
+            current_counter.reset(token)
+
+    def finish(self, request, response, counter, started):
+        match = getattr(request, 'resolver_match', None)
+        url_name = match.view_name if match and match.view_name else 'unresolved'
+        elapsed = time.perf_counter() - started
+        response['Server-Timing'] = (
+            f'app;dur={elapsed * 1000:.1f}, db;dur={counter.duration * 1000:.1f};desc="{counter.count} queries"'
+        )
+        if not response.streaming:
+            self.record(request, url_name, counter, elapsed, len(response.content))
+        elif response.is_async:
+            response.streaming_content = self.astream(response.streaming_content, request, url_name, counter, started)
+        else:
+            response.streaming_content = self.stream(response.streaming_content, request, url_name, counter, started)
+        return response
+
+    def stream(self, content, request, url_name, counter, started):
+        size = 0
+        chunks = iter(content)
+        try:
+            while True:
+                with self.counting(counter):
+                    chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                size += len(chunk)
+                yield chunk
+        finally:
+            self.record(request, url_name, counter, time.perf_counter() - started, size)
+
+    async def astream(self, content, request, url_name, counter, started):
+        size = 0
+        chunks = aiter(content)
+        try:
+            while True:
+                with self.counting(counter):
+                    chunk = await anext(chunks, None)
+                if chunk is None:
+                    break
+                size += len(chunk)
+                yield chunk
+        finally:
+            self.record(request, url_name, counter, time.perf_counter() - started, size)
+
+    def record(self, request, url_name, counter, elapsed, size):
+        registry.observe(
+            url_name,
+            http_request_duration_seconds=elapsed,
+            http_request_sql_queries=counter.count,
+            http_request_sql_duration_seconds=counter.duration,
+            http_response_size_bytes=size,
+        )
+        budget = getattr(settings, 'QUERY_BUDGET', 50)
+        if counter.count > budget:
+            logger.warning("%s ran %d SQL queries (budget %d) for %s", url_name, counter.count, budget, request.path)
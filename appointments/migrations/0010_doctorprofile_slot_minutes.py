@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0009_alter_appointment_patient'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doctorprofile',
+            name='slot_minutes',
+            field=models.PositiveIntegerField(default=120),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0012_emailoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doctorprofile',
+            name='profile_thumbnail',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='thumbnails/'),
+        ),
+        migrations.AddField(
+            model_name='doctorprofile',
+            name='thumbnail_source',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='patientprofile',
+            name='profile_thumbnail',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='thumbnails/'),
+        ),
+        migrations.AddField(
+            model_name='patientprofile',
+            name='thumbnail_source',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:15
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0013_profile_thumbnails'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='doctorprofile',
+            index=models.Index(fields=['specialization', 'consultation_fee', 'id'], name='doctor_spec_fee_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='doctorprofile',
+            index=models.Index(fields=['city', 'consultation_fee', 'id'], name='doctor_city_fee_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='doctorprofile',
+            index=models.Index(fields=['state'], name='doctor_state_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='doctorprofile',
+            index=models.Index(fields=['zipcode'], name='doctor_zipcode_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='doctorprofile',
+            index=models.Index(fields=['consultation_fee', 'id'], name='doctor_fee_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='doctorprofile',
+            index=models.Index(fields=['experience_years', 'id'], name='doctor_experience_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.db import DatabaseError, migrations, transaction
+
+FTS_TABLE = 'appointments_doctor_fts'
+
+
+def create_fts_table(apps, schema_editor):
+    # Only SQLite builds compiled with FTS5 get the table; everything else uses the Python index
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    try:
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+                "name, specialization, clinic_name, qualification, city, "
+                "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+            )
+    except DatabaseError:
+        return
+    doctors = apps.get_model('appointments', 'DoctorProfile')._meta.db_table
+    users = apps.get_model(settings.AUTH_USER_MODEL)._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, name, specialization, clinic_name, qualification, city) "
+            "SELECT d.id, u.first_name || ' ' || u.last_name, d.specialization, d.clinic_name, d.qualification, d.city "
+            f"FROM {doctors} d JOIN {users} u ON u.id = d.user_id"
+        )
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0014_doctor_search_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:37
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0016_revokedtoken'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeletedAppointment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('appointment_id', models.PositiveIntegerField()),
+                ('doctor_id', models.PositiveIntegerField()),
+                ('date', models.DateField()),
+                ('time', models.TimeField()),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='doctorprofile',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['doctor', 'updated_at'], name='appt_doctor_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deletedappointment',
+            index=models.Index(fields=['doctor_id', 'deleted_at'], name='deleted_appt_doctor_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deletedappointment',
+            index=models.Index(fields=['deleted_at'], name='deleted_appt_deleted_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:50
+
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0018_doctor_geocoding'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patientprofile',
+            index=models.Index(django.db.models.functions.text.Lower('first_name'), name='patient_first_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patientprofile',
+            index=models.Index(django.db.models.functions.text.Lower('last_name'), name='patient_last_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patientprofile',
+            index=models.Index(fields=['phone'], name='patient_phone_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0019_patient_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doctorprofile',
+            name='compiled_schedule',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.CreateModel(
+            name='ScheduleBlock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekday', models.PositiveSmallIntegerField(choices=[(0, 'Monday'), (1, 'Tuesday'), (2, 'Wednesday'), (3, 'Thursday'), (4, 'Friday'), (5, 'Saturday'), (6, 'Sunday')])),
+                ('start', models.TimeField()),
+                ('end', models.TimeField()),
+                ('slot_minutes', models.PositiveIntegerField(blank=True, null=True)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='schedule_blocks', to='appointments.doctorprofile')),
+            ],
+            options={
+                'ordering': ['weekday', 'start'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ScheduleException',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('start', models.TimeField(blank=True, null=True)),
+                ('end', models.TimeField(blank=True, null=True)),
+                ('slot_minutes', models.PositiveIntegerField(blank=True, null=True)),
+                ('reason', models.CharField(blank=True, max_length=100)),
+                ('doctor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='schedule_exceptions', to='appointments.doctorprofile')),
+            ],
+            options={
+                'ordering': ['date', 'start'],
+                'indexes': [models.Index(fields=['doctor', 'date'], name='schedule_exc_doctor_date_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0020_doctor_schedules'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySegmentStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('specialization', models.CharField(max_length=100)),
+                ('city', models.CharField(blank=True, max_length=100)),
+                ('appointments', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['specialization', 'date'], name='segment_spec_date_idx'), models.Index(fields=['city', 'date'], name='segment_city_date_idx')],
+                'unique_together': {('date', 'specialization', 'city')},
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('specialization', models.CharField(max_length=100)),
+                ('city', models.CharField(blank=True, max_length=100)),
+                ('appointments', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='appointments.doctorprofile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date'], name='stats_date_idx'), models.Index(fields=['specialization', 'date'], name='stats_spec_date_idx'), models.Index(fields=['city', 'date'], name='stats_city_date_idx')],
+                'unique_together': {('doctor', 'date')},
+            },
+        ),
+    ]
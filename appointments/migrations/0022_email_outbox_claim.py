@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0021_daily_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailoutbox',
+            name='claim',
+            field=models.UUIDField(blank=True, editable=False, null=True),
+        ),
+    ]
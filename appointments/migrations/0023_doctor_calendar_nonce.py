@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0022_email_outbox_claim'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doctorprofile',
+            name='calendar_nonce',
+            field=models.CharField(blank=True, editable=False, max_length=32),
+        ),
+    ]
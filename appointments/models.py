@@ -1,5 +1,6 @@
 # appointments/models.py
 from django.db import models
+from django.db.models.functions import Lower
 from django.contrib.auth.models import User
 from django.utils import timezone
 import datetime
@@ -10,6 +11,16 @@ GENDER_CHOICES = [
     ('O', 'Other'),
 ]
 
+WEEKDAY_CHOICES = [
+    (0, 'Monday'),
+    (1, 'Tuesday'),
+    (2, 'Wednesday'),
+    (3, 'Thursday'),
+    (4, 'Friday'),
+    (5, 'Saturday'),
+    (6, 'Sunday'),
+]
+
 class DoctorProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     
@@ -25,16 +36,80 @@ class DoctorProfile(models.Model):
 
     working_start = models.TimeField() 
     working_end = models.TimeField()    
+    slot_minutes = models.PositiveIntegerField(default=120)  # length of one bookable slot
     profile_image = models.ImageField(upload_to='doctor_images/', null=True, blank=True)
+    profile_thumbnail = models.ImageField(upload_to='thumbnails/', null=True, blank=True, editable=False)
+    thumbnail_source = models.CharField(max_length=255, blank=True, editable=False)  # profile_image name the thumbnail was made from
 
     qualification = models.CharField(max_length=255, blank=True)  
     experience_years = models.PositiveIntegerField(default=0)      
     consultation_fee = models.DecimalField(max_digits=8, decimal_places=2, default=0.00)  
+    updated_at = models.DateTimeField(auto_now=True)  # hours, slot length and address are in every calendar event
+    # Clinic coordinates, geocoded off the request path whenever the address changes; see appointments.geocoding
+    latitude = models.FloatField(null=True, blank=True, editable=False)
+    longitude = models.FloatField(null=True, blank=True, editable=False)
+    geo_cell = models.BigIntegerField(null=True, blank=True, editable=False)  # grid cell of (latitude, longitude)
+    geocoded_address = models.CharField(max_length=500, blank=True, editable=False)  # address the coordinates are for
+    # Weekly template, exceptions and holidays compiled for slot lookups; empty means working hours
+    # every day. Rebuilt whenever any of them changes, see appointments.schedules
+    compiled_schedule = models.TextField(blank=True, editable=False)
+    calendar_nonce = models.CharField(max_length=32, blank=True, editable=False)  # signed into the calendar feed token; reset to revoke it
+
+    class Meta:
+        # Doctor search: each equality filter leads an index ending in the keyset sort (fee, id)
+        indexes = [
+            models.Index(fields=['specialization', 'consultation_fee', 'id'], name='doctor_spec_fee_idx'),
+            models.Index(fields=['city', 'consultation_fee', 'id'], name='doctor_city_fee_idx'),
+            models.Index(fields=['state'], name='doctor_state_idx'),
+            models.Index(fields=['zipcode'], name='doctor_zipcode_idx'),
+            models.Index(fields=['consultation_fee', 'id'], name='doctor_fee_idx'),
+            models.Index(fields=['experience_years', 'id'], name='doctor_experience_idx'),
+            # Nearby search: cell ranges, with the coordinates in the index so distances need no table lookups
+            models.Index(fields=['geo_cell', 'latitude', 'longitude'], name='doctor_geo_cell_idx'),
+        ]
 
     def __str__(self):
         return f"Dr. {self.user.get_full_name()}" 
 
 
+class ScheduleBlock(models.Model):
+    # One stretch of a doctor's weekly template, cut into slot_minutes slots. Gaps between a day's
+    # blocks are breaks and a weekday without blocks is a day off; doctors with no blocks at all
+    # work working_start to working_end every day
+    doctor = models.ForeignKey(DoctorProfile, related_name='schedule_blocks', on_delete=models.CASCADE)
+    weekday = models.PositiveSmallIntegerField(choices=WEEKDAY_CHOICES)
+    start = models.TimeField()
+    end = models.TimeField()
+    slot_minutes = models.PositiveIntegerField(null=True, blank=True)  # the doctor's slot_minutes when empty
+
+    class Meta:
+        ordering = ['weekday', 'start']
+
+    def __str__(self):
+        return f"{self.get_weekday_display()} {self.start:%H:%M}-{self.end:%H:%M}"
+
+
+class ScheduleException(models.Model):
+    # Overrides the weekly template on one date. A row without hours closes the day: a day off, or a
+    # holiday for every doctor when no doctor is set. Rows with hours are that day's blocks instead
+    doctor = models.ForeignKey(DoctorProfile, related_name='schedule_exceptions', on_delete=models.CASCADE, null=True, blank=True)
+    date = models.DateField()
+    start = models.TimeField(null=True, blank=True)
+    end = models.TimeField(null=True, blank=True)
+    slot_minutes = models.PositiveIntegerField(null=True, blank=True)
+    reason = models.CharField(max_length=100, blank=True)
+
+    class Meta:
+        ordering = ['date', 'start']
+        indexes = [
+            models.Index(fields=['doctor', 'date'], name='schedule_exc_doctor_date_idx'),  # also holidays: doctor IS NULL
+        ]
+
+    def __str__(self):
+        hours = f"{self.start:%H:%M}-{self.end:%H:%M}" if self.start else "closed"
+        return f"{self.date} {hours}" + (f" ({self.reason})" if self.reason else "")
+
+
 class PatientProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     first_name = models.CharField(max_length=50)
@@ -43,6 +118,8 @@ class PatientProfile(models.Model):
     gender = models.CharField(max_length=10, choices=GENDER_CHOICES, blank=True)
     dob = models.DateField(null=True, blank=True)
     profile_image = models.ImageField(upload_to='patient_images/', blank=True, null=True)
+    profile_thumbnail = models.ImageField(upload_to='thumbnails/', null=True, blank=True, editable=False)
+    thumbnail_source = models.CharField(max_length=255, blank=True, editable=False)
 
     blood_group = models.CharField(max_length=5, blank=True, null=True)
     chronic_conditions = models.TextField(blank=True, null=True)
@@ -50,6 +127,14 @@ class PatientProfile(models.Model):
     current_medications = models.TextField(blank=True, null=True)
     emergency_contact = models.CharField(max_length=100, blank=True, null=True)
 
+    class Meta:
+        # Patient registry search: case-insensitive name prefixes and phone prefixes, see search.filter_patients
+        indexes = [
+            models.Index(Lower('first_name'), name='patient_first_name_idx'),
+            models.Index(Lower('last_name'), name='patient_last_name_idx'),
+            models.Index(fields=['phone'], name='patient_phone_idx'),
+        ]
+
     def __str__(self):
         return self.user.get_full_name()
     
@@ -60,9 +145,131 @@ class Appointment(models.Model):
     patient = models.ForeignKey(PatientProfile,related_name='appointments', on_delete=models.CASCADE)
     date = models.DateField(default=timezone.now)
     time = models.TimeField(default=datetime.time(9, 0)) # start time of the appointment slot
+    updated_at = models.DateTimeField(auto_now=True)  # calendar feed sync tokens compare against this
 
     class Meta:
-        unique_together = [('doctor', 'date', 'time')]  # no double-booking same doc/time
+        unique_together = [('doctor', 'date', 'time')]  # no double-booking same doc/time (also the doctor timeline index)
+        indexes = [
+            models.Index(fields=['doctor', 'updated_at'], name='appt_doctor_updated_idx'),  # calendar feed changes
+            models.Index(fields=['patient', 'date', 'time'], name='appt_patient_date_time_idx'),  # patient timeline
+            models.Index(fields=['date', 'time'], name='appt_date_time_idx'),  # staff listing ordered by date
+        ]
+
+    def __str__(self):
+        # Reads doctor__user and patient__user: select_related them when listing
+        doctor = f"Dr. {self.doctor.user.last_name}" if self.doctor_id else "no doctor"
+        return f"{self.date} {self.time:%H:%M} - {doctor} with {self.patient}"
+
+
+class DailyStats(models.Model):
+    # Appointments and revenue per doctor and day, so dashboards sum a row per doctor-day instead of
+    # reading every appointment. Recounted whenever an appointment on that day changes; see appointments.rollups
+    date = models.DateField()
+    doctor = models.ForeignKey(DoctorProfile, related_name='daily_stats', on_delete=models.CASCADE)
+    specialization = models.CharField(max_length=100)  # the doctor's, copied so grouping needs no join
+    city = models.CharField(max_length=100, blank=True)
+    appointments = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)  # appointments at the consultation fee
+
+    class Meta:
+        unique_together = [('doctor', 'date')]  # also the per-doctor range index
+        indexes = [
+            models.Index(fields=['date'], name='stats_date_idx'),
+            models.Index(fields=['specialization', 'date'], name='stats_spec_date_idx'),
+            models.Index(fields=['city', 'date'], name='stats_city_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} doctor {self.doctor_id}: {self.appointments}"
+
+
+class DailySegmentStats(models.Model):
+    # DailyStats summed over the doctors of each specialization and city: a handful of rows per day
+    # for dashboards that don't ask about individual doctors
+    date = models.DateField()
+    specialization = models.CharField(max_length=100)
+    city = models.CharField(max_length=100, blank=True)
+    appointments = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = [('date', 'specialization', 'city')]  # also the range index
+        indexes = [
+            models.Index(fields=['specialization', 'date'], name='segment_spec_date_idx'),
+            models.Index(fields=['city', 'date'], name='segment_city_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.specialization} in {self.city or 'anywhere'}: {self.appointments}"
+
+
+class DeletedAppointment(models.Model):
+    # Left behind when an appointment is deleted or moved to another doctor, so calendar feeds can tell
+    # clients that already synced it to drop it. Pruned after CALENDAR_SYNC_WINDOW; see appointments.ics
+    appointment_id = models.PositiveIntegerField()
+    doctor_id = models.PositiveIntegerField()  # not a foreign key: rows outlive a deleted doctor until pruned
+    date = models.DateField()
+    time = models.TimeField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['doctor_id', 'deleted_at'], name='deleted_appt_doctor_idx'),
+            models.Index(fields=['deleted_at'], name='deleted_appt_deleted_idx'),
+        ]
+
+    def __str__(self):
+        return f"Appointment {self.appointment_id} (deleted {self.deleted_at:%Y-%m-%d %H:%M})"
+
+
+class GeocodedAddress(models.Model):
+    # Persistent geocoder cache: every distinct clinic address is looked up once. No coordinates
+    # means the geocoder found nothing for it
+    address = models.CharField(max_length=500, unique=True)  # normalized, see geocoding.normalize
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    geocoded_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.address} ({self.latitude}, {self.longitude})"
+
+
+class EmailOutbox(models.Model):
+    # Outgoing mail is queued here and delivered by the send_notifications worker
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    to = models.TextField()  # comma-separated recipients
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    claim = models.UUIDField(null=True, blank=True, editable=False)  # the worker batch that last leased it
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_status_next_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {self.to} ({self.status})"
+
+
+class RevokedToken(models.Model):
+    # Refresh tokens revoked before they expire (rotated or logged out). Only the jti and expiry are
+    # kept, and rows are pruned once the token would have expired anyway; see appointments.revocation
+    jti = models.CharField(max_length=64, primary_key=True)
+    expires_at = models.DateTimeField(db_index=True)
 
     def __str__(self):
-        return f"{self.date} {self.time} - Dr.{self.doctor.user.last_name} with {self.patient.username}"
\ No newline at end of file
+        return f"{self.jti} (until {self.expires_at:%Y-%m-%d %H:%M})"
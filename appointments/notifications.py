@@ -0,0 +1,102 @@
+import datetime
+import logging
+import uuid
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection, transaction
+from django.utils import timezone
+from .models import EmailOutbox
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = getattr(settings, 'NOTIFICATION_BATCH_SIZE', 100)
+MAX_ATTEMPTS = getattr(settings, 'NOTIFICATION_MAX_ATTEMPTS', 5)
+RETRY_DELAY = getattr(settings, 'NOTIFICATION_RETRY_DELAY', datetime.timedelta(minutes=1))
+# How long a claimed message stays out of other workers' reach. Renewed right before each send, so
+# it has to outlast one SMTP send rather than a whole batch
+LEASE = getattr(settings, 'NOTIFICATION_LEASE', datetime.timedelta(minutes=5))
+
+
+def queue_email(subject, body, recipients):
+    """Store a message in the outbox. Nothing is sent on the request path."""
+    recipients = [address for address in recipients if address]
+    if not recipients:
+        return None
+    return EmailOutbox.objects.create(subject=subject, body=body, to=','.join(recipients))
+
+
+def claim_batch(batch_size=BATCH_SIZE):
+    """Due pending messages, pushed out of reach of other workers while this one sends them."""
+    now = timezone.now()
+    claim = uuid.uuid4()
+    due = EmailOutbox.objects.filter(status=EmailOutbox.PENDING, next_attempt_at__lte=now)
+    with transaction.atomic():
+        candidates = due.order_by('next_attempt_at')
+        if connection.features.has_select_for_update_skip_locked:
+            candidates = candidates.select_for_update(skip_locked=True)  # rows another worker is claiming
+        ids = list(candidates.values_list('id', flat=True)[:batch_size])
+        # Lease the rows: a crashed worker's batch becomes due again once the lease runs out. Only rows
+        # still due are taken, so one leased by another worker since the read above stays theirs
+        due.filter(id__in=ids).update(next_attempt_at=now + LEASE, claim=claim)
+    return list(EmailOutbox.objects.filter(id__in=ids, claim=claim).order_by('id'))
+
+
+def send_pending(batch_size=BATCH_SIZE):
+    """Send one batch over a single SMTP connection. Returns (sent, failed) counts."""
+    batch = claim_batch(batch_size)
+    if not batch:
+        return 0, 0
+
+    sent = failed = 0
+    done = set()
+    connection = get_connection()
+    try:
+        connection.open()
+        for item in batch:
+            message = EmailMessage(item.subject, item.body, to=item.to.split(','), connection=connection)
+            done.add(item.id)
+            if not renew_lease(item):
+                continue  # the lease ran out while earlier messages were sent and another worker took it
+            try:
+                message.send()
+            except Exception as exc:
+                failed += 1
+                mark_failed(item, exc)
+            else:
+                sent += 1
+                item.status = EmailOutbox.SENT
+                item.sent_at = timezone.now()
+                item.attempts += 1
+                _save_claimed(item, ['status', 'sent_at', 'attempts'])
+    except Exception as exc:
+        # Could not even connect: every unsent message in the batch is retried later
+        logger.warning("Email connection failed: %s", exc)
+        for item in batch:
+            if item.id not in done:
+                failed += 1
+                mark_failed(item, exc)
+    finally:
+        connection.close()
+    return sent, failed
+
+
+def renew_lease(item):
+    """Extend the lease on a claimed message. False when another worker has claimed it since."""
+    leased = EmailOutbox.objects.filter(id=item.id, claim=item.claim, status=EmailOutbox.PENDING)
+    return leased.update(next_attempt_at=timezone.now() + LEASE) == 1
+
+
+def _save_claimed(item, fields):
+    # Conditional on the claim, so a worker whose lease ran out never overwrites the new holder's result
+    EmailOutbox.objects.filter(id=item.id, claim=item.claim).update(**{field: getattr(item, field) for field in fields})
+
+
+def mark_failed(item, exc):
+    item.attempts += 1
+    item.last_error = str(exc)
+    if item.attempts >= MAX_ATTEMPTS:
+        item.status = EmailOutbox.FAILED
+    else:
+        # Exponential backoff between retries
+        item.next_attempt_at = timezone.now() + RETRY_DELAY * (2 ** (item.attempts - 1))
+    _save_claimed(item, ['attempts', 'last_error', 'status', 'next_attempt_at'])
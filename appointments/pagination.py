@@ -0,0 +1,89 @@
+import base64
+import bisect
+import json
+import math
+from decimal import Decimal
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class DoctorDirectoryPagination(CursorPagination):
+    # Cursor (keyset) pagination over the doctor directory, stable under inserts
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering = 'id'
+
+
+class PatientListPagination(CursorPagination):
+    # Keyset pagination over the patient registry: each page is one primary-key range scan
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering = 'id'
+
+
+class KeysetPagination:
+    """
+    Keyset pagination on (sort value, id) for orderings DRF's CursorPagination can't express
+    without offsets. The cursor is the last row's key, so each page is one index range scan.
+    """
+    cursor_query_param = 'cursor'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+    def __init__(self, request, value_type=str):
+        self.request = request
+        self.value_type = value_type  # what the sort values are; a cursor's must convert to it
+        try:
+            self.page_size = min(int(request.query_params.get(self.page_size_query_param, self.page_size)), self.max_page_size)
+        except ValueError:
+            pass
+        self.page_size = max(self.page_size, 1)
+        self.after = self.decode(request.query_params.get(self.cursor_query_param))
+
+    def decode(self, cursor):
+        if not cursor:
+            return None
+        try:
+            key = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        except (TypeError, ValueError):
+            raise NotFound('Invalid cursor')
+        # Hand-made cursors reach the ORM and Python comparisons with the page's real keys
+        if not isinstance(key, list) or len(key) != 2 or type(key[1]) is not int or type(key[0]) not in (str, int, float):
+            raise NotFound('Invalid cursor')
+        try:
+            value = self.value_type(key[0])
+        except (ValueError, ArithmeticError):
+            raise NotFound('Invalid cursor')
+        if isinstance(value, (float, Decimal)) and not math.isfinite(value):
+            raise NotFound('Invalid cursor')
+        return value, key[1]
+
+    def encode(self, value, pk):
+        return base64.urlsafe_b64encode(json.dumps([value, pk], default=str).encode()).decode()
+
+    def filter_queryset(self, queryset, field, descending=False):
+        """Rows after the cursor in (field, id) order, limited to one page plus a look-ahead row."""
+        order = [f'-{field}', '-id'] if descending else [field, 'id']
+        if self.after is not None:
+            value, pk = self.after
+            op = 'lt' if descending else 'gt'
+            queryset = queryset.filter(Q(**{f'{field}__{op}': value}) | Q(**{field: value, f'id__{op}': pk}))
+        return list(queryset.order_by(*order)[:self.page_size + 1])
+
+    def paginate_sorted(self, keys):
+        """Same as filter_queryset for (value, id) keys already sorted in Python."""
+        start = bisect.bisect_right(keys, tuple(self.after)) if self.after is not None else 0
+        return keys[start:start + self.page_size + 1]
+
+    def get_paginated_response(self, data, has_next, last_key):
+        next_url = None
+        if has_next:
+            url = self.request.build_absolute_uri()
+            next_url = replace_query_param(url, self.cursor_query_param, self.encode(*last_key))
+        return Response({'next': next_url, 'previous': None, 'results': data})
@@ -0,0 +1,26 @@
+from .caching import get_cache
+
+# Tables that only keep rows until a cutoff (revoked tokens until they expire, calendar deletions
+# until sync tokens that old are refused) are trimmed in batches, each a short range delete on the
+# cutoff column's index, so a large backlog never holds one long write lock.
+
+
+def prune_before(queryset, field, cutoff, batch_size, max_batches=None):
+    """Delete the queryset's rows whose `field` is before `cutoff`, oldest first, in batches. Returns the count."""
+    pk = queryset.model._meta.pk.name
+    expired = queryset.filter(**{f'{field}__lt': cutoff}).order_by(field).values(pk)
+    deleted = batches = 0
+    while max_batches is None or batches < max_batches:
+        count, _ = queryset.model._default_manager.filter(pk__in=expired[:batch_size]).delete()
+        deleted += count
+        batches += 1
+        if count < batch_size:
+            break
+    return deleted
+
+
+def maybe_prune(key, interval, prune):
+    # At most once per interval across everything sharing the cache, and one bounded batch so a
+    # request never pays for a large backlog; the prune_* commands clear any backlog.
+    if get_cache().add(key, True, interval):
+        prune(max_batches=1)
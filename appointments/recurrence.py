@@ -0,0 +1,76 @@
+import datetime
+from django.db import IntegrityError, transaction
+from . import caching, conditional, rollups
+from .availability import day_free, group_booked
+from .schedules import schedule_for
+from .exceptions import SeriesUnavailable
+from .models import Appointment
+
+MAX_OCCURRENCES = 52  # a year of weekly visits
+PARTIAL_RETRIES = 3  # inserts a partial series retries after losing a date to a concurrent booking
+
+
+def series_dates(start, count, every_weeks=1):
+    """`count` dates `every_weeks` apart, starting on `start` (so on its weekday). Raises ValueError."""
+    step = datetime.timedelta(weeks=every_weeks)
+    try:
+        start + step * (count - 1)
+    except OverflowError:
+        raise ValueError("The series would end after the last date that can be booked.")
+    return [start + step * i for i in range(count)]
+
+
+def taken_dates(doctor_id, dates, time):
+    """Dates on which the doctor's slot at `time` is already booked, loaded with one query."""
+    return set(
+        Appointment.objects.filter(doctor_id=doctor_id, date__in=dates, time=time).values_list('date', flat=True)
+    )
+
+
+def conflict_report(doctor, dates, time):
+    """One entry per taken date, with the slots still free that day, from a single query."""
+    booked = group_booked(
+        Appointment.objects.filter(doctor_id=doctor.id, date__in=dates).values_list('doctor_id', 'date', 'time')
+    )
+    schedule = schedule_for(doctor)
+    return [
+        {
+            'date': day.isoformat(),
+            'time': time.strftime("%H:%M"),
+            'available_slots': [
+                slot.strftime("%H:%M") for slot in day_free(schedule.day(day), booked.get((doctor.id, day)))
+            ],
+        }
+        for day in sorted(dates)
+    ]
+
+
+def book_series(doctor, patient_id, dates, time, partial=False):
+    """
+    Book the doctor's slot at `time` on every date for one patient, in one transaction.
+    All or nothing unless `partial`, in which case taken dates are skipped and reported.
+    Returns (appointments, conflicts) or raises SeriesUnavailable with the per-date report.
+    """
+    for attempt in range(PARTIAL_RETRIES + 1):
+        try:
+            with transaction.atomic():
+                taken = taken_dates(doctor.id, dates, time)
+                free = [day for day in dates if day not in taken]
+                if not free or (taken and not partial):
+                    raise SeriesUnavailable(conflict_report(doctor, taken, time))
+                appointments = Appointment.objects.bulk_create([
+                    Appointment(doctor=doctor, patient_id=patient_id, date=day, time=time) for day in free
+                ])
+            break
+        except IntegrityError:
+            # A concurrent booking took one of the dates between the check and the insert. A partial
+            # series re-reads what is taken and books the rest
+            if not partial or attempt == PARTIAL_RETRIES:
+                raise SeriesUnavailable(conflict_report(doctor, taken_dates(doctor.id, dates, time), time))
+
+    # bulk_create sends no signals
+    transaction.on_commit(lambda: caching.invalidate_timelines([doctor.id], [patient_id]))
+    transaction.on_commit(lambda: conditional.bump_versions('appointments'))
+    transaction.on_commit(lambda: rollups.refresh([(doctor.id, appointment.date) for appointment in appointments]))
+    conflicts = conflict_report(doctor, taken, time) if taken else []
+    return appointments, conflicts
@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.utils import timezone
+from . import pruning
+from .caching import get_cache
+from .models import RevokedToken
+
+# Revoked refresh-token ids. A revocation is written to the database and cached until the token's
+# own expiry; lookups hit the cache first and fall back to a primary-key probe. An expired token
+# fails verification on its own, so its row is only kept until the next prune.
+
+CACHE_PREFIX = 'revoked:'
+PRUNE_KEY = 'revoked:pruned'
+PRUNE_INTERVAL = getattr(settings, 'TOKEN_REVOCATION_PRUNE_INTERVAL', 3600)  # seconds between automatic prunes
+PRUNE_BATCH_SIZE = 5000
+
+
+def _key(jti):
+    return f'{CACHE_PREFIX}{jti}'
+
+
+def revoke(jti, expires_at):
+    remaining = (expires_at - timezone.now()).total_seconds()
+    if remaining <= 0:
+        return
+    RevokedToken.objects.bulk_create([RevokedToken(jti=jti, expires_at=expires_at)], ignore_conflicts=True)
+    get_cache().set(_key(jti), True, int(remaining) + 1)
+    maybe_prune()
+
+
+def is_revoked(jti):
+    if get_cache().get(_key(jti)):
+        return True
+    # Cache evicted or per-process: the database is authoritative
+    return RevokedToken.objects.filter(jti=jti).exists()
+
+
+def prune(now=None, batch_size=PRUNE_BATCH_SIZE, max_batches=None):
+    """Delete rows of expired tokens in batches. Returns the count."""
+    return pruning.prune_before(RevokedToken.objects.all(), 'expires_at', now or timezone.now(), batch_size, max_batches)
+
+
+def maybe_prune():
+    pruning.maybe_prune(PRUNE_KEY, PRUNE_INTERVAL, prune)
+
+
+def stats():
+    now = timezone.now()
+    return {
+        'revoked': RevokedToken.objects.filter(expires_at__gte=now).count(),
+        'expired': RevokedToken.objects.filter(expires_at__lt=now).count(),
+    }
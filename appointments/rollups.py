@@ -0,0 +1,265 @@
+import datetime
+from collections import defaultdict
+from django.db import connection, transaction
+from django.db.models import Count, DecimalField, Exists, ExpressionWrapper, F, OuterRef, Q, Sum
+from django.utils import timezone
+from .models import Appointment, DailySegmentStats, DailyStats, DoctorProfile
+from .schedules import schedule_for
+
+# Dashboards read two rollup levels instead of appointments: DailyStats, one row per doctor and day
+# with bookings, and DailySegmentStats, those summed per specialization and city. Queries that don't
+# name doctors use the segment level, whose size depends on the days asked about rather than on how
+# many appointments or doctors there are. A change recounts just the doctor-days it touched (from
+# the unique (doctor, date, time) index) and re-sums their segments; rebuild() recomputes a range for
+# data written behind the signals' back.
+
+REBUILD_BATCH_SIZE = 5000
+MAX_RANGE_DAYS = 3660  # ten years
+DEFAULT_DAYS = 30
+DEFAULT_LIMIT = 100
+MAX_DOCTORS = 50  # utilization counts every slot of every doctor asked about
+# SQLite has no native date truncation, so days are summed in SQL and folded into months or years here
+PERIODS = {
+    'day': lambda day: day,
+    'month': lambda day: day.replace(day=1),
+    'year': lambda day: day.replace(month=1, day=1),
+}
+CATEGORIES = {'doctor': 'doctor_id', 'specialization': 'specialization', 'city': 'city'}
+GROUPS = [*PERIODS, *CATEGORIES]
+
+
+def to_date(value):
+    # Appointment.date defaults to timezone.now, so an instance may hold a datetime until reloaded
+    return Appointment._meta.get_field('date').to_python(value)
+
+
+def upsert(model, select, fields, unique):
+    """
+    INSERT INTO model's table (fields) from a queryset's rows, updating the ones already there. The
+    recount and the write are one statement, so a concurrent refresh can't slip between them.
+    """
+    quote = connection.ops.quote_name
+    columns = [model._meta.get_field(field).column for field in fields]
+    conflict = [model._meta.get_field(field).column for field in unique]
+    sql, params = select.query.sql_with_params()
+    updates = ', '.join(f'{quote(column)} = excluded.{quote(column)}' for column in columns if column not in conflict)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {quote(model._meta.db_table)} ({", ".join(map(quote, columns))}) {sql} '
+            f'ON CONFLICT ({", ".join(map(quote, conflict))}) DO UPDATE SET {updates}',
+            params,
+        )
+
+
+def refresh_segments(days, segments):
+    """Re-sum the segment rows of every given day and (specialization, city) from DailyStats."""
+    if not days or not segments:
+        return
+    match = Q()
+    for specialization, city in set(segments):
+        match |= Q(specialization=specialization, city=city)
+    days = set(days)
+    sums = (
+        DailyStats.objects.filter(match, date__in=days)
+        .values('date', 'specialization', 'city')
+        .annotate(total=Sum('appointments'), earned=Sum('revenue')).order_by()
+    )
+    counted = DailyStats.objects.filter(date=OuterRef('date'), specialization=OuterRef('specialization'), city=OuterRef('city'))
+    with transaction.atomic():
+        upsert(DailySegmentStats, sums, ['date', 'specialization', 'city', 'appointments', 'revenue'], ['date', 'specialization', 'city'])
+        DailySegmentStats.objects.filter(match, date__in=days).exclude(Exists(counted)).delete()
+
+
+def refresh(keys):
+    """Recount the rollups of the given (doctor_id, date) pairs: one upsert from a grouped count, then their segments."""
+    keys = {(doctor_id, to_date(day)) for doctor_id, day in keys if doctor_id}
+    if not keys:
+        return
+    doctor_ids = {doctor_id for doctor_id, _ in keys}
+    # Every (doctor, day) of the cross product, which recounts a few extra rows correctly
+    rows = {'doctor_id__in': doctor_ids, 'date__in': {day for _, day in keys}}
+    counts = (
+        Appointment.objects.filter(**rows)
+        .values('date', 'doctor_id', 'doctor__specialization', 'doctor__city')
+        .annotate(count=Count('id'), earned=ExpressionWrapper(Count('id') * F('doctor__consultation_fee'), output_field=DecimalField()))
+        .order_by()
+    )
+    booked = Appointment.objects.filter(doctor_id=OuterRef('doctor_id'), date=OuterRef('date'))
+    with transaction.atomic():
+        if connection.features.has_select_for_update:
+            # Refreshes of one doctor then run one after another, the last counting every appointment
+            # committed before it. SQLite serializes writers anyway, and a read here would make this
+            # transaction upgrade its lock, which fails under a concurrent writer
+            list(DoctorProfile.objects.select_for_update().filter(id__in=doctor_ids).values_list('id'))
+        upsert(DailyStats, counts, ['date', 'doctor', 'specialization', 'city', 'appointments', 'revenue'], ['doctor', 'date'])
+        DailyStats.objects.filter(**rows).exclude(Exists(booked)).delete()
+        # A deleted doctor has no rows left to count and no segments here: see signals
+        doctors = DoctorProfile.objects.filter(id__in=doctor_ids).values_list('id', 'specialization', 'city')
+        refresh_segments({day for _, day in keys}, {(specialization, city) for _, specialization, city in doctors})
+
+
+def doctor_segments(doctor_id):
+    """(days, segments) the doctor's rollups count towards; read before the doctor is deleted."""
+    rows = list(DailyStats.objects.filter(doctor_id=doctor_id).values_list('date', 'specialization', 'city'))
+    return {day for day, _, _ in rows}, {(specialization, city) for _, specialization, city in rows}
+
+
+def update_doctor(doctor_id):
+    """Carry a profile change (specialization, city or fee) into the doctor's rollups and the segments they move between."""
+    doctor = DoctorProfile.objects.filter(pk=doctor_id).only('specialization', 'city', 'consultation_fee').first()
+    if doctor is None:
+        return
+    current = {'specialization': doctor.specialization, 'city': doctor.city, 'revenue': F('appointments') * doctor.consultation_fee}
+    stale = DailyStats.objects.filter(doctor_id=doctor_id).exclude(**current)
+    rows = list(stale.values_list('date', 'specialization', 'city'))
+    if not rows:
+        return  # nothing the rollups copy changed
+    with transaction.atomic():
+        stale.update(**current)
+        segments = {(specialization, city) for _, specialization, city in rows} | {(doctor.specialization, doctor.city)}
+        refresh_segments({day for day, _, _ in rows}, segments)
+
+
+def rebuild(start=None, end=None, batch_size=REBUILD_BATCH_SIZE):
+    """Recompute both levels between start and end (inclusive, either may be open) from Appointment. Returns the DailyStats row count."""
+    appointments = Appointment.objects.exclude(doctor=None)
+    stats = DailyStats.objects.all()
+    segments = DailySegmentStats.objects.all()
+    if start is not None:
+        appointments, stats, segments = appointments.filter(date__gte=start), stats.filter(date__gte=start), segments.filter(date__gte=start)
+    if end is not None:
+        appointments, stats, segments = appointments.filter(date__lte=end), stats.filter(date__lte=end), segments.filter(date__lte=end)
+    grouped = appointments.values(
+        'doctor_id', 'date', 'doctor__specialization', 'doctor__city', 'doctor__consultation_fee',
+    ).annotate(count=Count('id')).order_by()
+    created = 0
+    with transaction.atomic():
+        stats.delete()
+        segments.delete()
+        batch = []
+        for row in grouped.iterator(chunk_size=batch_size):
+            batch.append(DailyStats(
+                date=row['date'], doctor_id=row['doctor_id'], specialization=row['doctor__specialization'],
+                city=row['doctor__city'], appointments=row['count'], revenue=row['count'] * row['doctor__consultation_fee'],
+            ))
+            if len(batch) >= batch_size:
+                created += len(DailyStats.objects.bulk_create(batch))
+                batch = []
+        created += len(DailyStats.objects.bulk_create(batch))
+
+        sums = stats.values('date', 'specialization', 'city').annotate(total=Sum('appointments'), earned=Sum('revenue')).order_by()
+        batch = []
+        for row in sums.iterator(chunk_size=batch_size):
+            batch.append(DailySegmentStats(
+                date=row['date'], specialization=row['specialization'], city=row['city'],
+                appointments=row['total'], revenue=row['earned'],
+            ))
+            if len(batch) >= batch_size:
+                DailySegmentStats.objects.bulk_create(batch)
+                batch = []
+        DailySegmentStats.objects.bulk_create(batch)
+    return created
+
+
+def parse_stats_query(params):
+    """
+    Validate ?start=&end= (default: the last DEFAULT_DAYS days) [&group_by=] [&limit=] and the
+    specialization, city and doctor=<id>[,<id>...] filters.
+    Returns (start, end, group_by, filters, limit) or raises ValueError with a client-facing message.
+    """
+    try:
+        end = datetime.date.fromisoformat(params['end']) if params.get('end') else timezone.localdate()
+        if params.get('start'):
+            start = datetime.date.fromisoformat(params['start'])
+        else:
+            # Clamped to date.min, where end - DEFAULT_DAYS would overflow
+            start = end - datetime.timedelta(days=min(DEFAULT_DAYS - 1, (end - datetime.date.min).days))
+    except ValueError:
+        raise ValueError("Invalid date format, use YYYY-MM-DD")
+    if end < start or (end - start).days >= MAX_RANGE_DAYS:
+        raise ValueError(f"Date range must span 1 to {MAX_RANGE_DAYS} days")
+    group_by = params.get('group_by', 'day')
+    if group_by not in GROUPS:
+        raise ValueError(f"group_by must be one of {', '.join(GROUPS)}")
+    filters = {}
+    for field in ('specialization', 'city'):
+        if params.get(field):
+            filters[field] = params[field]
+    if params.get('doctor'):
+        try:
+            filters['doctor_id__in'] = [int(value) for value in params['doctor'].split(',')]
+        except ValueError:
+            raise ValueError("Invalid doctor id")
+        if len(filters['doctor_id__in']) > MAX_DOCTORS:
+            raise ValueError(f"At most {MAX_DOCTORS} doctors")
+    try:
+        limit = int(params.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise ValueError("Invalid number")
+    if not 1 <= limit <= 1000:
+        raise ValueError("limit must be 1 to 1000")
+    return start, end, group_by, filters, limit
+
+
+def capacity(doctor_ids, start, end, group_by):
+    """
+    Bookable slots of the given doctors per group, counted from their compiled schedules (the
+    current ones, also for past days): a bit count per doctor and day.
+    """
+    doctors = DoctorProfile.objects.filter(id__in=doctor_ids).only(
+        'working_start', 'working_end', 'slot_minutes', 'compiled_schedule', 'specialization', 'city',
+    )
+    slots = defaultdict(int)
+    days = [start + datetime.timedelta(days=offset) for offset in range((end - start).days + 1)]
+    for doctor in doctors:
+        schedule = schedule_for(doctor)
+        for day in days:
+            key = PERIODS[group_by](day) if group_by in PERIODS else getattr(doctor, CATEGORIES[group_by])
+            slots[key] += schedule.day(day).starts.bit_count()
+    return slots
+
+
+def summary(appointments, revenue, slots=None):
+    result = {'appointments': appointments or 0, 'revenue': f'{revenue or 0:.2f}'}
+    if slots is not None:
+        result['slots'] = slots
+        result['utilization'] = round((appointments or 0) / slots, 4) if slots else None
+    return result
+
+
+def stats(start, end, group_by='day', filters=None, limit=DEFAULT_LIMIT):
+    """
+    Totals and per-group sums. Periods are in date order; doctor, specialization and city groups
+    are the `limit` busiest. With a doctor filter, each entry also has the doctors' slot count and
+    the share of it booked.
+    """
+    filters = filters or {}
+    per_doctor = group_by == 'doctor' or 'doctor_id__in' in filters
+    rows = (DailyStats if per_doctor else DailySegmentStats).objects.filter(date__range=(start, end), **filters)
+    if group_by in CATEGORIES:
+        field = CATEGORIES[group_by]
+        totals = rows.aggregate(total=Sum('appointments'), earned=Sum('revenue'))
+        grouped = rows.values(field).annotate(total=Sum('appointments'), earned=Sum('revenue')).order_by('-total', field)[:limit]
+        groups = [(row[field], row['total'], row['earned']) for row in grouped]
+    else:
+        period = PERIODS[group_by]
+        sums = {}
+        for row in rows.values('date').annotate(total=Sum('appointments'), earned=Sum('revenue')).order_by('date'):
+            count, revenue = sums.get(period(row['date']), (0, 0))
+            sums[period(row['date'])] = (count + row['total'], revenue + row['earned'])
+        groups = [(key, count, revenue) for key, (count, revenue) in sums.items()]
+        totals = {'total': sum(count for _, count, _ in groups), 'earned': sum(revenue for _, _, revenue in groups)}
+    slots = capacity(filters['doctor_id__in'], start, end, group_by) if 'doctor_id__in' in filters else None
+    return {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'group_by': group_by,
+        'totals': summary(totals['total'], totals['earned'], None if slots is None else sum(slots.values())),
+        'results': [
+            {
+                group_by: key.isoformat() if isinstance(key, datetime.date) else key,
+                **summary(count, revenue, None if slots is None else slots.get(key, 0)),
+            }
+            for key, count, revenue in groups
+        ],
+    }
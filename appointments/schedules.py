@@ -0,0 +1,210 @@
+import datetime
+import json
+from collections import defaultdict
+from functools import lru_cache
+from django.db import transaction
+from django.utils import timezone
+from . import conditional
+from .models import DoctorProfile, ScheduleBlock, ScheduleException
+
+# A doctor's weekly template (ScheduleBlock rows), date exceptions and the clinic holidays
+# (ScheduleException rows) are compiled into DoctorProfile.compiled_schedule whenever one of them
+# changes, so reading a schedule costs no queries. Each day of it becomes a DayPlan: bitmaps over
+# GRANULARITY-minute cells of where slots start and which cells each slot covers. Free slots and
+# booking validation are then bit operations against the booked times rather than datetime loops.
+
+GRANULARITY = 5  # minutes; slot starts, block edges and slot lengths are multiples of it
+CELLS = 24 * 60 // GRANULARITY
+TIMES = tuple(datetime.time(cell * GRANULARITY // 60, cell * GRANULARITY % 60) for cell in range(CELLS))
+
+
+def minutes(time):
+    return time.hour * 60 + time.minute
+
+
+def cell_of(time):
+    """The cell a time starts, or None when it is off the GRANULARITY grid."""
+    if time.second or time.microsecond or time.minute % GRANULARITY:
+        return None
+    return minutes(time) // GRANULARITY
+
+
+def clock(total_minutes):
+    return datetime.time(total_minutes // 60, total_minutes % 60)
+
+
+class DayPlan:
+    """
+    One day's slots, built from (start, end, slot length) blocks in minutes. `starts` has a bit for
+    every cell a slot starts at and `masks` maps each of those cells to the cells its slot covers.
+    """
+
+    def __init__(self, blocks):
+        self.blocks = blocks
+        self.starts = covered = 0
+        self.masks = {}
+        for start, end, length in blocks:
+            width = length // GRANULARITY
+            cell = -(-start // GRANULARITY)
+            while width and (cell + width) * GRANULARITY <= end:
+                mask = ((1 << width) - 1) << cell
+                if not mask & covered:  # overlapping blocks: the earlier slot wins
+                    self.masks[cell] = mask
+                    self.starts |= 1 << cell
+                    covered |= mask
+                cell += width
+        self.covered = covered
+        self.slots = tuple(sorted(self.masks.items()))
+        self.times = tuple(TIMES[cell] for cell, _ in self.slots)
+
+    def is_slot(self, time):
+        cell = cell_of(time)
+        return cell is not None and bool(self.starts >> cell & 1)
+
+    def occupied(self, times):
+        """Cells covered by appointments at `times`; one that starts no slot covers its own cell."""
+        mask = 0
+        masks = self.masks
+        for time in times:
+            cell = (time.hour * 60 + time.minute) // GRANULARITY
+            mask |= masks.get(cell) or 1 << cell
+        return mask
+
+    def free(self, occupied=0):
+        """Start times of the slots clear of `occupied`; the plan's own tuple when nothing is booked."""
+        if not occupied & self.covered:
+            return self.times
+        return [TIMES[cell] for cell, mask in self.slots if not mask & occupied]
+
+    def slot_minutes(self, time):
+        mask = self.masks.get(cell_of(time))
+        return mask.bit_count() * GRANULARITY if mask else None
+
+
+@lru_cache(maxsize=4096)
+def day_plan(blocks):
+    # Shared by every day and doctor with the same blocks
+    return DayPlan(blocks)
+
+
+CLOSED = day_plan(())
+
+
+class Schedule:
+    def __init__(self, week, dates, weekly):
+        self.week = week  # seven DayPlans, Monday first
+        self.dates = dates  # {date: DayPlan} where an exception or holiday replaces the week
+        self.weekly = weekly  # False: working hours every day
+
+    def day(self, date):
+        plan = self.dates.get(date)
+        return self.week[date.weekday()] if plan is None else plan
+
+
+@lru_cache(maxsize=1024)
+def _load(compiled, working_start, working_end, slot_minutes):
+    data = json.loads(compiled) if compiled else {}
+
+    def plan(blocks):
+        return day_plan(tuple((start, end, length or slot_minutes) for start, end, length in blocks))
+
+    if data.get('week') is None:
+        week = (day_plan(((minutes(working_start), minutes(working_end), slot_minutes),)),) * 7
+    else:
+        week = tuple(plan(blocks) for blocks in data['week'])
+    dates = {datetime.date.fromisoformat(day): plan(blocks) for day, blocks in data.get('dates', {}).items()}
+    return Schedule(week, dates, data.get('week') is not None)
+
+
+def schedule_for(doctor):
+    return _load(doctor.compiled_schedule, doctor.working_start, doctor.working_end, doctor.slot_minutes)
+
+
+def compile_schedule(blocks, exceptions, holidays):
+    """
+    compiled_schedule for one doctor from (weekday, start, end, slot_minutes) template rows,
+    (date, start, end, slot_minutes) exception rows and holiday dates. The doctor's own exceptions
+    win over holidays, and a day off wins over hours given for the same date.
+    """
+    week = None
+    if blocks:
+        week = [[] for _ in range(7)]
+        for weekday, start, end, length in sorted(blocks):
+            week[weekday].append([minutes(start), minutes(end), length])
+    dates = {day.isoformat(): [] for day in holidays}
+    own = defaultdict(list)
+    for day, start, end, length in exceptions:
+        own[day].append(None if start is None else [minutes(start), minutes(end), length])
+    for day, entries in own.items():
+        dates[day.isoformat()] = [] if None in entries else sorted(entries)
+    if week is None and not dates:
+        return ''
+    return json.dumps({'week': week, 'dates': dates}, separators=(',', ':'), sort_keys=True)
+
+
+def compile_schedules(doctor_ids=None):
+    """
+    Recompile the schedules of the given doctors, or of every doctor (a holiday changed). Doctors
+    with no template or exceptions of their own all get the same text, set with one UPDATE.
+    """
+    doctors = DoctorProfile.objects.all()
+    blocks = ScheduleBlock.objects.all()
+    exceptions = ScheduleException.objects.exclude(doctor=None)
+    if doctor_ids is not None:
+        doctors = doctors.filter(id__in=doctor_ids)
+        blocks = blocks.filter(doctor__in=doctor_ids)
+        exceptions = exceptions.filter(doctor__in=doctor_ids)
+    holidays = list(ScheduleException.objects.filter(doctor=None).values_list('date', flat=True))
+    own_blocks = defaultdict(list)
+    for doctor_id, *row in blocks.values_list('doctor_id', 'weekday', 'start', 'end', 'slot_minutes'):
+        own_blocks[doctor_id].append(row)
+    own_exceptions = defaultdict(list)
+    for doctor_id, *row in exceptions.values_list('doctor_id', 'date', 'start', 'end', 'slot_minutes'):
+        own_exceptions[doctor_id].append(row)
+
+    # update() rather than save(): no post_save. updated_at moves because calendar feeds show the schedule
+    now = timezone.now()
+    custom = own_blocks.keys() | own_exceptions.keys()
+    doctors.exclude(id__in=custom).update(compiled_schedule=compile_schedule([], [], holidays), updated_at=now)
+    for doctor_id in custom:
+        compiled = compile_schedule(own_blocks[doctor_id], own_exceptions[doctor_id], holidays)
+        DoctorProfile.objects.filter(id=doctor_id).update(compiled_schedule=compiled, updated_at=now)
+    transaction.on_commit(lambda: conditional.bump_versions('doctors'))
+
+
+def check_block(start, end, slot_minutes=None):
+    """Raises ValueError with a client-facing message unless the hours can hold slots on the grid."""
+    if start >= end:
+        raise ValueError("start must be before end")
+    if cell_of(start) is None or cell_of(end) is None:
+        raise ValueError(f"Hours must be on a {GRANULARITY} minute boundary")
+    if slot_minutes is not None:
+        if not slot_minutes or slot_minutes % GRANULARITY:
+            raise ValueError(f"slot_minutes must be a positive multiple of {GRANULARITY}")
+        if slot_minutes > minutes(end) - minutes(start):
+            raise ValueError("slot_minutes is longer than the hours")
+
+
+def check_overlaps(blocks):
+    """Raises ValueError unless no two (day, start, end) blocks of the same day overlap."""
+    by_day = defaultdict(list)
+    for day, start, end in blocks:
+        by_day[day].append((start, end))
+    for day, hours in by_day.items():
+        hours.sort()
+        for (_, end), (start, _) in zip(hours, hours[1:]):
+            if start < end:
+                raise ValueError(f"Hours overlap on {day}")
+
+
+def replace_schedule(doctor, weekly, exceptions):
+    """Swap in a new weekly template and the doctor's exceptions from today on, in one transaction."""
+    with transaction.atomic():
+        # _raw_delete: a queryset delete() still sends post_delete per row, recompiling once per row
+        # before the one below. Nothing references these rows, so there is nothing to cascade
+        ScheduleBlock.objects.filter(doctor=doctor)._raw_delete(ScheduleBlock.objects.db)
+        ScheduleException.objects.filter(doctor=doctor, date__gte=timezone.localdate())._raw_delete(ScheduleException.objects.db)
+        ScheduleBlock.objects.bulk_create([ScheduleBlock(doctor=doctor, **block) for block in weekly])
+        ScheduleException.objects.bulk_create([ScheduleException(doctor=doctor, **exception) for exception in exceptions])
+        # bulk_create sends no signals
+        compile_schedules([doctor.id])
@@ -0,0 +1,146 @@
+import datetime
+import hashlib
+from decimal import Decimal, InvalidOperation
+from django.core.exceptions import EmptyResultSet
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.utils import timezone
+from . import availability, conditional, fulltext
+from .caching import get_cache
+from .models import DoctorProfile, PatientProfile
+
+EXACT_FILTERS = ('specialization', 'city', 'state', 'zipcode')
+# sort: (column or None when computed in Python, descending, type of the sort value in its cursors)
+SORTS = {
+    'fee': ('consultation_fee', False, Decimal),
+    '-fee': ('consultation_fee', True, Decimal),
+    'experience': ('experience_years', False, int),
+    '-experience': ('experience_years', True, int),
+    'earliest': (None, False, str),
+    'relevance': (None, False, float),
+}
+DEFAULT_WITHIN_DAYS = 14  # how far ahead sort=earliest looks for a free slot
+EARLIEST_CACHE_TIMEOUT = 60  # seconds; the keys also change with the minute
+NO_SLOT = datetime.datetime.max.isoformat(timespec='minutes')  # sorts after every real slot
+PHONE_CHARACTERS = set('0123456789+-() ')
+
+
+def parse_fee(value):
+    try:
+        fee = Decimal(value)
+    except InvalidOperation:
+        raise ValueError("Invalid fee")
+    if not fee.is_finite():  # NaN and Infinity parse, but the fee column can't compare with them
+        raise ValueError("Invalid fee")
+    return fee
+
+
+def filter_doctors(params):
+    """DoctorProfile queryset narrowed by the exact, fee and experience filters. Raises ValueError."""
+    doctors = DoctorProfile.objects.all()
+    for field in EXACT_FILTERS:
+        value = params.get(field)
+        if value:
+            doctors = doctors.filter(**{field: value})
+    if params.get('min_fee'):
+        doctors = doctors.filter(consultation_fee__gte=parse_fee(params['min_fee']))
+    if params.get('max_fee'):
+        doctors = doctors.filter(consultation_fee__lte=parse_fee(params['max_fee']))
+    try:
+        if params.get('min_experience'):
+            doctors = doctors.filter(experience_years__gte=int(params['min_experience']))
+    except ValueError:
+        raise ValueError("Invalid number")
+    return doctors
+
+
+def parse_search_query(params):
+    """
+    Validate the doctor search parameters.
+    Returns (queryset, sort, within_days, text) or raises ValueError with a client-facing message.
+    """
+    doctors = filter_doctors(params)
+    try:
+        within = int(params.get('within', DEFAULT_WITHIN_DAYS))
+    except ValueError:
+        raise ValueError("Invalid number")
+
+    text = params.get('q', '').strip()
+    sort = params.get('sort', 'relevance' if text else 'fee')
+    if sort not in SORTS:
+        raise ValueError(f"Sort must be one of {', '.join(SORTS)}")
+    if sort == 'relevance' and not text:
+        raise ValueError("Sorting by relevance needs a q search")
+    if not 1 <= within <= availability.MAX_RANGE_DAYS:
+        raise ValueError(f"within must be 1 to {availability.MAX_RANGE_DAYS} days")
+    return doctors, sort, within, text
+
+
+def earliest_keys(doctors, within, now=None):
+    """
+    Sorted (earliest free slot, doctor id) keys for every matching doctor, from one doctor query and
+    one booked-slot range query however many doctors match. Doctors with no free slot sort last.
+    The keys are cached per filter set, window and minute until a doctor or appointment changes,
+    so paging through the results computes them once rather than once per page.
+    """
+    now = now or timezone.localtime().replace(tzinfo=None)
+    try:
+        sql, params = doctors.query.sql_with_params()
+    except EmptyResultSet:
+        return []
+    versions = conditional.get_versions(['doctors', 'appointments'])
+    raw = repr((sql, params, within, now.isoformat(timespec='minutes'), versions))
+    key = f'earliest:{hashlib.sha1(raw.encode()).hexdigest()}'
+    cache = get_cache()
+    keys = cache.get(key)
+    if keys is None:
+        keys = _earliest_keys(doctors, within, now)
+        cache.set(key, keys, EARLIEST_CACHE_TIMEOUT)
+    return keys
+
+
+def _earliest_keys(doctors, within, now):
+    start = now.date()
+    end = start + datetime.timedelta(days=within - 1)
+    rows = list(doctors.only('id', 'working_start', 'working_end', 'slot_minutes', 'compiled_schedule'))
+    # The filters go into the booked-slot query as a subquery rather than a long id list
+    booked = availability.group_booked(availability.booked_rows(doctors.values('id'), start, end))
+    earliest = availability.earliest_free_slots(rows, booked, start, end, after=now)
+    return sorted(
+        (earliest[doctor.id].isoformat(timespec='minutes') if earliest[doctor.id] else NO_SLOT, doctor.id)
+        for doctor in rows
+    )
+
+
+def restrict_to_text(doctors, text):
+    """Narrow the queryset to every full-text match, for searches sorted by something else."""
+    return fulltext.filter(doctors, text)
+
+
+def relevance_keys(doctors, text):
+    """(negated score, doctor id) keys for the full-text matches among the queryset, best first."""
+    matches = fulltext.search(text, restrict=doctors if doctors.query.has_filters() else None)
+    return sorted((-score, doctor_id) for doctor_id, score in matches)
+
+
+def prefix_range(lookup, prefix):
+    # A range rather than LIKE, which SQLite can't serve from an ordinary index
+    return {f'{lookup}__gte': prefix, f'{lookup}__lt': prefix + '\U0010ffff'}
+
+
+def filter_patients(params):
+    """
+    PatientProfile queryset for ?q=: a phone number prefix, one name prefix (first or last name)
+    or "<first> <last>" prefixes, matched case-insensitively through the LOWER() indexes.
+    """
+    patients = PatientProfile.objects.all()
+    text = params.get('q', '').strip()
+    if not text:
+        return patients
+    if set(text) <= PHONE_CHARACTERS and sum(character.isdigit() for character in text) >= 3:
+        return patients.filter(**prefix_range('phone', text))
+    terms = text.lower().split()
+    patients = patients.alias(first_lower=Lower('first_name'), last_lower=Lower('last_name'))
+    if len(terms) == 1:
+        return patients.filter(Q(**prefix_range('first_lower', terms[0])) | Q(**prefix_range('last_lower', terms[0])))
+    return patients.filter(**prefix_range('first_lower', terms[0]), **prefix_range('last_lower', terms[-1]))
@@ -1,7 +1,27 @@
 import json
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import DoctorProfile, Appointment, PatientProfile
+from django.db import IntegrityError, transaction
+from .models import DoctorProfile, Appointment, PatientProfile, ScheduleBlock, ScheduleException, WEEKDAY_CHOICES
+from .authentication import patient_id_for
+from .availability import is_bookable, nearest_free_slots
+from .exceptions import SlotUnavailable
+from .recurrence import MAX_OCCURRENCES, book_series, series_dates
+from .schedules import check_block, check_overlaps
+from django.utils import timezone
+
+class ThumbnailField(serializers.ImageField):
+    """Read-only thumbnail URL of the profile given by `source`, falling back to the original image until it is generated."""
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def get_attribute(self, instance):
+        profile = super().get_attribute(instance)
+        if profile is None:
+            return None
+        return profile.profile_thumbnail or profile.profile_image
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -27,18 +47,46 @@ class UserProfileSerializer(serializers.ModelSerializer):
 
 class AppointmentNestedSerializer(serializers.ModelSerializer):
     patient_name = serializers.CharField(source='patient.first_name', read_only=True)  # assuming `name` field in Patient
-    patient_profile_image = serializers.ImageField(source='patient.profile_image', read_only=True)
+    patient_profile_image = ThumbnailField(source='patient')
 
     class Meta:
         model = Appointment
         fields = ['id', 'patient_name','patient_profile_image', 'date', 'time']
 
 
-class DoctorSerializer(serializers.ModelSerializer):
+WORKING_HOURS_FIELDS = ('working_start', 'working_end', 'slot_minutes')
+
+
+class WorkingHoursMixin:
+    """Schedules are bitmaps over GRANULARITY-minute cells, so a doctor's default hours must fit them."""
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        hours = [
+            attrs[field] if field in attrs else getattr(self.instance, field, DoctorProfile._meta.get_field(field).get_default())
+            for field in WORKING_HOURS_FIELDS
+        ]
+        if None not in hours:
+            try:
+                check_block(*hours)
+            except ValueError as exc:
+                raise serializers.ValidationError(str(exc))
+        return attrs
+
+
+class WorkingHoursSerializer(WorkingHoursMixin, serializers.Serializer):
+    # For the doctor views that read request.data by hand
+    working_start = serializers.TimeField()
+    working_end = serializers.TimeField()
+    slot_minutes = serializers.IntegerField(min_value=1)
+
+
+class DoctorSerializer(WorkingHoursMixin, serializers.ModelSerializer):
     doctor_name = serializers.CharField(source='user.get_full_name', read_only=True)
     username = serializers.CharField(source='user.username', read_only=True)
     email = serializers.CharField(source='user.email', read_only=True)
     appointments = AppointmentNestedSerializer(many=True, read_only=True)
+    profile_thumbnail = ThumbnailField(source='*')
     class Meta:
         model = DoctorProfile
         fields = [
@@ -57,53 +105,184 @@ class DoctorSerializer(serializers.ModelSerializer):
             'phone',
             'working_start',
             'working_end',
+            'slot_minutes',
             'profile_image',
+            'profile_thumbnail',
             'qualification',
             'experience_years',
-            'consultation_fee'
+            'consultation_fee',
+            'latitude',
+            'longitude'
+        ]
+
+
+class DoctorDirectorySerializer(serializers.ModelSerializer):
+    # Slim listing for the doctor directory: no nested appointments
+    doctor_name = serializers.CharField(source='user.get_full_name', read_only=True)
+    username = serializers.CharField(source='user.username', read_only=True)
+    email = serializers.CharField(source='user.email', read_only=True)
+    profile_thumbnail = ThumbnailField(source='*')
+
+    class Meta:
+        model = DoctorProfile
+        fields = [
+            'id',
+            'email',
+            'username',
+            'doctor_name',
+            'clinic_name',
+            'clinic_address',
+            'city',
+            'state',
+            'zipcode',
+            'specialization',
+            'gender',
+            'phone',
+            'working_start',
+            'working_end',
+            'slot_minutes',
+            'profile_image',
+            'profile_thumbnail',
+            'qualification',
+            'experience_years',
+            'consultation_fee',
+            'latitude',
+            'longitude'
         ]
 
 class AppointmentSerializer(serializers.ModelSerializer):
     doctor = serializers.PrimaryKeyRelatedField(queryset=DoctorProfile.objects.all())
-    patient = serializers.PrimaryKeyRelatedField(queryset=PatientProfile.objects.all())
+    patient = serializers.PrimaryKeyRelatedField(read_only=True)  # patient will be set from the logged-in user
     doctor_name = serializers.CharField(source='doctor.user.get_full_name', read_only=True)
     patient_name = serializers.CharField(source='patient.first_name', read_only=True)
     class Meta:
         model = Appointment
         fields = ['id', 'doctor', 'doctor_name', 'patient', 'patient_name', 'date', 'time']
-        read_only_fields = ['patient']  # patient will be set from the logged-in user
+        # Double-booking is enforced by the (doctor, date, time) unique constraint at insert time,
+        # not by a racy exists() check beforehand.
+        validators = []
 
     def validate(self, attrs):
-        """Custom validation to prevent booking outside working hours or double-booking."""
-        doctor_profile = attrs['doctor']
-        date = attrs['date']
-        time = attrs['time']
-        # Check doctor's working hours:
-        start = doctor_profile.working_start
-        end = doctor_profile.working_end
-        if time < start or (time.hour + 2) > end.hour:  # simplistic check: slot must be within working hours
-            raise serializers.ValidationError("Selected time is outside the doctor's working hours.")
-        # Check for existing appointment at this slot
-        conflict = Appointment.objects.filter(doctor=doctor_profile, date=date, time=time).exists()
-        if conflict:
-            raise serializers.ValidationError("This time slot is already booked for the selected doctor.")
+        """Custom validation to prevent booking outside the doctor's schedule."""
+        # The time must start one of the slots the doctor's schedule has on that date
+        if not is_bookable(attrs['doctor'], attrs['date'], attrs['time']):
+            raise serializers.ValidationError("Selected time is not one of the doctor's slots on that date.")
         return attrs
 
     def create(self, validated_data):
         # Set the patient as the logged-in user making the request
-        user = self.context['request'].user
+        patient_id = patient_id_for(self.context['request'].user)
+        if patient_id is None:
+            raise serializers.ValidationError("User is not a valid patient.")
 
+        validated_data['patient_id'] = patient_id
         try:
-            patient_profile = PatientProfile.objects.get(user=user)
-        except PatientProfile.DoesNotExist:
+            with transaction.atomic():
+                appointment = Appointment.objects.create(**validated_data)
+        except IntegrityError:
+            doctor = validated_data['doctor']
+            raise SlotUnavailable(nearest_free_slots(doctor, validated_data['date'], validated_data['time']))
+        return appointment
+
+
+class AppointmentSeriesSerializer(serializers.Serializer):
+    """
+    Books the same slot on many dates: either a recurrence (`start`, `count`, `every_weeks`)
+    or an explicit block of `dates`. With `partial` set, taken dates are skipped instead of
+    failing the whole series.
+    """
+    doctor = serializers.PrimaryKeyRelatedField(queryset=DoctorProfile.objects.all())
+    time = serializers.TimeField()
+    start = serializers.DateField(required=False)
+    count = serializers.IntegerField(required=False, min_value=1, max_value=MAX_OCCURRENCES)
+    every_weeks = serializers.IntegerField(default=1, min_value=1, max_value=MAX_OCCURRENCES)
+    dates = serializers.ListField(child=serializers.DateField(), required=False, min_length=1, max_length=MAX_OCCURRENCES)
+    partial = serializers.BooleanField(default=False)
+
+    def validate(self, attrs):
+        if 'dates' in attrs:
+            if 'start' in attrs or 'count' in attrs:
+                raise serializers.ValidationError("Give either dates or start and count, not both.")
+            attrs['dates'] = sorted(set(attrs['dates']))
+        elif 'start' in attrs and 'count' in attrs:
+            try:
+                attrs['dates'] = series_dates(attrs['start'], attrs['count'], attrs['every_weeks'])
+            except ValueError as exc:
+                raise serializers.ValidationError(str(exc))
+        else:
+            raise serializers.ValidationError("Either dates or start and count are required.")
+        # Templates differ by weekday and exceptions by date, so every occurrence is checked
+        closed = [day.isoformat() for day in attrs['dates'] if not is_bookable(attrs['doctor'], day, attrs['time'])]
+        if closed:
+            raise serializers.ValidationError(f"Selected time is not one of the doctor's slots on {', '.join(closed)}.")
+        return attrs
+
+    def create(self, validated_data):
+        patient_id = patient_id_for(self.context['request'].user)
+        if patient_id is None:
             raise serializers.ValidationError("User is not a valid patient.")
+        appointments, conflicts = book_series(
+            validated_data['doctor'], patient_id, validated_data['dates'], validated_data['time'], validated_data['partial'],
+        )
+        return {'appointments': appointments, 'conflicts': conflicts}
+
+
+class ScheduleBlockSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ScheduleBlock
+        fields = ['weekday', 'start', 'end', 'slot_minutes']
+
+    def validate(self, attrs):
+        try:
+            check_block(attrs['start'], attrs['end'], attrs.get('slot_minutes'))
+        except ValueError as exc:
+            raise serializers.ValidationError(str(exc))
+        return attrs
+
+
+class ScheduleExceptionSerializer(serializers.ModelSerializer):
+    """A date off (no start and end) or that date's hours in place of the weekly template."""
+    class Meta:
+        model = ScheduleException
+        fields = ['date', 'start', 'end', 'slot_minutes', 'reason']
+
+    def validate(self, attrs):
+        if attrs['date'] < timezone.localdate():
+            raise serializers.ValidationError("Exceptions can't be in the past.")
+        if (attrs.get('start') is None) != (attrs.get('end') is None):
+            raise serializers.ValidationError("Give both start and end, or neither for a day off.")
+        if attrs.get('start') is not None:
+            try:
+                check_block(attrs['start'], attrs['end'], attrs.get('slot_minutes'))
+            except ValueError as exc:
+                raise serializers.ValidationError(str(exc))
+        return attrs
 
-        validated_data['patient'] = patient_profile
-        appointment = Appointment.objects.create(**validated_data)
-        return appointment
 
+class DoctorScheduleSerializer(serializers.Serializer):
+    """A doctor's whole weekly template and upcoming exceptions, replaced together."""
+    weekly = ScheduleBlockSerializer(many=True)
+    exceptions = ScheduleExceptionSerializer(many=True, required=False, default=list)
 
-class DoctorCreateSerializer(serializers.ModelSerializer):
+    def validate(self, attrs):
+        try:
+            check_overlaps((dict(WEEKDAY_CHOICES)[block['weekday']], block['start'], block['end']) for block in attrs['weekly'])
+            check_overlaps(
+                (exception['date'], exception['start'], exception['end'])
+                for exception in attrs['exceptions'] if exception.get('start') is not None
+            )
+        except ValueError as exc:
+            raise serializers.ValidationError(str(exc))
+        return attrs
+
+
+class HolidaySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ScheduleException
+        fields = ['id', 'date', 'reason']
+
+
+class DoctorCreateSerializer(WorkingHoursMixin, serializers.ModelSerializer):
     username = serializers.CharField(write_only=True)
     email = serializers.EmailField(write_only=True)
     password = serializers.CharField(write_only=True)
@@ -122,6 +301,7 @@ class DoctorCreateSerializer(serializers.ModelSerializer):
             'phone',
             'working_start',
             'working_end',
+            'slot_minutes',
             'profile_image',
             'qualification',
             'experience_years',
@@ -141,7 +321,7 @@ class DoctorCreateSerializer(serializers.ModelSerializer):
         return doctor
     
 class PatientAppointmentNestedSerializer(serializers.ModelSerializer):
-    doctor_profile_image = serializers.ImageField(source='doctor.profile_image', read_only=True)
+    doctor_profile_image = ThumbnailField(source='doctor')
     doctor_specialization = serializers.CharField(source='doctor.specialization', read_only=True)
     doctor_name = serializers.CharField(source='doctor.user.get_full_name', read_only=True)
 
@@ -153,9 +333,10 @@ class PatientAppointmentNestedSerializer(serializers.ModelSerializer):
 class PatientProfileSerializer(serializers.ModelSerializer):
     user = serializers.SerializerMethodField()
     appointments = PatientAppointmentNestedSerializer(many=True, read_only=True)
+    profile_thumbnail = ThumbnailField(source='*')
     class Meta:
         model = PatientProfile
-        fields = ['user', 'first_name', 'last_name', 'gender', 'dob', 'phone', 'profile_image', 'blood_group', 'chronic_conditions', 'allergies', 'current_medications', 'emergency_contact', 'appointments']
+        fields = ['id', 'user', 'first_name', 'last_name', 'gender', 'dob', 'phone', 'profile_image', 'profile_thumbnail', 'blood_group', 'chronic_conditions', 'allergies', 'current_medications', 'emergency_contact', 'appointments']
 
     def get_user(self, obj):
         return {
@@ -168,4 +349,12 @@ class PatientProfileSerializer(serializers.ModelSerializer):
         user_data = self.context['user_data']
         user = User.objects.create_user(**user_data)
         return PatientProfile.objects.create(user=user, **validated_data)
-       
\ No newline at end of file
+       
+
+
+class PatientListSerializer(PatientProfileSerializer):
+    # Registry rows without nested appointments; ?expand=appointments lists with PatientProfileSerializer
+    appointments = None
+
+    class Meta(PatientProfileSerializer.Meta):
+        fields = [field for field in PatientProfileSerializer.Meta.fields if field != 'appointments']
@@ -0,0 +1,137 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete
+from django.dispatch import receiver
+from . import caching, conditional, fulltext, geocoding, ics, rollups, schedules, thumbnails
+from .models import Appointment, DeletedAppointment, DoctorProfile, PatientProfile, ScheduleBlock, ScheduleException
+
+
+@receiver(post_init, sender=Appointment)
+def remember_appointment_owners(sender, instance, **kwargs):
+    # Original owners, so moving an appointment also invalidates the timelines it left
+    instance._loaded_owners = (instance.doctor_id, instance.patient_id)
+    instance._loaded_day = (instance.doctor_id, instance.date)
+
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+def record_deleted_appointment(sender, instance, created=False, **kwargs):
+    # Connected before invalidate_appointment_timelines, which resets _loaded_owners
+    if kwargs['signal'] is post_delete:
+        doctor_id = instance.doctor_id
+    elif not created and instance._loaded_owners[0] != instance.doctor_id:
+        doctor_id = instance._loaded_owners[0]  # moved: gone from the old doctor's calendar
+    else:
+        return
+    if doctor_id:
+        DeletedAppointment.objects.create(appointment_id=instance.pk, doctor_id=doctor_id, date=instance.date, time=instance.time)
+        ics.maybe_prune()
+
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+def invalidate_appointment_timelines(sender, instance, **kwargs):
+    doctor_ids = {instance.doctor_id, instance._loaded_owners[0]}
+    patient_ids = {instance.patient_id, instance._loaded_owners[1]}
+    instance._loaded_owners = (instance.doctor_id, instance.patient_id)
+    transaction.on_commit(lambda: caching.invalidate_timelines(doctor_ids, patient_ids))
+    transaction.on_commit(lambda: conditional.bump_versions('appointments'))
+
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+def refresh_appointment_rollups(sender, instance, **kwargs):
+    # Both days when an appointment moves; recounted after commit, off the booking transaction
+    keys = {instance._loaded_day, (instance.doctor_id, instance.date)}
+    instance._loaded_day = (instance.doctor_id, instance.date)
+    transaction.on_commit(lambda: rollups.refresh(keys))
+
+
+@receiver(pre_delete, sender=DoctorProfile)
+def forget_doctor_rollups(sender, instance, **kwargs):
+    # The cascade takes the doctor's DailyStats and appointments, and refresh() skips a doctor that's
+    # gone, so the segments they counted towards are re-summed here, read before the rows disappear
+    days, segments = rollups.doctor_segments(instance.id)
+    transaction.on_commit(lambda: rollups.refresh_segments(days, segments))
+
+
+@receiver(post_save, sender=DoctorProfile)
+@receiver(post_delete, sender=DoctorProfile)
+@receiver(post_save, sender=PatientProfile)
+@receiver(post_delete, sender=PatientProfile)
+def invalidate_profile_timelines(sender, instance, created=False, **kwargs):
+    table = 'doctors' if sender is DoctorProfile else 'patients'
+    transaction.on_commit(lambda: conditional.bump_versions(table))
+    # Doctor and patient names are rendered into other principals' timelines; a new profile has none yet
+    if not created:
+        transaction.on_commit(caching.invalidate_all_timelines)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_timelines(sender, instance, created=False, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    principal = f'user:{instance.pk}'  # pk is cleared once a delete finishes
+    transaction.on_commit(lambda: conditional.bump_versions('users', principal))
+    if not created and (update_fields is None or {'first_name', 'last_name'} & set(update_fields)):
+        transaction.on_commit(caching.invalidate_all_timelines)
+
+
+@receiver(post_save, sender=DoctorProfile)
+@receiver(post_save, sender=PatientProfile)
+def schedule_thumbnail(sender, instance, **kwargs):
+    if thumbnails.is_stale(instance):
+        transaction.on_commit(lambda: thumbnails.schedule(instance))
+
+
+@receiver(post_save, sender=DoctorProfile)
+def schedule_geocoding(sender, instance, **kwargs):
+    if geocoding.is_stale(instance):
+        transaction.on_commit(lambda: geocoding.schedule(instance))
+
+
+@receiver(post_save, sender=ScheduleBlock)
+@receiver(post_delete, sender=ScheduleBlock)
+@receiver(post_save, sender=ScheduleException)
+@receiver(post_delete, sender=ScheduleException)
+def recompile_schedule(sender, instance, **kwargs):
+    # Compiled in the same transaction, so a booking never validates against a schedule that was replaced.
+    # A holiday (no doctor) is part of every doctor's schedule
+    schedules.compile_schedules(None if instance.doctor_id is None else [instance.doctor_id])
+
+
+@receiver(post_save, sender=DoctorProfile)
+def compile_new_doctor_schedule(sender, instance, created=False, **kwargs):
+    # Holidays already on the calendar apply to a new doctor too
+    if created:
+        schedules.compile_schedules([instance.pk])
+
+
+@receiver(post_save, sender=DoctorProfile)
+def update_doctor_rollups(sender, instance, created=False, **kwargs):
+    # Specialization, city and fee are copied into the doctor's rollup rows
+    if not created:
+        doctor_id = instance.pk
+        transaction.on_commit(lambda: rollups.update_doctor(doctor_id))
+
+
+@receiver(post_save, sender=DoctorProfile)
+def reindex_doctor(sender, instance, **kwargs):
+    doctor_id = instance.pk
+    transaction.on_commit(lambda: fulltext.reindex([doctor_id]))
+
+
+@receiver(post_delete, sender=DoctorProfile)
+def unindex_doctor(sender, instance, **kwargs):
+    doctor_id = instance.pk
+    transaction.on_commit(lambda: fulltext.unindex([doctor_id]))
+
+
+@receiver(post_save, sender=User)
+def reindex_doctor_name(sender, instance, created=False, update_fields=None, **kwargs):
+    # Doctor names are indexed from the User row; a new user has no profile yet
+    if created or (update_fields is not None and not {'first_name', 'last_name'} & set(update_fields)):
+        return
+    user_id = instance.pk
+    transaction.on_commit(lambda: fulltext.reindex(DoctorProfile.objects.filter(user_id=user_id).values_list('id', flat=True)))
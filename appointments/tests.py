@@ -1,3 +1,1546 @@
-from django.test import TestCase
+import base64
+import datetime
+import io
+import json
+import shutil
+import tempfile
+import threading
+from decimal import Decimal
+from unittest import skipUnless
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import async_to_sync, sync_to_async
+from django.db import IntegrityError, connection, connections
+from django.test.utils import CaptureQueriesContext
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.mail.backends import locmem
+from django.core.mail.backends.base import BaseEmailBackend
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.contrib.auth.models import User
+from django.urls import NoReverseMatch, reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from PIL import Image
+from backend import databases
+from .models import DoctorProfile, PatientProfile, Appointment, DailySegmentStats, DailyStats, DeletedAppointment, EmailOutbox, GeocodedAddress, RevokedToken, ScheduleException
+from . import benchmarking, caching, exports, fulltext, geocoding, ics, importers, notifications, revocation, rollups, schedules, search, thumbnails
+from .admin import EstimatedCountPaginator
+from .metrics import registry
+from .views import CustomTokenObtainPairSerializer, thumbnail_media
 
-# Create your tests here.
+
+def make_doctor(username, **kwargs):
+    user = User.objects.create(username=username, first_name='Doc', last_name=username, is_staff=True)
+    kwargs.setdefault('working_start', datetime.time(9, 0))
+    kwargs.setdefault('working_end', datetime.time(17, 0))
+    return DoctorProfile.objects.create(user=user, **kwargs)
+
+
+def bearer(user):
+    """Authorization header carrying the same claims as a token from the login endpoint."""
+    return f'Bearer {CustomTokenObtainPairSerializer.get_token(user).access_token}'
+
+
+def make_patient(username, **kwargs):
+    user = User.objects.create(username=username, first_name='Pat', last_name=username)
+    return PatientProfile.objects.create(user=user, first_name='Pat', last_name=username, **kwargs)
+
+
+class DoctorListViewTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.patient = make_patient('patient')
+        self.client.force_authenticate(self.patient.user)
+
+    def seed(self, count):
+        start = DoctorProfile.objects.count()
+        for i in range(start, start + count):
+            doctor = make_doctor(f'doc{i}')
+            Appointment.objects.create(doctor=doctor, patient=self.patient, date=datetime.date(2030, 1, 1), time=datetime.time(9, 0))
+
+    def test_full_list_query_count_is_constant(self):
+        self.seed(2)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('doctors'))
+        self.assertEqual(len(response.data), 2)
+        self.assertEqual(len(response.data[0]['appointments']), 1)
+
+        self.seed(10)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('doctors'))
+        self.assertEqual(len(response.data), 12)
+
+    def test_directory_is_paginated_and_slim(self):
+        self.seed(5)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('doctors'), {'view': 'directory', 'page_size': 2})
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertNotIn('appointments', response.data['results'][0])
+        self.assertIsNotNone(response.data['next'])
+
+        self.seed(20)
+        with self.assertNumQueries(1):
+            self.client.get(reverse('doctors'), {'view': 'directory', 'page_size': 2})
+
+
+class PatientListViewTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(make_doctor('admin').user)
+        self.doctors = [make_doctor(f'doc{i}') for i in range(3)]
+
+    def seed(self, count):
+        start = PatientProfile.objects.count()
+        for i in range(start, start + count):
+            patient = make_patient(f'patient{i}', phone=f'555-01{i:02d}')
+            for d, doctor in enumerate(self.doctors):
+                Appointment.objects.create(doctor=doctor, patient=patient, date=datetime.date(2030, 1, 1) + datetime.timedelta(days=i), time=datetime.time(9 + 2 * d, 0))
+
+    def test_query_count_stays_flat(self):
+        for total in (3, 30):
+            self.seed(total - PatientProfile.objects.count())
+            with self.assertNumQueries(1):
+                response = self.client.get(reverse('patients'), {'page_size': 20})
+            self.assertNotIn('appointments', response.data['results'][0])
+            with self.assertNumQueries(2):
+                response = self.client.get(reverse('patients'), {'page_size': 20, 'expand': 'appointments'})
+            self.assertEqual(len(response.data['results'][0]['appointments']), 3)
+            self.assertEqual(response.data['results'][0]['appointments'][0]['doctor_name'], 'Doc doc0')
+
+    def test_pages_walk_every_patient_once(self):
+        self.seed(7)
+        seen = []
+        url, params = reverse('patients'), {'page_size': 3}
+        while url:
+            response = self.client.get(url, params)
+            seen += [patient['id'] for patient in response.data['results']]
+            url, params = response.data['next'], None
+        self.assertEqual(seen, list(PatientProfile.objects.order_by('id').values_list('id', flat=True)))
+
+    def test_search_by_name_and_phone(self):
+        ada = make_patient('ada', phone='+1 617 555 0000')
+        ada.first_name, ada.last_name = 'Ada', 'Lovelace'
+        ada.save()
+        grace = make_patient('grace')
+        grace.first_name, grace.last_name = 'Grace', 'Hopper'
+        grace.save()
+
+        def found(q):
+            return [patient['id'] for patient in self.client.get(reverse('patients'), {'q': q}).data['results']]
+
+        self.assertEqual(found('love'), [ada.id])
+        self.assertEqual(found('GRA'), [grace.id])
+        self.assertEqual(found('ada lov'), [ada.id])
+        self.assertEqual(found('ada hop'), [])
+        self.assertEqual(found('+1 617'), [ada.id])
+
+    @skipUnless(connection.vendor == 'sqlite', 'Query plan assertions are written against SQLite EXPLAIN QUERY PLAN output')
+    def test_search_uses_indexes(self):
+        table = PatientProfile._meta.db_table
+        for q in ('love', 'ada lov', '555-01'):
+            queryset = search.filter_patients({'q': q})
+            sql, params = queryset.query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+                plan = ' | '.join(str(row[-1]) for row in cursor.fetchall())
+            self.assertIn('INDEX patient_', plan)
+            self.assertNotIn(f'SCAN {table}', plan)
+
+class DoctorSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.patient = make_patient('patient')
+        self.client.force_authenticate(self.patient.user)
+        self.cheap = make_doctor('cheap', specialization='Cardiology', city='Boston', consultation_fee=50, experience_years=3)
+        self.mid = make_doctor('mid', specialization='Cardiology', city='Boston', consultation_fee=80, experience_years=20)
+        self.dear = make_doctor('dear', specialization='Cardiology', city='Denver', consultation_fee=120, experience_years=10)
+        self.other = make_doctor('other', specialization='Pediatrics', city='Boston', consultation_fee=60)
+
+    def ids(self, response):
+        return [doctor['id'] for doctor in response.data['results']]
+
+    def test_filters_combine(self):
+        response = self.client.get(reverse('doctor-search'), {'specialization': 'Cardiology', 'city': 'Boston', 'max_fee': '100'})
+        self.assertEqual(self.ids(response), [self.cheap.id, self.mid.id])
+        response = self.client.get(reverse('doctor-search'), {'min_experience': 5, 'sort': '-experience'})
+        self.assertEqual(self.ids(response), [self.mid.id, self.dear.id])
+
+    def test_keyset_pages_walk_every_doctor_once(self):
+        seen = []
+        params = {'sort': '-fee', 'page_size': 3}
+        url = reverse('doctor-search')
+        while url:
+            with self.assertNumQueries(1):
+                response = self.client.get(url, params)
+            seen += self.ids(response)
+            url, params = response.data['next'], None
+        self.assertEqual(seen, [self.dear.id, self.mid.id, self.other.id, self.cheap.id])
+
+    def test_earliest_sort_is_computed_in_bulk(self):
+        today = timezone.localdate()
+        # The cheap doctor is fully booked today and tomorrow, so has nothing within two days
+        for day in (today, today + datetime.timedelta(days=1)):
+            for hour in (9, 11, 13, 15):
+                Appointment.objects.create(doctor=self.cheap, patient=self.patient, date=day, time=datetime.time(hour, 0))
+        for i in range(10):
+            make_doctor(f'extra{i}', specialization='Cardiology')
+
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('doctor-search'), {'sort': 'earliest', 'specialization': 'Cardiology', 'within': 2})
+        results = response.data['results']
+        self.assertEqual(len(results), 13)
+        self.assertEqual((results[-1]['id'], results[-1]['earliest_available']), (self.cheap.id, None))
+        tomorrow_first = f'{today + datetime.timedelta(days=1)}T09:00'
+        self.assertTrue(all(doctor['earliest_available'] <= tomorrow_first for doctor in results[:-1]))
+        self.assertEqual([doctor['earliest_available'] for doctor in results[:-1]], sorted(doctor['earliest_available'] for doctor in results[:-1]))
+
+        # The sorted keys are cached, so each page only reads its own doctors
+        with self.assertNumQueries(1):
+            first = self.client.get(reverse('doctor-search'), {'sort': 'earliest', 'specialization': 'Cardiology', 'within': 2, 'page_size': 10})
+        with self.assertNumQueries(1):
+            rest = self.client.get(first.data['next'])
+        self.assertEqual(self.ids(first) + self.ids(rest), self.ids(response))
+
+    def test_earliest_keys_are_recomputed_after_a_booking(self):
+        today = timezone.localdate()
+        params = {'sort': 'earliest', 'specialization': 'Cardiology', 'within': 2}
+        self.assertEqual(self.ids(self.client.get(reverse('doctor-search'), params))[0], self.cheap.id)  # ties go by id
+        with self.captureOnCommitCallbacks(execute=True):
+            for doctor in (self.cheap, self.mid):
+                for day in (today, today + datetime.timedelta(days=1)):
+                    for hour in (9, 11, 13, 15):
+                        Appointment.objects.create(doctor=doctor, patient=self.patient, date=day, time=datetime.time(hour, 0))
+        self.assertEqual(self.ids(self.client.get(reverse('doctor-search'), params))[0], self.dear.id)
+
+    def test_rejects_bad_parameters(self):
+        self.assertEqual(self.client.get(reverse('doctor-search'), {'sort': 'name'}).status_code, 400)
+        for fee in ('cheap', 'NaN', 'Infinity', '-inf'):
+            self.assertEqual(self.client.get(reverse('doctor-search'), {'min_fee': fee}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('doctor-search'), {'max_fee': 'sNaN'}).status_code, 400)
+
+    def test_rejects_cursors_that_do_not_fit_the_sort(self):
+        def cursor(key):
+            return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+        cases = [
+            ('fee', ['abc', 1]), ('fee', [1, 'x']), ('fee', ['NaN', 1]), ('fee', {'a': 1}), ('fee', [1, 2, 3]),
+            ('experience', ['5.5', 1]), ('earliest', [[5], 1]), ('earliest', [5, True]),
+        ]
+        for sort, key in cases:
+            response = self.client.get(reverse('doctor-search'), {'sort': sort, 'cursor': cursor(key)})
+            self.assertEqual(response.status_code, 404, (sort, key))
+        # A number where the sort has strings is compared as one rather than crashing the sort
+        response = self.client.get(reverse('doctor-search'), {'sort': 'earliest', 'cursor': cursor([5, 1])})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse('doctor-search'), {'sort': 'fee', 'page_size': -3})
+        self.assertEqual(self.ids(response), [self.cheap.id])
+
+
+@override_settings(
+    GEOCODER={'BACKEND': 'appointments.geocoding.LocalGeocoder', 'OPTIONS': {'places': {
+        '1 Main St, Boston, MA': (42.3601, -71.0589),
+        '2 Elm St, Cambridge, MA': (42.3736, -71.1097),  # ~4.4km from Boston
+        '3 Oak St, Providence, RI': (41.8240, -71.4128),  # ~67km
+        '4 Pine St, Fiji': (-17.7134, 179.99),
+        '5 Palm St, Samoa': (-13.7590, -172.1046),
+    }}},
+    GEOCODER_ASYNC=False,
+)
+class NearbySearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(make_patient('patient').user)
+
+    def make_located(self, username, address, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            doctor = make_doctor(username, clinic_address=address, **kwargs)
+        doctor.refresh_from_db()
+        return doctor
+
+    def nearby(self, **params):
+        response = self.client.get(reverse('doctor-nearby'), params)
+        return [(item['id'], item['distance_km']) for item in response.data['results']]
+
+    def test_clinics_are_geocoded_once_per_address(self):
+        boston = self.make_located('boston', '1 Main St', city='Boston', state='MA')
+        self.assertEqual((boston.latitude, boston.longitude), (42.3601, -71.0589))
+        self.assertEqual(boston.geo_cell, geocoding.cell(42.3601, -71.0589))
+
+        # The same address written differently comes from the cache; this geocoder would fail if asked
+        with self.assertNumQueries(1), override_settings(GEOCODER={'BACKEND': 'builtins.object'}):
+            self.assertEqual(geocoding.locate('1 main st,  BOSTON, ma'), (42.3601, -71.0589))
+        self.assertEqual(GeocodedAddress.objects.count(), 1)
+
+    def test_radius_and_nearest(self):
+        boston = self.make_located('boston', '1 Main St', city='Boston', state='MA', specialization='Cardiology')
+        cambridge = self.make_located('cambridge', '2 Elm St', city='Cambridge', state='MA')
+        providence = self.make_located('providence', '3 Oak St', city='Providence', state='RI')
+        make_doctor('nowhere')  # no address, never located
+
+        self.assertEqual([doctor_id for doctor_id, _ in self.nearby(lat=42.36, lng=-71.06, radius=10)], [boston.id, cambridge.id])
+        found = self.nearby(lat=42.36, lng=-71.06, limit=3)
+        self.assertEqual([doctor_id for doctor_id, _ in found], [boston.id, cambridge.id, providence.id])
+        self.assertAlmostEqual(found[2][1], 66.6, delta=1)
+        self.assertEqual([doctor_id for doctor_id, _ in self.nearby(lat=41.8, lng=-71.4, limit=1)], [providence.id])
+        self.assertEqual([doctor_id for doctor_id, _ in self.nearby(lat=42.36, lng=-71.06, specialization='General')], [cambridge.id, providence.id])
+
+    def test_search_wraps_the_antimeridian(self):
+        fiji = self.make_located('fiji', '4 Pine St', city='Fiji')
+        self.make_located('samoa', '5 Palm St', city='Samoa')
+        self.assertEqual([doctor_id for doctor_id, _ in self.nearby(lat=-17.7, lng=-179.99, radius=50)], [fiji.id])
+
+    def test_address_change_relocates(self):
+        doctor = self.make_located('doc', '1 Main St', city='Boston', state='MA')
+        with self.captureOnCommitCallbacks(execute=True):
+            doctor.clinic_address, doctor.city, doctor.state = '3 Oak St', 'Providence', 'RI'
+            doctor.save()
+        doctor.refresh_from_db()
+        self.assertEqual((doctor.latitude, doctor.longitude), (41.8240, -71.4128))
+
+    def test_bulk_imported_clinics_are_located_by_the_backfill(self):
+        rows = [
+            {'username': 'boston', 'password': 'pw', 'clinic_address': '1 Main St', 'city': 'Boston', 'state': 'MA', 'working_start': '09:00', 'working_end': '17:00'},
+            {'username': 'providence', 'password': 'pw', 'clinic_address': '3 Oak St', 'city': 'Providence', 'state': 'RI', 'working_start': '09:00', 'working_end': '17:00'},
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            importers.import_rows('doctors', rows, workers=0)
+        self.assertFalse(GeocodedAddress.objects.exists())  # the geocoder isn't asked once per imported row
+        call_command('geocode_doctors', stdout=io.StringIO())
+        boston = DoctorProfile.objects.get(user__username='boston')
+        self.assertEqual(boston.geo_cell, geocoding.cell(42.3601, -71.0589))
+        self.assertEqual([doctor_id for doctor_id, _ in self.nearby(lat=42.36, lng=-71.06, radius=10)], [boston.id])
+
+    @skipUnless(connection.vendor == 'sqlite', 'Query plan assertions are written against SQLite EXPLAIN QUERY PLAN output')
+    def test_radius_reads_only_nearby_cells(self):
+        self.make_located('boston', '1 Main St', city='Boston', state='MA')
+        with CaptureQueriesContext(connection) as context:
+            geocoding.within(DoctorProfile.objects.all(), 42.36, -71.06, 25)
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + context.captured_queries[0]['sql'])
+            plan = ' | '.join(str(row[-1]) for row in cursor.fetchall())
+        self.assertIn('COVERING INDEX doctor_geo_cell_idx', plan)
+        self.assertNotIn(f'SCAN {DoctorProfile._meta.db_table}', plan)
+
+    def test_rejects_bad_parameters(self):
+        for params in ({}, {'lat': 95, 'lng': 0}, {'lat': 'x', 'lng': 0}, {'lat': 0, 'lng': 0, 'radius': 10000}, {'lat': 0, 'lng': 0, 'limit': 0}, {'lat': 0, 'lng': 0, 'min_fee': 'Infinity'}):
+            self.assertEqual(self.client.get(reverse('doctor-nearby'), params).status_code, 400)
+
+
+class FullTextSearchTests(TestCase):
+    backend = 'auto'
+
+    def setUp(self):
+        self.settings_override = override_settings(DOCTOR_SEARCH_BACKEND=self.backend)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(make_patient('patient').user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.peds = make_doctor('Okafor', specialization='Pediatrics', city='Boston', clinic_name='Harbor Kids')
+            self.cardio = make_doctor('Lindqvist', specialization='Cardiology', city='Boston', qualification='MD FACC')
+            self.peds_cardio = make_doctor('Moreau', specialization='Pediatric Cardiology', city='Boston', consultation_fee=90)
+            self.far = make_doctor('Santos', specialization='Cardiology', city='Miami')
+        fulltext.rebuild()
+
+    def ids(self, text, **params):
+        response = self.client.get(reverse('doctor-search'), {'q': text, **params})
+        self.assertEqual(response.status_code, 200)
+        return [doctor['id'] for doctor in response.data['results']]
+
+    def test_every_term_must_match_unless_nothing_does(self):
+        self.assertEqual(self.ids('pediatric cardio Boston'), [self.peds_cardio.id])
+        ids = self.ids('pediatric cardio Miami')
+        self.assertEqual(set(ids[:2]), {self.peds_cardio.id, self.far.id})
+        self.assertEqual(set(ids), {self.peds.id, self.cardio.id, self.peds_cardio.id, self.far.id})
+        self.assertEqual(self.ids('lindq'), [self.cardio.id])
+        self.assertEqual(self.ids('facc'), [self.cardio.id])
+
+    def test_combines_with_filters_and_other_sorts(self):
+        self.assertEqual(self.ids('cardio', city='Miami'), [self.far.id])
+        self.assertEqual(self.ids('boston', sort='-fee')[0], self.peds_cardio.id)
+
+    def test_other_sorts_see_every_match(self):
+        # Relevance pages through the best matches only; any other order sorts the whole match set
+        self.assertEqual(len(fulltext.search('boston', limit=1)), 1)
+        boston = {self.peds.id, self.cardio.id, self.peds_cardio.id}
+        self.assertEqual(set(fulltext.filter(DoctorProfile.objects.all(), 'boston').values_list('id', flat=True)), boston)
+        self.assertEqual(set(fulltext.filter(DoctorProfile.objects.filter(consultation_fee__lt=90), 'cardio miami').values_list('id', flat=True)), {self.far.id})
+
+    def test_index_follows_profile_and_user_saves(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.far.city = 'Boston'
+            self.far.save()
+            self.cardio.user.last_name = 'Berg'
+            self.cardio.user.save()
+            self.peds.delete()
+        self.assertIn(self.far.id, self.ids('boston'))
+        self.assertEqual(self.ids('berg'), [self.cardio.id])
+        self.assertEqual(self.ids('lindqvist'), [])
+        self.assertNotIn(self.peds.id, self.ids('pediatrics'))
+
+    def test_backend_selection(self):
+        expected = fulltext.Fts5Index if fulltext.fts5_available() else fulltext.InvertedIndex
+        self.assertIsInstance(fulltext.get_index(), expected)
+
+    def test_bulk_import_is_indexed(self):
+        rows = [{'username': 'imported', 'password': 'pw', 'first_name': 'Ida', 'last_name': 'Quill', 'working_start': '09:00', 'working_end': '17:00'}]
+        with self.captureOnCommitCallbacks(execute=True):
+            importers.import_rows('doctors', rows, workers=0)
+        self.assertEqual(len(self.ids('quill')), 1)
+
+
+class PythonFullTextSearchTests(FullTextSearchTests):
+    backend = 'python'
+
+    def test_backend_selection(self):
+        self.assertIsInstance(fulltext.get_index(), fulltext.InvertedIndex)
+
+    def test_copies_in_other_processes_catch_up(self):
+        other = fulltext.InvertedIndex()  # another worker's copy
+        self.assertEqual([doctor_id for doctor_id, _ in other.search('miami')], [self.far.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.far.city = 'Boston'
+            self.far.save()
+        self.assertEqual(other.search('miami'), [])
+        self.assertEqual(fulltext.get_index().search('miami'), [])
+
+
+class ClaimsAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.doctor = make_doctor('doc')
+        self.patient = make_patient('patient')
+        self.patient.user.set_password('pw')
+        self.patient.user.save()
+
+    def test_login_token_carries_profile_claims(self):
+        response = self.client.post(reverse('token_obtain_pair'), {'username': 'patient', 'password': 'pw'})
+        token = AccessToken(response.data['access'])
+        self.assertEqual((token['patient_id'], token['doctor_id']), (self.patient.id, None))
+        self.assertEqual(CustomTokenObtainPairSerializer.get_token(self.doctor.user)['doctor_id'], self.doctor.id)
+
+    def test_role_checks_use_claims(self):
+        self.client.credentials(HTTP_AUTHORIZATION=bearer(self.patient.user))
+        self.client.get(reverse('appointments'))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(reverse('appointments')).status_code, 200)
+
+        # Doctor lookup, the insert in its savepoint, and the two Users named in the confirmation email
+        with self.assertNumQueries(6):
+            response = self.client.post(reverse('appointments'), {'doctor': self.doctor.id, 'date': '2030-01-01', 'time': '09:00'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Appointment.objects.get().patient, self.patient)
+
+    def test_tokens_without_profile_claims_fall_back_to_lookups(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.patient.user)}')
+        response = self.client.post(reverse('appointments'), {'doctor': self.doctor.id, 'date': '2030-01-01', 'time': '09:00'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(self.client.get(reverse('appointments')).data), 1)
+
+    def test_other_user_attributes_load_lazily(self):
+        self.client.credentials(HTTP_AUTHORIZATION=bearer(self.patient.user))
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('user-profile'))
+        self.assertEqual((response.data['username'], response.data['last_name']), ('patient', 'patient'))
+
+
+class TokenRevocationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        user = make_patient('patient').user
+        user.set_password('pw')
+        user.save()
+
+    def refresh(self, token):
+        return self.client.post(reverse('token_refresh'), {'refresh': token})
+
+    def test_rotated_refresh_token_cannot_be_reused(self):
+        first = self.client.post(reverse('token_obtain_pair'), {'username': 'patient', 'password': 'pw'}).data['refresh']
+        response = self.refresh(first)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.data['refresh'], first)
+        self.assertEqual(AccessToken(response.data['access'])['patient_id'], PatientProfile.objects.get().id)
+        self.assertEqual(RevokedToken.objects.count(), 1)
+
+        cache.clear()  # the database answers when the cached revocation is gone
+        self.assertEqual(self.refresh(first).status_code, 401)
+        self.assertEqual(self.refresh(response.data['refresh']).status_code, 200)
+
+    def test_prune_removes_only_expired_rows(self):
+        now = timezone.now()
+        RevokedToken.objects.bulk_create(
+            [RevokedToken(jti=f'old{i}', expires_at=now - datetime.timedelta(hours=1)) for i in range(7)]
+            + [RevokedToken(jti='live', expires_at=now + datetime.timedelta(days=1))]
+        )
+        self.assertEqual(revocation.prune(batch_size=3), 7)
+        self.assertEqual(list(RevokedToken.objects.values_list('jti', flat=True)), ['live'])
+
+    def test_revocations_prune_automatically_once_per_interval(self):
+        now = timezone.now()
+        RevokedToken.objects.create(jti='old', expires_at=now - datetime.timedelta(hours=1))
+        revocation.revoke('a', now + datetime.timedelta(days=1))
+        RevokedToken.objects.create(jti='old2', expires_at=now - datetime.timedelta(hours=1))
+        revocation.revoke('b', now + datetime.timedelta(days=1))
+        self.assertEqual(sorted(RevokedToken.objects.values_list('jti', flat=True)), ['a', 'b', 'old2'])
+
+
+class AvailableSlotsViewTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.patient = make_patient('patient')
+        self.client.force_authenticate(self.patient.user)
+        self.doctor = make_doctor('doc', working_end=datetime.time(13, 0))
+        self.other = make_doctor('other', slot_minutes=60, working_end=datetime.time(12, 0))
+        Appointment.objects.create(doctor=self.doctor, patient=self.patient, date=datetime.date(2030, 1, 1), time=datetime.time(11, 0))
+
+    def test_single_day_keeps_original_shape(self):
+        response = self.client.get(reverse('available-slots'), {'doctor': self.doctor.id, 'date': '2030-01-01'})
+        self.assertEqual(response.data['available_slots'], ['09:00'])
+
+    def test_range_for_many_doctors_uses_one_appointment_query(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('available-slots'), {
+                'doctor': f'{self.doctor.id},{self.other.id}', 'start': '2030-01-01', 'end': '2030-01-31',
+            })
+        by_doctor = {entry['doctor']: entry['available_slots'] for entry in response.data['doctors']}
+        self.assertEqual(len(by_doctor[self.doctor.id]), 31)
+        self.assertEqual(by_doctor[self.doctor.id]['2030-01-01'], ['09:00'])
+        self.assertEqual(by_doctor[self.doctor.id]['2030-01-02'], ['09:00', '11:00'])
+        self.assertEqual(by_doctor[self.other.id]['2030-01-01'], ['09:00', '10:00', '11:00'])
+
+    def test_rejects_oversized_range(self):
+        response = self.client.get(reverse('available-slots'), {'doctor': self.doctor.id, 'start': '2030-01-01', 'end': '2031-01-01'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_last_day_of_the_calendar(self):
+        response = self.client.get(reverse('available-slots'), {'doctor': self.doctor.id, 'date': '9999-12-31'})
+        ordinary = self.client.get(reverse('available-slots'), {'doctor': self.doctor.id, 'date': '2030-01-02'})
+        self.assertEqual(response.data['available_slots'], ordinary.data['available_slots'])
+
+
+class BookingTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.patient = make_patient('patient')
+        self.client.force_authenticate(self.patient.user)
+        self.doctor = make_doctor('doc')
+
+    def test_books_slot(self):
+        response = self.client.post(reverse('appointments'), {'doctor': self.doctor.id, 'date': '2030-01-01', 'time': '09:00'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Appointment.objects.get().patient, self.patient)
+
+    def test_conflict_returns_409_with_suggestions(self):
+        Appointment.objects.create(doctor=self.doctor, patient=make_patient('other'), date=datetime.date(2030, 1, 1), time=datetime.time(9, 0))
+        response = self.client.post(reverse('appointments'), {'doctor': self.doctor.id, 'date': '2030-01-01', 'time': '09:00'})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['suggested_slots'][0], {'date': '2030-01-01', 'time': '11:00'})
+
+        Appointment.objects.create(doctor=self.doctor, patient=make_patient('last'), date=datetime.date.max, time=datetime.time(9, 0))
+        response = self.client.post(reverse('appointments'), {'doctor': self.doctor.id, 'date': '9999-12-31', 'time': '09:00'})
+        self.assertEqual(response.data['suggested_slots'][0], {'date': '9999-12-31', 'time': '11:00'})
+
+    def test_outside_working_hours(self):
+        response = self.client.post(reverse('appointments'), {'doctor': self.doctor.id, 'date': '2030-01-01', 'time': '16:00'})
+        self.assertEqual(response.status_code, 400)
+
+
+
+class SeriesBookingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.patient = make_patient('patient', chronic_conditions='Diabetes')
+        self.patient.user.email = 'patient@example.com'
+        self.patient.user.save()
+        self.client.force_authenticate(self.patient.user)
+        self.doctor = make_doctor('doc')
+        self.other = make_patient('other')
+
+    def book(self, **data):
+        return self.client.post(reverse('appointment-series'), {'doctor': self.doctor.id, 'time': '11:00', **data}, format='json')
+
+    def test_weekly_series_is_one_insert_and_one_email(self):
+        self.assertEqual(len(self.client.get(reverse('appointments')).data), 0)  # cached empty timeline
+        with self.captureOnCommitCallbacks(execute=True):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.book(start='2030-01-01', count=12)
+        self.assertEqual(response.status_code, 201)
+        dates = [item['date'] for item in response.data['booked']]
+        self.assertEqual(dates[:2], ['2030-01-01', '2030-01-08'])
+        self.assertEqual(len(dates), 12)
+        self.assertTrue(all(datetime.date.fromisoformat(day).weekday() == 1 for day in dates))
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('INSERT INTO "appointments_appointment"')]), 1)
+        self.assertEqual(EmailOutbox.objects.count(), 1)
+        self.assertIn('2030-03-19', EmailOutbox.objects.get().body)
+        # bulk_create sends no signals; the series invalidates the timeline and counts its days itself
+        self.assertEqual(len(self.client.get(reverse('appointments')).data), 12)
+        self.assertEqual(DailyStats.objects.filter(doctor=self.doctor, appointments=1).count(), 12)
+
+        with CaptureQueriesContext(connection) as small:
+            self.book(start='2031-01-01', count=2)
+        self.assertEqual(len(small), len(queries))
+
+    def test_conflicts_fail_the_whole_series(self):
+        Appointment.objects.create(doctor=self.doctor, patient=self.other, date=datetime.date(2030, 1, 15), time=datetime.time(11, 0))
+        response = self.book(start='2030-01-01', count=4)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['conflicts'], [{'date': '2030-01-15', 'time': '11:00', 'available_slots': ['09:00', '13:00', '15:00']}])
+        self.assertEqual(Appointment.objects.filter(patient=self.patient).count(), 0)
+        self.assertEqual(EmailOutbox.objects.count(), 0)
+
+    def test_partial_books_free_dates_and_reports_the_rest(self):
+        Appointment.objects.create(doctor=self.doctor, patient=self.other, date=datetime.date(2030, 2, 3), time=datetime.time(11, 0))
+        response = self.book(dates=['2030-02-05', '2030-02-03', '2030-02-04'], partial=True)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([item['date'] for item in response.data['booked']], ['2030-02-04', '2030-02-05'])
+        self.assertEqual([item['date'] for item in response.data['conflicts']], ['2030-02-03'])
+
+    def test_partial_series_books_around_a_concurrent_booking(self):
+        raced = []
+
+        def concurrent_booking(execute, sql, params, many, context):
+            if sql.startswith('INSERT INTO "appointments_appointment"') and not raced:
+                # Another patient's booking of 2030-02-04 commits between the check and the insert
+                raced.append('insert')
+                raise IntegrityError('UNIQUE constraint failed')
+            if raced == ['insert'] and 'FROM "appointments_appointment"' in sql:
+                raced.append('retry')
+                Appointment.objects.create(doctor=self.doctor, patient=self.other, date=datetime.date(2030, 2, 4), time=datetime.time(11, 0))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(concurrent_booking):
+            response = self.book(dates=['2030-02-03', '2030-02-04', '2030-02-05'], partial=True)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([item['date'] for item in response.data['booked']], ['2030-02-03', '2030-02-05'])
+        self.assertEqual([item['date'] for item in response.data['conflicts']], ['2030-02-04'])
+
+    def test_rejects_bad_series(self):
+        self.assertEqual(self.book(start='2030-01-01').status_code, 400)
+        self.assertEqual(self.book(start='9999-12-01', count=52).status_code, 400)
+        self.assertEqual(self.book(start='2030-01-01', count=53).status_code, 400)
+        self.assertEqual(self.book(start='2030-01-01', count=2, time='16:00').status_code, 400)
+        self.assertEqual(self.book(start='2030-01-01', count=2, dates=['2030-01-01']).status_code, 400)
+
+class ScheduleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.doctor = make_doctor('doc', slot_minutes=60)
+        self.other = make_doctor('other')
+        self.patient = make_patient('patient')
+        self.staff = User.objects.create(username='staff', is_staff=True)
+        self.monday = datetime.date(2030, 1, 7)
+        self.client.force_authenticate(self.doctor.user)
+        response = self.client.put(reverse('doctor-schedule', args=[self.doctor.id]), {
+            'weekly': [
+                {'weekday': 0, 'start': '09:00', 'end': '12:00'},
+                {'weekday': 0, 'start': '13:00', 'end': '15:00', 'slot_minutes': 30},  # after a lunch break
+                {'weekday': 2, 'start': '10:00', 'end': '11:00'},
+            ],
+            'exceptions': [{'date': '2030-01-16', 'reason': 'Conference'}],
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.doctor.refresh_from_db()
+
+    def slots(self, doctor, day):
+        self.client.force_authenticate(self.patient.user)
+        return self.client.get(reverse('available-slots'), {'doctor': doctor.id, 'date': day.isoformat()}).data['available_slots']
+
+    def test_weekly_template_with_breaks_and_days_off(self):
+        self.assertEqual(self.slots(self.doctor, self.monday), ['09:00', '10:00', '11:00', '13:00', '13:30', '14:00', '14:30'])
+        self.assertEqual(self.slots(self.doctor, self.monday + datetime.timedelta(days=1)), [])  # no Tuesday blocks
+        self.assertEqual(self.slots(self.doctor, self.monday + datetime.timedelta(days=2)), ['10:00'])
+        self.assertEqual(self.slots(self.doctor, self.monday + datetime.timedelta(days=9)), [])  # exception day off
+        self.assertEqual(self.slots(self.other, self.monday), ['09:00', '11:00', '13:00', '15:00'])  # no template: working hours
+
+        def book(day, time):
+            return self.client.post(reverse('appointments'), {'doctor': self.doctor.id, 'date': day, 'time': time}).status_code
+
+        self.assertEqual(book('2030-01-07', '13:30'), 201)
+        self.assertEqual(book('2030-01-07', '12:00'), 400)  # the break
+        self.assertEqual(book('2030-01-07', '09:30'), 400)  # not a slot start
+        self.assertEqual(book('2030-01-08', '09:00'), 400)
+        self.assertEqual(self.slots(self.doctor, self.monday)[3:5], ['13:00', '14:00'])
+
+    def test_holidays_close_every_doctor_unless_they_add_hours(self):
+        self.client.force_authenticate(self.staff)
+        response = self.client.post(reverse('holidays'), {'date': '2030-01-07', 'reason': 'Clinic closed'})
+        self.assertEqual(response.status_code, 201)
+        ScheduleException.objects.create(doctor=self.doctor, date=self.monday, start=datetime.time(10, 0), end=datetime.time(12, 0))
+        self.assertEqual(self.slots(self.other, self.monday), [])
+        self.assertEqual(self.slots(self.doctor, self.monday), ['10:00', '11:00'])
+        self.assertEqual(self.slots(self.other, self.monday + datetime.timedelta(days=7)), ['09:00', '11:00', '13:00', '15:00'])
+        # Doctors added later get the holiday too
+        self.assertEqual(self.slots(make_doctor('new'), self.monday), [])
+
+        self.client.force_authenticate(self.staff)
+        self.assertEqual(self.client.delete(reverse('holiday-delete', args=[response.data['id']])).status_code, 204)
+        self.assertEqual(self.slots(self.other, self.monday), ['09:00', '11:00', '13:00', '15:00'])
+
+    def test_rejects_bad_schedules(self):
+        url = reverse('doctor-schedule', args=[self.doctor.id])
+        overlapping = {'weekly': [{'weekday': 0, 'start': '09:00', 'end': '12:00'}, {'weekday': 0, 'start': '11:00', 'end': '13:00'}]}
+        self.assertEqual(self.client.put(url, overlapping, format='json').status_code, 400)
+        off_grid = {'weekly': [{'weekday': 0, 'start': '09:07', 'end': '12:00'}]}
+        self.assertEqual(self.client.put(url, off_grid, format='json').status_code, 400)
+        self.client.force_authenticate(self.patient.user)
+        self.assertEqual(self.client.put(url, {'weekly': []}, format='json').status_code, 403)
+        self.assertEqual(self.client.post(reverse('holidays'), {'date': '2030-01-07'}).status_code, 403)
+        self.assertEqual(len(self.client.get(url).data['weekly']), 3)
+
+    def test_lookups_are_bit_operations_on_the_compiled_schedule(self):
+        plan = schedules.schedule_for(self.doctor).day(self.monday)
+        self.assertEqual(plan.starts, sum(1 << cell for cell in (108, 120, 132, 156, 162, 168, 174)))
+        self.assertEqual(plan.slot_minutes(datetime.time(13, 30)), 30)
+        # A booking made under an older template blocks every slot it overlaps
+        self.assertEqual(plan.free(plan.occupied([datetime.time(9, 30)])), [datetime.time(10, 0), datetime.time(11, 0), *plan.free()[3:]])
+        with self.assertNumQueries(2):  # doctors and booked times; the schedule comes with the doctor row
+            self.client.get(reverse('available-slots'), {'doctor': self.doctor.id, 'start': '2030-01-01', 'end': '2030-03-31'})
+
+    def test_calendar_feed_shows_the_weekly_hours(self):
+        body = b''.join(self.client.get(reverse('doctor-calendar', args=[self.doctor.id])).streaming_content).decode()
+        self.assertIn('DTSTART;TZID=UTC:20000103T130000\r\nDTEND;TZID=UTC:20000103T150000\r\nRRULE:FREQ=WEEKLY;BYDAY=MO', body)
+        self.assertEqual(body.count('BEGIN:AVAILABLE'), 3)
+
+    def test_working_hours_must_fit_the_grid(self):
+        self.client.force_authenticate(self.staff)
+        for hours in ({'slot_minutes': 7}, {'slot_minutes': 3}, {'working_start': '09:02'}, {'working_end': '08:00'}):
+            self.assertEqual(self.client.put(reverse('doctor-detail', args=[self.other.id]), hours, format='json').status_code, 400, hours)
+            self.assertEqual(self.client.put(reverse('edit-doctor', args=[self.other.id]), hours).status_code, 400, hours)
+        self.assertEqual(self.client.put(reverse('doctor-detail', args=[self.other.id]), {'slot_minutes': 30}, format='json').status_code, 200)
+        response = self.client.post(reverse('add-doctor-api'), {
+            'username': 'new', 'password': 'pw', 'working_start': '09:00', 'working_end': '17:00', 'slot_minutes': 7,
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(User.objects.filter(username='new').exists())
+        rows = [{'username': 'imported', 'password': 'pw', 'working_start': '09:02', 'working_end': '17:00'}]
+        self.assertIn('working_hours', importers.import_rows('doctors', rows, workers=0)['errors'][0]['errors'])
+
+    def test_replacing_a_schedule_compiles_it_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            schedules.replace_schedule(self.doctor, [{'weekday': 1, 'start': datetime.time(9, 0), 'end': datetime.time(10, 0)}], [])
+        # Each compile reads the template once
+        compiles = [query for query in queries if query['sql'].startswith('SELECT') and 'FROM "appointments_scheduleblock"' in query['sql']]
+        self.assertEqual(len(compiles), 1)
+        self.doctor.refresh_from_db()
+        self.assertEqual(schedules.schedule_for(self.doctor).day(self.monday + datetime.timedelta(days=1)).times, (datetime.time(9, 0),))
+
+
+class StatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='staff', is_staff=True))
+        self.cardiologist = make_doctor('heart', specialization='Cardiology', city='Boston', consultation_fee=100)
+        self.general = make_doctor('general', city='Chicago', consultation_fee=50)
+        self.patient = make_patient('patient')
+
+    def book(self, doctor, day, time=datetime.time(9, 0)):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Appointment.objects.create(doctor=doctor, patient=self.patient, date=day, time=time)
+
+    def rows(self):
+        return set(DailyStats.objects.values_list('doctor_id', 'date', 'appointments', 'revenue'))
+
+    def segments(self):
+        return set(DailySegmentStats.objects.values_list('date', 'specialization', 'city', 'appointments', 'revenue'))
+
+    def test_rollups_follow_appointment_changes(self):
+        jan1, jan2 = datetime.date(2030, 1, 1), datetime.date(2030, 1, 2)
+        self.book(self.cardiologist, jan1)
+        moved = self.book(self.cardiologist, jan1, datetime.time(11, 0))
+        cancelled = self.book(self.general, jan2)
+        self.assertIn((self.cardiologist.id, jan1, 2, 200), self.rows())
+        with self.captureOnCommitCallbacks(execute=True):
+            moved.doctor, moved.date = self.general, jan2
+            moved.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            cancelled.delete()
+        self.assertEqual(self.rows(), {(self.cardiologist.id, jan1, 1, 100), (self.general.id, jan2, 1, 50)})
+        self.assertEqual(self.segments(), {(jan1, 'Cardiology', 'Boston', 1, 100), (jan2, 'General', 'Chicago', 1, 50)})
+        # The same rows a rebuild computes from scratch
+        expected = self.rows(), self.segments()
+        call_command('rebuild_stats', stdout=io.StringIO())
+        self.assertEqual((self.rows(), self.segments()), expected)
+
+    def test_profile_changes_and_bulk_writes(self):
+        self.book(self.cardiologist, datetime.date(2030, 1, 1))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cardiologist.consultation_fee = 120
+            self.cardiologist.city = 'Cambridge'
+            self.cardiologist.save()
+        self.assertEqual(DailyStats.objects.values_list('city', 'revenue').get(), ('Cambridge', 120))
+        self.assertEqual(self.segments(), {(datetime.date(2030, 1, 1), 'Cardiology', 'Cambridge', 1, 120)})
+
+        Appointment.objects.bulk_create([
+            Appointment(doctor=self.general, patient=self.patient, date=datetime.date(2030, 2, day), time=datetime.time(9, 0))
+            for day in range(1, 11)
+        ])
+        self.assertEqual(DailyStats.objects.count(), 1)  # bulk_create sends no signals
+        self.assertEqual(rollups.rebuild(start=datetime.date(2030, 2, 1)), 10)
+        self.assertEqual(DailyStats.objects.count(), 11)
+
+    def test_deleting_a_doctor_empties_their_segments(self):
+        jan1 = datetime.date(2030, 1, 1)
+        other = make_doctor('other', specialization='Cardiology', city='Boston', consultation_fee='33.33')
+        self.book(self.cardiologist, jan1)
+        for hour in (9, 10, 11):
+            self.book(other, jan1, datetime.time(hour, 0))
+        self.assertEqual(self.segments(), {(jan1, 'Cardiology', 'Boston', 4, Decimal('199.99'))})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cardiologist.delete()
+        self.assertEqual(self.segments(), {(jan1, 'Cardiology', 'Boston', 3, Decimal('99.99'))})
+        with self.captureOnCommitCallbacks(execute=True):
+            other.delete()
+        self.assertEqual(self.segments(), set())
+        self.assertEqual(self.client.get(reverse('stats'), {'start': '2030-01-01', 'end': '2030-01-31'}).data['totals'], {'appointments': 0, 'revenue': '0.00'})
+
+    def test_stats_endpoint(self):
+        for day in range(1, 4):
+            self.book(self.cardiologist, datetime.date(2030, 1, day))
+        self.book(self.cardiologist, datetime.date(2030, 1, 3), datetime.time(11, 0))
+        self.book(self.general, datetime.date(2030, 2, 1))
+        self.book(self.general, datetime.date(2031, 1, 1))
+
+        with self.assertNumQueries(1):  # per-day sums of the segment rollups, folded into months
+            response = self.client.get(reverse('stats'), {'start': '2030-01-01', 'end': '2030-12-31', 'group_by': 'month'})
+        self.assertEqual(response.data['totals'], {'appointments': 5, 'revenue': '450.00'})
+        self.assertEqual(response.data['results'], [
+            {'month': '2030-01-01', 'appointments': 4, 'revenue': '400.00'},
+            {'month': '2030-02-01', 'appointments': 1, 'revenue': '50.00'},
+        ])
+
+        by_city = self.client.get(reverse('stats'), {'start': '2030-01-01', 'end': '2031-12-31', 'group_by': 'city'}).data
+        self.assertEqual([(row['city'], row['appointments']) for row in by_city['results']], [('Boston', 4), ('Chicago', 2)])
+        general = self.client.get(reverse('stats'), {'start': '2030-01-01', 'end': '2031-12-31', 'specialization': 'General'}).data
+        self.assertEqual(general['totals']['appointments'], 2)
+
+        # Four two-hour slots a day from working hours
+        utilization = self.client.get(reverse('stats'), {
+            'start': '2030-01-01', 'end': '2030-01-05', 'doctor': self.cardiologist.id,
+        }).data
+        self.assertEqual(utilization['totals'], {'appointments': 4, 'revenue': '400.00', 'slots': 20, 'utilization': 0.2})
+        self.assertEqual(utilization['results'][2], {'day': '2030-01-03', 'appointments': 2, 'revenue': '200.00', 'slots': 4, 'utilization': 0.5})
+
+    def test_rejects_bad_queries(self):
+        self.assertEqual(self.client.get(reverse('stats'), {'group_by': 'week'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('stats'), {'start': '2030-01-02', 'end': '2030-01-01'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('stats'), {'start': '2000-01-01', 'end': '2030-01-01'}).status_code, 400)
+        self.client.force_authenticate(self.patient.user)
+        self.assertEqual(self.client.get(reverse('stats')).status_code, 403)
+
+    def test_default_range_stops_at_the_first_day(self):
+        for end in ('0001-01-05', '9999-12-31'):
+            for group_by in ('day', 'month'):
+                response = self.client.get(reverse('stats'), {'end': end, 'group_by': group_by, 'doctor': self.cardiologist.id})
+                self.assertEqual(response.status_code, 200)
+
+class AdminTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        self.doctors = [make_doctor('heart', specialization='Cardiology'), make_doctor('general')]
+        self.patient = make_patient('smith', phone='5550100')
+
+    def book(self, count, start=0):
+        Appointment.objects.bulk_create([
+            Appointment(doctor=self.doctors[i % 2], patient=self.patient, date=datetime.date(2030, 1, 1), time=datetime.time(8 + i % 8, i // 8 * 5))
+            for i in range(start, start + count)
+        ])
+
+    def changelist_queries(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:appointments_appointment_changelist'), params)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_appointment_changelist_queries_do_not_grow_with_rows(self):
+        self.book(2)
+        _, few = self.changelist_queries()
+        self.book(40, start=2)
+        response, many = self.changelist_queries()
+        self.assertEqual(few, many)
+        self.assertContains(response, 'Dr. heart with Pat smith')
+
+    def test_filters_by_doctor_and_specialization(self):
+        self.book(4)
+        unbooked = make_doctor('unbooked', specialization='General')
+        response, _ = self.changelist_queries(doctor__id__exact=self.doctors[0].id)
+        self.assertEqual(response.context['cl'].result_count, 2)
+        self.assertNotContains(response, str(unbooked))  # no sidebar listing every doctor
+        response, _ = self.changelist_queries(specialization='General')
+        self.assertEqual(set(response.context['cl'].result_list), set(Appointment.objects.filter(doctor=self.doctors[1])))
+
+    def test_patient_search_uses_prefix_search(self):
+        make_patient('jones')
+        response = self.client.get(reverse('admin:appointments_patientprofile_changelist'), {'q': 'smi'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.patient])
+
+    def count(self, appointments):
+        paginator = EstimatedCountPaginator(appointments.order_by('id'), 2)
+        paginator.count_limit = 3
+        return paginator.count
+
+    def test_count_is_estimated_past_the_limit(self):
+        self.book(8)
+        Appointment.objects.filter(id=Appointment.objects.order_by('id')[2].id).delete()  # a gap the estimate can't see
+        self.assertEqual(self.count(Appointment.objects.all()), 8)
+        self.assertEqual(self.count(Appointment.objects.filter(doctor=self.doctors[1])), 3)  # 4, capped
+        self.assertEqual(self.count(Appointment.objects.filter(doctor=self.doctors[0])), 3)
+
+
+class ConcurrentBookingTests(TransactionTestCase):
+    clients = 200
+
+    def test_same_slot_booked_exactly_once(self):
+        doctor = make_doctor('doc')
+        patients = [make_patient(f'patient{i}') for i in range(self.clients)]
+        barrier = threading.Barrier(self.clients)
+
+        def book(patient):
+            client = APIClient()
+            client.force_authenticate(patient.user)
+            barrier.wait()
+            try:
+                return client.post(reverse('appointments'), {'doctor': doctor.id, 'date': '2030-01-01', 'time': '09:00'}).status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.clients) as pool:
+            codes = list(pool.map(book, patients))
+
+        self.assertEqual(codes.count(201), 1)
+        self.assertEqual(codes.count(409), self.clients - 1)
+        self.assertEqual(Appointment.objects.filter(doctor=doctor).count(), 1)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Query plan assertions are written against SQLite EXPLAIN QUERY PLAN output')
+class QueryPlanTests(TestCase):
+    """Runs EXPLAIN on every appointment query an endpoint issues and fails on full table scans."""
+    table = Appointment._meta.db_table
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctors = [make_doctor(f'doc{i}') for i in range(20)]
+        cls.patients = [make_patient(f'patient{i}') for i in range(50)]
+        start = datetime.date(2030, 1, 1)
+        Appointment.objects.bulk_create(
+            Appointment(
+                doctor=doctor,
+                patient=cls.patients[(d * 7 + day) % len(cls.patients)],
+                date=start + datetime.timedelta(days=day),
+                time=datetime.time(9 + 2 * (day % 4), 0),
+            )
+            for d, doctor in enumerate(cls.doctors)
+            for day in range(100)
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def plans(self, user, name, params=None):
+        client = APIClient()
+        client.force_authenticate(user)
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(reverse(name), params or {})
+        self.assertEqual(response.status_code, 200)
+        plans = []
+        with connection.cursor() as cursor:
+            for query in context.captured_queries:
+                if self.table not in query['sql']:
+                    continue
+                cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                plans.append(' | '.join(str(row[-1]) for row in cursor.fetchall()))
+        self.assertTrue(plans)
+        return plans
+
+    def assertIndexed(self, plans):
+        for plan in plans:
+            for step in plan.split(' | '):
+                if step.startswith(f'SCAN {self.table}'):
+                    self.assertIn('INDEX', step, plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_patient_timeline(self):
+        self.assertIndexed(self.plans(self.patients[0].user, 'appointments'))
+
+    def test_doctor_timeline(self):
+        user = self.doctors[0].user
+        user.is_staff = False
+        self.assertIndexed(self.plans(user, 'appointments'))
+
+    def test_staff_listing(self):
+        self.assertIndexed(self.plans(self.doctors[0].user, 'appointments'))
+
+    def test_available_slots(self):
+        doctor = self.doctors[0]
+        self.assertIndexed(self.plans(doctor.user, 'available-slots', {'doctor': doctor.id, 'start': '2030-01-01', 'end': '2030-01-31'}))
+
+    def test_doctor_list_prefetch(self):
+        self.assertIndexed(self.plans(self.patients[0].user, 'doctors'))
+
+
+class FailingEmailBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise ConnectionError('SMTP unavailable')
+
+
+class SlowEmailBackend(locmem.EmailBackend):
+    # Runs `while_sending` once, in the middle of the first send
+    while_sending = None
+
+    def send_messages(self, messages):
+        hook, SlowEmailBackend.while_sending = SlowEmailBackend.while_sending, None
+        if hook:
+            hook()
+        return super().send_messages(messages)
+
+
+class NotificationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.patient = make_patient('patient')
+        self.patient.user.email = 'patient@example.com'
+        self.patient.user.save()
+        self.client.force_authenticate(self.patient.user)
+        self.doctor = make_doctor('doc')
+
+    def test_booking_queues_confirmation_without_sending(self):
+        response = self.client.post(reverse('appointments'), {'doctor': self.doctor.id, 'date': '2030-01-01', 'time': '09:00'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(mail.outbox), 0)
+        queued = EmailOutbox.objects.get()
+        self.assertEqual(queued.to, 'patient@example.com')
+
+        self.assertEqual(notifications.send_pending(), (1, 0))
+        self.assertEqual(mail.outbox[0].subject, 'Appointment Confirmation')
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, EmailOutbox.SENT)
+        self.assertEqual(notifications.send_pending(), (0, 0))
+
+    @override_settings(EMAIL_BACKEND='appointments.tests.FailingEmailBackend')
+    def test_failed_sends_are_retried_then_given_up(self):
+        queued = notifications.queue_email('Subject', 'Body', ['a@example.com'])
+        for attempt in range(1, notifications.MAX_ATTEMPTS + 1):
+            EmailOutbox.objects.filter(id=queued.id).update(next_attempt_at=timezone.now())
+            self.assertEqual(notifications.send_pending(), (0, 1))
+            queued.refresh_from_db()
+            self.assertEqual(queued.attempts, attempt)
+        self.assertEqual(queued.status, EmailOutbox.FAILED)
+        self.assertIn('SMTP unavailable', queued.last_error)
+
+    def test_rows_another_worker_leases_meanwhile_are_left_to_it(self):
+        notifications.queue_email('Subject', 'Body', ['a@example.com'])
+        raced = []
+
+        def other_worker(execute, sql, params, many, context):
+            # Between this worker's read and its lease, another one leases the same row
+            if sql.startswith('UPDATE "appointments_emailoutbox"') and not raced:
+                raced.append(True)
+                EmailOutbox.objects.update(next_attempt_at=timezone.now() + notifications.LEASE)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(other_worker):
+            self.assertEqual(notifications.claim_batch(), [])
+        self.assertEqual(raced, [True])
+
+    @override_settings(EMAIL_BACKEND='appointments.tests.SlowEmailBackend')
+    def test_a_batch_that_outlives_its_lease_is_not_sent_twice(self):
+        for subject in ('First', 'Second', 'Third'):
+            notifications.queue_email(subject, 'Body', ['a@example.com'])
+        other = []
+
+        def lease_runs_out():
+            # The first send is slow: the lease on the rest of the batch expires and another worker claims it
+            EmailOutbox.objects.exclude(subject='First').update(next_attempt_at=timezone.now())
+            other.append(notifications.send_pending())
+
+        SlowEmailBackend.while_sending = lease_runs_out
+        self.assertEqual(notifications.send_pending(), (1, 0))
+        self.assertEqual(other, [(2, 0)])
+        self.assertEqual(sorted(message.subject for message in mail.outbox), ['First', 'Second', 'Third'])
+        self.assertEqual(EmailOutbox.objects.filter(status=EmailOutbox.SENT).count(), 3)
+
+
+class AppointmentExportTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.doctor = make_doctor('doc')
+        self.other = make_doctor('other')
+        self.patient = make_patient('patient')
+        self.client.force_authenticate(self.doctor.user)
+        for day in range(1, 6):
+            Appointment.objects.create(doctor=self.doctor, patient=self.patient, date=datetime.date(2030, 1, day), time=datetime.time(9, 0))
+        Appointment.objects.create(doctor=self.other, patient=self.patient, date=datetime.date(2030, 1, 2), time=datetime.time(9, 0))
+
+    def test_csv_stream_with_filters(self):
+        response = self.client.get(reverse('appointments-export'), {'doctor': self.doctor.id, 'start': '2030-01-02', 'end': '2030-01-04'})
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(','), exports.HEADER)
+        self.assertEqual([line.split(',')[1] for line in lines[1:]], ['2030-01-02', '2030-01-03', '2030-01-04'])
+
+    def test_ndjson_stream(self):
+        response = self.client.get(reverse('appointments-export'), {'type': 'ndjson'})
+        records = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(records), 6)
+        self.assertEqual(records[0]['doctor_last_name'], 'doc')
+
+    def test_patients_cannot_export(self):
+        self.client.force_authenticate(self.patient.user)
+        self.assertEqual(self.client.get(reverse('appointments-export')).status_code, 403)
+
+
+
+class CalendarFeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.doctor = make_doctor('doc', clinic_address='1 Main St, Springfield')
+        self.patient = make_patient('patient')
+        self.first = Appointment.objects.create(doctor=self.doctor, patient=self.patient, date=datetime.date(2030, 1, 1), time=datetime.time(9, 0))
+        self.second = Appointment.objects.create(doctor=self.doctor, patient=self.patient, date=datetime.date(2030, 1, 2), time=datetime.time(11, 0))
+        self.url = reverse('doctor-calendar', args=[self.doctor.id])
+
+    def feed(self, **params):
+        response = self.client.get(self.url, {'token': ics.feed_token(self.doctor), **params})
+        if response.status_code != 200:
+            return response, ''
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_streams_events_and_working_hours(self):
+        response, body = self.feed()
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        self.assertEqual(response['X-Sync-Mode'], 'full')
+        self.assertTrue(body.startswith('BEGIN:VCALENDAR\r\n') and body.endswith('END:VCALENDAR\r\n'))
+        self.assertIn(f'UID:appointment-{self.first.id}@', body)
+        self.assertIn('DTSTART:20300101T090000Z\r\nDTEND:20300101T110000Z', body)
+        self.assertIn('LOCATION:1 Main St\\, Springfield', body)
+        self.assertIn('DTSTART;TZID=UTC:20000101T090000', body)
+        self.assertEqual(body.count('BEGIN:VEVENT'), 2)
+
+    def test_access(self):
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.assertEqual(self.client.get(self.url, {'token': ics.feed_token(DoctorProfile(id=self.doctor.id + 1))}).status_code, 403)
+        self.client.force_authenticate(self.patient.user)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.client.force_authenticate(self.doctor.user)
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        link = self.client.get(reverse('doctor-calendar-link', args=[self.doctor.id])).data['url']
+        self.assertTrue(link.endswith(f'{self.url}?token={ics.feed_token(self.doctor)}'))
+
+    def test_resetting_the_link_revokes_old_tokens(self):
+        old = ics.feed_token(self.doctor)
+        self.client.force_authenticate(self.patient.user)
+        self.assertEqual(self.client.post(reverse('doctor-calendar-link', args=[self.doctor.id])).status_code, 403)
+        self.client.force_authenticate(self.doctor.user)
+        link = self.client.post(reverse('doctor-calendar-link', args=[self.doctor.id])).data['url']
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(self.url, {'token': old}).status_code, 403)
+        self.assertEqual(self.client.get(link).status_code, 200)
+        self.doctor.refresh_from_db()
+        self.assertEqual(link, f'http://testserver{self.url}?token={ics.feed_token(self.doctor)}')
+
+    def test_not_modified_until_something_changes(self):
+        response, _ = self.feed()
+        token = ics.feed_token(self.doctor)
+        with self.assertNumQueries(3):  # doctor and the two latest-change lookups; nothing is streamed
+            unchanged = self.client.get(self.url, {'token': token}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(unchanged.status_code, 304)
+        self.assertEqual(self.client.get(self.url, {'token': token}, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+        self.first.delete()
+        changed = self.client.get(self.url, {'token': token}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(b''.join(changed.streaming_content).decode().count('BEGIN:VEVENT'), 1)
+
+    def test_sync_token_returns_only_changes(self):
+        other = make_doctor('other')
+        since = ics.encode_sync_token(timezone.now())
+        third = Appointment.objects.create(doctor=self.doctor, patient=self.patient, date=datetime.date(2030, 1, 3), time=datetime.time(9, 0))
+        self.first.delete()
+        self.second.doctor = other
+        self.second.save()
+
+        response, body = self.feed(sync_token=since)
+        self.assertEqual(response['X-Sync-Mode'], 'delta')
+        self.assertEqual(body.count('BEGIN:VEVENT'), 3)
+        self.assertIn(f'UID:appointment-{third.id}@', body)
+        self.assertEqual(body.count('STATUS:CANCELLED'), 2)  # deleted, and moved to another doctor
+        self.assertNotIn('VAVAILABILITY', body)
+        self.assertTrue(DeletedAppointment.objects.filter(appointment_id=self.second.id, doctor_id=self.doctor.id).exists())
+
+        # A profile change touches every event, and a garbled token can't be trusted
+        self.doctor.slot_minutes = 60
+        self.doctor.save()
+        self.assertEqual(self.feed(sync_token=since)[0]['X-Sync-Mode'], 'full')
+        self.assertEqual(self.feed(sync_token='junk')[0]['X-Sync-Mode'], 'full')
+
+    def test_prune_keeps_the_sync_window(self):
+        self.first.delete()
+        self.assertEqual(ics.prune(), 0)
+        self.assertEqual(ics.prune(now=timezone.now() + ics.SYNC_WINDOW + datetime.timedelta(seconds=1)), 1)
+
+    def test_long_lines_are_folded(self):
+        line = 'SUMMARY:' + 'é' * 60
+        folded = ics.fold(line)
+        self.assertTrue(all(len(part.encode()) <= 75 for part in folded.split('\r\n')))
+        self.assertEqual(folded.replace('\r\n ', '').rstrip('\r\n'), line)
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class BulkImportTests(TestCase):
+    def test_import_doctors_with_error_report(self):
+        make_doctor('taken')
+        rows = [
+            {'username': 'doc1', 'password': 'pw', 'first_name': 'A', 'working_start': '09:00', 'working_end': '17:00'},
+            {'username': 'doc2', 'password': 'pw', 'working_start': 'later', 'working_end': '17:00'},
+            {'username': 'doc1', 'password': 'pw', 'working_start': '09:00', 'working_end': '17:00'},
+            {'username': 'taken', 'password': 'pw', 'working_start': '09:00', 'working_end': '17:00'},
+            {'username': 'doc3', 'password': 'pw', 'working_start': '10:00', 'working_end': '12:00', 'consultation_fee': '50'},
+        ]
+        report = importers.import_rows('doctors', rows, batch_size=2, workers=0)
+        self.assertEqual(report['created'], 2)
+        self.assertEqual([error['row'] for error in report['errors']], [2, 3, 4])
+        self.assertIn('working_start', report['errors'][0]['errors'])
+        doctor = DoctorProfile.objects.get(user__username='doc3')
+        self.assertTrue(doctor.user.is_staff)
+        self.assertTrue(doctor.user.check_password('pw'))
+
+    def test_import_patients_with_process_pool(self):
+        rows = [{'username': f'p{i}', 'password': 'pw', 'first_name': 'P', 'last_name': str(i)} for i in range(10)]
+        report = importers.import_rows('patients', rows, batch_size=4, workers=2)
+        self.assertEqual(report, {'created': 10, 'errors': []})
+        self.assertTrue(PatientProfile.objects.get(user__username='p3').user.check_password('pw'))
+
+    def test_admin_api_accepts_jsonl(self):
+        client = APIClient()
+        client.force_authenticate(make_doctor('admin').user)
+        upload = SimpleUploadedFile('patients.jsonl', b'{"username": "p1", "password": "pw", "first_name": "P", "last_name": "One"}\n')
+        response = client.post(reverse('bulk-import', args=['patients']), {'file': upload})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 1)
+
+    def test_unreadable_lines_are_row_errors(self):
+        client = APIClient()
+        client.force_authenticate(make_doctor('admin').user)
+        lines = [
+            b'{"username": "p1", "password": "pw", "first_name": "P", "last_name": "One"}',
+            b'{"username": ',
+            b'["not", "an", "object"]',
+            b'\xff\xfe',
+            b'{"username": "p2", "password": "pw", "first_name": "P", "last_name": "Two"}',
+        ]
+        response = client.post(reverse('bulk-import', args=['patients']), {'file': SimpleUploadedFile('patients.jsonl', b'\n'.join(lines))})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual([error['row'] for error in response.data['errors']], [2, 3, 4])
+
+    def test_large_uploads_go_through_the_command(self):
+        client = APIClient()
+        client.force_authenticate(make_doctor('admin').user)
+        rows = b''.join(b'{"username": "p%d", "password": "pw"}\n' % i for i in range(importers.MAX_UPLOAD_ROWS + 1))
+        response = client.post(reverse('bulk-import', args=['patients']), {'file': SimpleUploadedFile('patients.jsonl', rows)})
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(PatientProfile.objects.exists())
+
+
+class TimelineCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.doctor = make_doctor('doc')
+        self.doctor.user.is_staff = False
+        self.doctor.user.save()
+        self.patient = make_patient('patient')
+        self.other = make_patient('other')
+        self.appointment = Appointment.objects.create(doctor=self.doctor, patient=self.patient, date=datetime.date(2030, 1, 1), time=datetime.time(9, 0))
+
+    def get(self, user):
+        self.client.credentials(HTTP_AUTHORIZATION=bearer(user))
+        return self.client.get(reverse('appointments')).data
+
+    def test_hits_and_invalidation_on_save_and_delete(self):
+        self.assertEqual(len(self.get(self.patient.user)), 1)
+        self.client.credentials(HTTP_AUTHORIZATION=bearer(self.patient.user))
+        with self.assertNumQueries(0):  # role and patient id come from the token
+            self.assertEqual(len(self.client.get(reverse('appointments')).data), 1)
+        self.assertEqual(len(self.get(self.other.user)), 0)
+        self.assertEqual(caching.stats(), {'hits': 1, 'misses': 2, 'hit_rate': 0.3333})
+
+        # Moving the appointment clears both the old and the new patient's timeline
+        with self.captureOnCommitCallbacks(execute=True):
+            self.appointment.patient = self.other
+            self.appointment.save()
+        self.assertEqual(len(self.get(self.patient.user)), 0)
+        self.assertEqual(len(self.get(self.other.user)), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.appointment.delete()
+        self.assertEqual(self.get(self.doctor.user), [])
+        self.assertEqual(self.get(self.other.user), [])
+
+    def test_a_timeline_built_across_an_invalidation_is_not_kept(self):
+        def build():
+            # A booking commits while this request is still reading the old rows
+            caching.invalidate_timelines([self.doctor.id], [self.patient.id])
+            return ['stale']
+
+        self.assertEqual(caching.get_timeline('patient', self.patient.id, build), ['stale'])
+        self.assertEqual(caching.get_timeline('patient', self.patient.id, lambda: ['fresh']), ['fresh'])
+
+        async def abuild():
+            caching.invalidate_timelines([self.doctor.id], [self.patient.id])
+            return ['stale']
+
+        async def afresh():
+            return ['fresh']
+
+        self.assertEqual(async_to_sync(caching.aget_timeline)('doctor', self.doctor.id, abuild), ['stale'])
+        self.assertEqual(async_to_sync(caching.aget_timeline)('doctor', self.doctor.id, afresh), ['fresh'])
+
+    def test_doctor_rename_invalidates_patient_timelines(self):
+        self.assertEqual(self.get(self.patient.user)[0]['doctor_name'], 'Doc doc')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.doctor.user.last_name = 'Renamed'
+            self.doctor.user.save()
+        self.assertEqual(self.get(self.patient.user)[0]['doctor_name'], 'Doc Renamed')
+
+    def test_stats_endpoint(self):
+        self.client.force_authenticate(make_doctor('admin').user)
+        self.assertEqual(self.client.get(reverse('appointments-cache-stats')).data['hits'], 0)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.patient = make_patient('patient')
+        self.client.force_authenticate(self.patient.user)
+        self.doctor = make_doctor('doc')
+
+    def test_doctor_list_not_modified_until_appointments_change(self):
+        response = self.client.get(reverse('doctors'))
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('doctors'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Appointment.objects.create(doctor=self.doctor, patient=self.patient, date=datetime.date(2030, 1, 1))
+        response = self.client.get(reverse('doctors'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_etag_depends_on_query_string(self):
+        first = self.client.get(reverse('available-slots'), {'doctor': self.doctor.id, 'date': '2030-01-01'})
+        second = self.client.get(reverse('available-slots'), {'doctor': self.doctor.id, 'date': '2030-01-02'})
+        self.assertNotEqual(first['ETag'], second['ETag'])
+
+    def test_user_profile_uses_per_user_version(self):
+        etag = self.client.get(reverse('user-profile'))['ETag']
+        self.assertEqual(self.client.get(reverse('user-profile'), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # Another user's change does not touch this principal's version
+        with self.captureOnCommitCallbacks(execute=True):
+            self.doctor.user.first_name = 'Changed'
+            self.doctor.user.save()
+        self.assertEqual(self.client.get(reverse('user-profile'), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.patient.user.email = 'new@example.com'
+            self.patient.user.save()
+        self.assertEqual(self.client.get(reverse('user-profile'), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+def png_upload(name='photo.png', size=(1200, 900)):
+    data = io.BytesIO()
+    Image.new('RGB', size, 'teal').save(data, 'PNG')
+    return SimpleUploadedFile(name, data.getvalue(), content_type='image/png')
+
+
+class ThumbnailTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root, THUMBNAIL_ASYNC=False)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client = APIClient()
+        self.patient = make_patient('patient')
+        self.client.force_authenticate(self.patient.user)
+
+    def test_thumbnail_generated_after_upload(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            doctor = make_doctor('doc', profile_image=png_upload())
+        doctor.refresh_from_db()
+        self.assertTrue(doctor.profile_thumbnail.name.startswith(thumbnails.UPLOAD_TO))
+        with doctor.profile_thumbnail.open('rb') as fileobj, Image.open(fileobj) as image:
+            self.assertLessEqual(max(image.size), max(thumbnails.SIZE))
+
+        Appointment.objects.create(doctor=doctor, patient=self.patient, date=datetime.date(2030, 1, 1))
+        row = self.client.get(reverse('doctors')).data[0]
+        self.assertEqual(row['profile_thumbnail'], doctor.profile_thumbnail.url)
+
+        # Served by the development server only; tests run with DEBUG off, as production does
+        with self.assertRaises(NoReverseMatch):
+            reverse('thumbnail-media', args=['x.jpg'])
+        path = doctor.profile_thumbnail.name.removeprefix(thumbnails.UPLOAD_TO)
+        response = thumbnail_media(RequestFactory().get(doctor.profile_thumbnail.url), path)
+        self.assertIn('immutable', response['Cache-Control'])
+
+    def test_backfill_command_and_fallback(self):
+        doctor = make_doctor('doc', profile_image=png_upload())  # on_commit never runs: no thumbnail yet
+        Appointment.objects.create(doctor=doctor, patient=self.patient, date=datetime.date(2030, 1, 1))
+        self.client.force_authenticate(doctor.user)
+        self.assertEqual(self.client.get(reverse('patients'), {'expand': 'appointments'}).data['results'][0]['appointments'][0]['doctor_profile_image'], doctor.profile_image.url)
+
+        call_command('generate_thumbnails', stdout=io.StringIO())
+        doctor.refresh_from_db()
+        self.assertFalse(thumbnails.is_stale(doctor))
+        self.assertEqual(self.client.get(reverse('patients'), {'expand': 'appointments'}).data['results'][0]['appointments'][0]['doctor_profile_image'], doctor.profile_thumbnail.url)
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        registry.reset()
+        self.client = APIClient()
+        self.patient = make_patient('patient')
+        self.client.force_authenticate(self.patient.user)
+        make_doctor('doc')
+
+    def test_records_per_url_name_and_server_timing(self):
+        response = self.client.get(reverse('doctors'))
+        self.assertIn('desc="2 queries"', response['Server-Timing'])
+        self.client.force_authenticate(User.objects.create(username='staff', is_staff=True))
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('http_request_sql_queries_bucket{url_name="doctors",le="2"} 1', body)
+        self.assertIn('http_request_duration_seconds_count{url_name="doctors"} 1', body)
+
+    def test_streamed_responses_are_recorded_once_sent(self):
+        doctor = make_doctor('exporter')
+        for day in range(1, 4):
+            Appointment.objects.create(doctor=doctor, patient=self.patient, date=datetime.date(2030, 1, day), time=datetime.time(9, 0))
+        self.client.force_authenticate(doctor.user)
+        response = self.client.get(reverse('appointments-export'))
+        self.assertNotIn('appointments-export', registry.render())  # nothing sent yet
+        body = b''.join(response.streaming_content)
+        rendered = registry.render()
+        self.assertIn(f'http_response_size_bytes_sum{{url_name="appointments-export"}} {len(body)}', rendered)
+        self.assertIn('http_request_duration_seconds_count{url_name="appointments-export"} 1', rendered)
+        # The rows are read while streaming, after the view returned
+        self.assertNotIn('http_request_sql_queries_bucket{url_name="appointments-export",le="0"} 1', rendered)
+
+    @override_settings(QUERY_BUDGET=1)
+    def test_warns_over_query_budget(self):
+        with self.assertLogs('appointments.middleware', 'WARNING') as logs:
+            self.client.get(reverse('doctors'))
+        self.assertIn('doctors ran 2 SQL queries (budget 1)', logs.output[0])
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+    @override_settings(METRICS_TOKEN=None)
+    def test_metrics_without_a_token_are_staff_only(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.client.force_authenticate(User.objects.create(username='staff', is_staff=True))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+
+class BenchmarkingTests(TestCase):
+    def test_summarize_percentiles(self):
+        result = benchmarking.summarize([i / 1000 for i in range(1, 101)], elapsed=2.0, queries=[2, 4, None], statuses={200: 100})
+        self.assertEqual((result['p50_ms'], result['p95_ms'], result['p99_ms']), (50.0, 95.0, 99.0))
+        self.assertEqual(result['throughput_rps'], 50.0)
+        self.assertEqual((result['queries_mean'], result['queries_max']), (3.0, 4))
+
+    def test_seed_hospital(self):
+        doctors, patients = benchmarking.seed_hospital(3, 5, 30)
+        self.assertEqual(Appointment.objects.count(), 30)
+        self.assertTrue(patients[0].user.check_password(benchmarking.PASSWORD))
+
+
+class DatabaseProfileTests(SimpleTestCase):
+    def test_sqlite_profile(self):
+        database = databases.from_env({'DB_BUSY_TIMEOUT_MS': '2500'}, '/srv/db.sqlite3')
+        self.assertEqual((database['NAME'], database['CONN_MAX_AGE']), ('/srv/db.sqlite3', 600))
+        self.assertEqual(database['OPTIONS']['timeout'], 2.5)
+        self.assertEqual(database['OPTIONS']['transaction_mode'], 'IMMEDIATE')
+        self.assertIn('journal_mode=WAL', database['OPTIONS']['init_command'])
+
+    def test_sqlite_profile_applies_on_connect(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        settings_dict = connections.configure_settings({'default': databases.sqlite(f'{path}/wal.sqlite3')})['default']
+        wrapper = connections['default'].__class__(settings_dict, alias='profile')
+        try:
+            with wrapper.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode')
+                self.assertEqual(cursor.fetchone()[0], 'wal')
+        finally:
+            wrapper.close()
+
+    def test_postgresql_pool_disables_persistent_connections(self):
+        database = databases.from_env({'DB_ENGINE': 'postgresql', 'DB_NAME': 'appts', 'DB_POOL_MAX_SIZE': '8'}, None)
+        self.assertEqual(database['ENGINE'], 'django.db.backends.postgresql')
+        self.assertEqual(database['OPTIONS']['pool'], {'min_size': 2, 'max_size': 8})
+        self.assertEqual(database['CONN_MAX_AGE'], 0)
+        unpooled = databases.from_env({'DB_ENGINE': 'postgresql', 'DB_POOL': '0'}, None)
+        self.assertNotIn('pool', unpooled['OPTIONS'])
+        self.assertEqual(unpooled['CONN_MAX_AGE'], 600)
+
+    def test_rejects_unknown_engine(self):
+        with self.assertRaises(ImproperlyConfigured):
+            databases.from_env({'DB_ENGINE': 'oracle'}, None)
+
+
+class AsyncReadPathTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.patient = make_patient('patient')
+        self.doctor = make_doctor('doc', working_end=datetime.time(13, 0))
+        Appointment.objects.create(doctor=self.doctor, patient=self.patient, date=datetime.date(2030, 1, 1), time=datetime.time(9, 0))
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.patient.user)}'}
+        self.sync_client = APIClient()
+        self.sync_client.force_authenticate(self.patient.user)
+
+    async def test_requires_token(self):
+        response = await AsyncClient().get(reverse('async-doctors'))
+        self.assertEqual(response.status_code, 401)
+
+    async def test_matches_sync_endpoints(self):
+        client = AsyncClient()
+        cases = [
+            ('async-doctors', 'doctors', {}),
+            ('async-doctors', 'doctors', {'view': 'directory'}),
+            ('async-appointments', 'appointments', {}),
+            ('async-available-slots', 'available-slots', {'doctor': self.doctor.id, 'start': '2030-01-01', 'end': '2030-01-03'}),
+        ]
+        for async_name, sync_name, params in cases:
+            response = await client.get(reverse(async_name), params, headers=self.headers)
+            self.assertEqual(response.status_code, 200)
+            expected = await sync_to_async(self.sync_client.get)(reverse(sync_name), params)
+            self.assertEqual(response.json(), json.loads(json.dumps(expected.data)), async_name)
+            self.assertIn('queries', response['Server-Timing'])
+
+    async def test_server_timing_counts_queries_run_off_the_event_loop(self):
+        client = AsyncClient()
+        response = await client.get(reverse('async-appointments'), headers=self.headers)
+        self.assertNotIn('desc="0 queries"', response['Server-Timing'])
+        # A sync view under the async handler runs in a worker thread, and reports what it does under WSGI
+        expected = (await sync_to_async(self.sync_client.get)(reverse('doctors')))['Server-Timing'].split('desc=')[1]
+        self.assertNotEqual(expected, '"0 queries"')
+        response = await client.get(reverse('doctors'), headers=self.headers)
+        self.assertEqual(response['Server-Timing'].split('desc=')[1], expected)
+
+    async def test_conditional_get(self):
+        client = AsyncClient()
+        etag = (await client.get(reverse('async-doctors'), headers=self.headers))['ETag']
+        response = await client.get(reverse('async-doctors'), headers={**self.headers, 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
@@ -0,0 +1,67 @@
+import hashlib
+import io
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, features
+from . import conditional
+from .background import BackgroundTask
+
+SIZE = getattr(settings, 'THUMBNAIL_SIZE', (256, 256))
+FORMAT, EXTENSION = ('WEBP', 'webp') if features.check('webp') else ('JPEG', 'jpg')
+UPLOAD_TO = 'thumbnails/'
+
+
+def render(data):
+    """Resize image bytes to fit SIZE and encode them as WebP (JPEG if Pillow lacks WebP)."""
+    with Image.open(io.BytesIO(data)) as image:
+        image.thumbnail(SIZE)
+        if image.mode not in ('RGB', 'RGBA') or FORMAT == 'JPEG':
+            image = image.convert('RGBA' if FORMAT == 'WEBP' else 'RGB')
+        output = io.BytesIO()
+        image.save(output, FORMAT, quality=80)
+    return output.getvalue()
+
+
+def thumbnail_name(data):
+    # Content-addressed, so the file never changes and can be cached forever
+    digest = hashlib.sha256(data + repr((SIZE, FORMAT)).encode()).hexdigest()[:32]
+    return f'{UPLOAD_TO}{digest}.{EXTENSION}'
+
+
+def is_stale(profile):
+    source = profile.profile_image.name if profile.profile_image else ''
+    return source != profile.thumbnail_source
+
+
+def update_thumbnail(profile, force=False):
+    """Generate the profile's thumbnail if its image changed. Returns True when the row was updated."""
+    if not force and not is_stale(profile):
+        return False
+    model = type(profile)
+    if not profile.profile_image:
+        thumbnail, source = None, ''
+    else:
+        with profile.profile_image.open('rb') as fileobj:
+            data = fileobj.read()
+        thumbnail, source = thumbnail_name(data), profile.profile_image.name
+        if not default_storage.exists(thumbnail):
+            default_storage.save(thumbnail, ContentFile(render(data)))
+    model.objects.filter(pk=profile.pk).update(profile_thumbnail=thumbnail, thumbnail_source=source)
+    profile.profile_thumbnail, profile.thumbnail_source = thumbnail, source
+    conditional.bump_versions('doctors' if model._meta.model_name == 'doctorprofile' else 'patients')
+    return True
+
+
+def _generate(model, pk):
+    profile = model.objects.filter(pk=pk).first()
+    if profile is not None:
+        update_thumbnail(profile)
+
+
+_generate_later = BackgroundTask('thumbnails', _generate, 'THUMBNAIL_ASYNC')
+
+
+def schedule(profile):
+    """Generate the thumbnail off the request path (inline when THUMBNAIL_ASYNC is off, e.g. in tests)."""
+    _generate_later(type(profile), profile.pk)
@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from . import views
+from . import async_views, views
 from .views import AppointmentViewSet, DoctorCreateView, DoctorDeleteView, PatientListView, ProfileView, RegisterPatientView, DoctorEditView, DoctorDetailView
 
 router = DefaultRouter()
@@ -11,12 +11,29 @@ urlpatterns = [
     path('register/', views.UserRegistrationView.as_view(), name='register'),
     path('register/patient/', RegisterPatientView.as_view(), name='register-patient'),
     path('doctors/', views.DoctorListView.as_view(), name='doctors'),
+    path('doctors/search/', views.DoctorSearchView.as_view(), name='doctor-search'),
+    path('doctors/nearby/', views.DoctorNearbyView.as_view(), name='doctor-nearby'),
     path('doctors/add/', DoctorCreateView.as_view(), name='add-doctor-api'),
     path('doctors/<int:pk>/edit/', DoctorEditView.as_view(), name='edit-doctor'),
     path('doctors/<int:pk>/', DoctorDetailView.as_view(), name='doctor-detail'),
+    path('doctors/<int:pk>/calendar.ics', views.DoctorCalendarView.as_view(), name='doctor-calendar'),
+    path('doctors/<int:pk>/calendar/', views.DoctorCalendarLinkView.as_view(), name='doctor-calendar-link'),
+    path('doctors/<int:pk>/schedule/', views.DoctorScheduleView.as_view(), name='doctor-schedule'),
+    path('holidays/', views.HolidayListView.as_view(), name='holidays'),
+    path('holidays/<int:pk>/', views.HolidayDeleteView.as_view(), name='holiday-delete'),
     path('appointments/', views.AppointmentView.as_view(), name='appointments'),
+    path('appointments/series/', views.AppointmentSeriesView.as_view(), name='appointment-series'),
+    path('appointments/export/', views.AppointmentExportView.as_view(), name='appointments-export'),
+    path('appointments/cache-stats/', views.TimelineCacheStatsView.as_view(), name='appointments-cache-stats'),
     path('appointments/available/', views.AvailableSlotsView.as_view(), name='available-slots'),
+    path('stats/', views.StatsView.as_view(), name='stats'),
+    # Async (ASGI) read paths; same parameters and bodies as the synchronous endpoints above
+    path('async/doctors/', async_views.AsyncDoctorListView.as_view(), name='async-doctors'),
+    path('async/appointments/', async_views.AsyncAppointmentView.as_view(), name='async-appointments'),
+    path('async/appointments/available/', async_views.AsyncAvailableSlotsView.as_view(), name='async-available-slots'),
     path('profile/', ProfileView.as_view(), name='user-profile'),
     path('patients/', PatientListView.as_view(), name='patients'),
+    path('metrics/', views.MetricsView.as_view(), name='metrics'),
+    path('import/<str:kind>/', views.BulkImportView.as_view(), name='bulk-import'),
     path('doctors/<int:pk>/', DoctorDeleteView.as_view(), name='delete-doctor')
 ]
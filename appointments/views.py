@@ -1,10 +1,16 @@
+import csv
 import json
+from itertools import islice
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, permissions
 from django.utils import timezone
-from .models import DoctorProfile, Appointment, PatientProfile
-from .serializers import UserSerializer, DoctorSerializer, AppointmentSerializer, DoctorCreateSerializer, UserProfileSerializer, PatientProfileSerializer
+from .models import DoctorProfile, Appointment, PatientProfile, ScheduleException
+from .serializers import UserSerializer, DoctorSerializer, DoctorDirectorySerializer, AppointmentSerializer, AppointmentSeriesSerializer, DoctorCreateSerializer, DoctorScheduleSerializer, HolidaySerializer, ScheduleBlockSerializer, ScheduleExceptionSerializer, UserProfileSerializer, PatientProfileSerializer, PatientListSerializer, WORKING_HOURS_FIELDS, WorkingHoursSerializer
+from .pagination import DoctorDirectoryPagination, KeysetPagination, PatientListPagination
+from .conditional import conditional_get
+from .authentication import doctor_id_for, model_user, patient_id_for, profile_claims
+from . import availability, caching, exports, geocoding, ics, importers, metrics, notifications, rollups, schedules, search, thumbnails
 from rest_framework import viewsets
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
@@ -13,10 +19,20 @@ from django.contrib.auth.models import User
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.generics import DestroyAPIView
 from django.shortcuts import get_object_or_404
+from django.db.models import Prefetch
+from django.http import Http404, HttpResponse, HttpResponseForbidden, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.crypto import constant_time_compare
+from django.utils.http import http_date
+from django.conf import settings
+from django.views.static import serve
+from pathlib import Path
 
 class ProfileView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @conditional_get(per_user=True)
     def get(self, request):
         user = request.user
         return Response({
@@ -62,33 +78,114 @@ class RegisterPatientView(APIView):
 class DoctorListView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
+    @conditional_get('doctors', 'users', 'appointments', 'patients')
     def get(self, request):
-        doctors = DoctorProfile.objects.all()
+        """
+        Returns the doctor list.
+        ?view=directory returns a slim, cursor-paginated listing without appointments;
+        otherwise the full list is returned with appointments prefetched in one query.
+        """
+        doctors = DoctorProfile.objects.select_related('user')
+        if request.query_params.get('view') == 'directory':
+            paginator = DoctorDirectoryPagination()
+            page = paginator.paginate_queryset(doctors, request, view=self)
+            data = DoctorDirectorySerializer(page, many=True).data
+            return paginator.get_paginated_response(data)
+
+        appointments = Appointment.objects.select_related('patient').order_by('date', 'time')
+        doctors = doctors.prefetch_related(Prefetch('appointments', queryset=appointments))
         data = DoctorSerializer(doctors, many=True).data
         return Response(data)
 
-class AppointmentView(APIView):
+class DoctorSearchView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        user = request.user
-        # If the user has an associated DoctorProfile, they are a doctor
+        """
+        Searches doctors server-side with keyset pagination.
+        Text:    ?q=<free text> over name, specialization, clinic, qualification and city
+        Filters: ?specialization= &city= &state= &zipcode= &min_fee= &max_fee= &min_experience=
+        Sort:    ?sort=relevance|fee|-fee|experience|-experience|earliest (earliest looks ?within= days ahead)
+        """
         try:
-            doctor_profile = user.doctorprofile
-        except DoctorProfile.DoesNotExist:
-            doctor_profile = None
+            doctors, sort, within, text = search.parse_search_query(request.query_params)
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        if text and sort != 'relevance':
+            doctors = search.restrict_to_text(doctors, text)
+
+        field, descending, value_type = search.SORTS[sort]
+        paginator = KeysetPagination(request, value_type)
+        if field:
+            rows = paginator.filter_queryset(doctors.select_related('user'), field, descending)
+            page = rows[:paginator.page_size]
+            data = DoctorDirectorySerializer(page, many=True).data
+            last_key = (getattr(page[-1], field), page[-1].id) if page else None
+            return paginator.get_paginated_response(data, len(rows) > len(page), last_key)
+
+        # Relevance and earliest free slot aren't columns; they're computed for all matches in bulk and paged in Python
+        if sort == 'earliest':
+            keys = paginator.paginate_sorted(search.earliest_keys(doctors, within))
+        else:
+            keys = paginator.paginate_sorted(search.relevance_keys(doctors, text))
+        page_keys = keys[:paginator.page_size]
+        last_key = page_keys[-1] if page_keys else None
+        by_id = DoctorProfile.objects.select_related('user').in_bulk([pk for _, pk in page_keys])
+        # The text index can briefly lag a deleted doctor; skip ids that are gone
+        page_keys = [key for key in page_keys if key[1] in by_id]
+        data = DoctorDirectorySerializer([by_id[pk] for _, pk in page_keys], many=True).data
+        if sort == 'earliest':
+            for item, (earliest, _) in zip(data, page_keys):
+                item['earliest_available'] = None if earliest == search.NO_SLOT else earliest
+        return paginator.get_paginated_response(data, len(keys) > paginator.page_size, last_key)
+
+class DoctorNearbyView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        """
+        Doctors nearest a point, closest first, with their distance_km.
+        ?lat=&lng= [&radius=<km>: only doctors within it] [&limit=] plus the doctor search filters
+        (specialization, city, state, zipcode, min_fee, max_fee, min_experience).
+        """
+        try:
+            lat, lng, radius, limit = geocoding.parse_nearby_query(request.query_params)
+            doctors = search.filter_doctors(request.query_params)
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        if radius is None:
+            matches = geocoding.nearest(doctors, lat, lng, limit)
+        else:
+            matches = geocoding.within(doctors, lat, lng, radius)[:limit]
+        by_id = DoctorProfile.objects.select_related('user').in_bulk([doctor_id for _, doctor_id in matches])
+        matches = [(distance, doctor_id) for distance, doctor_id in matches if doctor_id in by_id]
+        data = DoctorDirectorySerializer([by_id[doctor_id] for _, doctor_id in matches], many=True).data
+        for item, (distance, _) in zip(data, matches):
+            item['distance_km'] = round(distance, 2)
+        return Response({"results": data})
 
+class AppointmentView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        user = request.user
+        # Roles come from the token claims (see authentication.ClaimsUser), so this needs no queries
+        doctor_id = None if user.is_staff else doctor_id_for(user)
         if user.is_staff:
             # Admin user: return all appointments (or could filter upcoming only)
+            role, principal_id = 'staff', None
             qs = Appointment.objects.all()
-        elif doctor_profile:
+        elif doctor_id:
             # Doctor: only their appointments
-            qs = Appointment.objects.filter(doctor=doctor_profile)
+            role, principal_id = 'doctor', doctor_id
+            qs = Appointment.objects.filter(doctor_id=principal_id)
         else:
             # Patient: only appointments where they are the patient
-            qs = Appointment.objects.filter(patient__user=user)
-        qs = qs.order_by('date', 'time')
-        data = AppointmentSerializer(qs, many=True).data
+            role, principal_id = 'patient', patient_id_for(user)
+            qs = Appointment.objects.filter(patient_id=principal_id)
+        qs = qs.select_related('doctor__user', 'patient').order_by('date', 'time')
+        # Serialized timelines are cached per role and principal; Appointment signals invalidate them
+        data = caching.get_timeline(role, principal_id, lambda: AppointmentSerializer(qs, many=True).data)
         return Response(data)
 
     def post(self, request):
@@ -107,15 +204,212 @@ class AppointmentView(APIView):
             message = (f"Dear {patient.first_name},\n\nYour appointment is confirmed:\n"
                        f"Doctor: Dr. {doctor_name}\nDate: {appt_date}\nTime: {appt_time}\nLocation: {location}\n\n"
                        "Thank you!")
-            # Use Django's send_mail function to send the email
-            # from django.core.mail import send_mail
-            # send_mail(subject, message, 
-            #           from_email=None,  # uses DEFAULT_FROM_EMAIL if set, or EMAIL_HOST_USER
-            #           recipient_list=[patient.email],
-            #           fail_silently=False)
-            # return Response({"message": "Appointment booked successfully"}, status=status.HTTP_201_CREATED)
+            # Queue the confirmation; the send_notifications worker delivers it after the response
+            notifications.queue_email(subject, message, [patient.email])
+            return Response({"message": "Appointment booked successfully"}, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+class AppointmentSeriesView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        """
+        Books a recurring series or a block of dates in one transaction, e.g. every Tuesday 10:00 for 12 weeks:
+        {"doctor": <id>, "time": "10:00", "start": "<first Tuesday>", "count": 12, "every_weeks": 1}
+        or {"doctor": <id>, "time": "10:00", "dates": ["<YYYY-MM-DD>", ...]}.
+        Taken dates fail the whole series with a per-date 409 report, unless "partial": true.
+        """
+        serializer = AppointmentSeriesSerializer(data=request.data, context={"request": request})
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        result = serializer.save()
+        appointments = result['appointments']
+        # One confirmation for the whole series
+        patient = request.user
+        doctor_profile = serializer.validated_data['doctor']
+        doctor_name = doctor_profile.user.get_full_name()
+        appt_time = appointments[0].time.strftime("%I:%M %p")
+        appt_dates = "\n".join(f"  {appointment.date:%Y-%m-%d}" for appointment in appointments)
+        location = doctor_profile.clinic_address or "Clinic"
+        subject = "Appointment Series Confirmation"
+        message = (f"Dear {patient.first_name},\n\nYour {len(appointments)} appointments are confirmed:\n"
+                   f"Doctor: Dr. {doctor_name}\nTime: {appt_time}\nLocation: {location}\nDates:\n{appt_dates}\n\n"
+                   "Thank you!")
+        notifications.queue_email(subject, message, [patient.email])
+        return Response({
+            "message": f"{len(appointments)} appointments booked successfully",
+            "booked": [
+                {"id": appointment.id, "date": appointment.date.isoformat(), "time": appointment.time.strftime("%H:%M")}
+                for appointment in appointments
+            ],
+            "conflicts": result['conflicts'],
+        }, status=status.HTTP_201_CREATED)
+
+class AppointmentExportView(APIView):
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+    def get(self, request):
+        """
+        Streams appointments as CSV or NDJSON.
+        Query parameters: ?type=csv|ndjson&start=<YYYY-MM-DD>&end=<YYYY-MM-DD>&doctor=<id>
+        """
+        export_type = request.query_params.get('type', 'csv')
+        if export_type not in ('csv', 'ndjson'):
+            return Response({"detail": "type must be csv or ndjson"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            start = request.query_params.get('start')
+            end = request.query_params.get('end')
+            start = timezone.datetime.strptime(start, "%Y-%m-%d").date() if start else None
+            end = timezone.datetime.strptime(end, "%Y-%m-%d").date() if end else None
+        except ValueError:
+            return Response({"detail": "Invalid date format, use YYYY-MM-DD"}, status=status.HTTP_400_BAD_REQUEST)
+        doctor_id = request.query_params.get('doctor')
+        if doctor_id and not doctor_id.isdigit():
+            return Response({"detail": "Invalid doctor id"}, status=status.HTTP_400_BAD_REQUEST)
+
+        qs = exports.export_queryset(start, end, doctor_id)
+        if export_type == 'csv':
+            response = StreamingHttpResponse(exports.stream_csv(qs), content_type='text/csv')
+        else:
+            response = StreamingHttpResponse(exports.stream_ndjson(qs), content_type='application/x-ndjson')
+        response['Content-Disposition'] = f'attachment; filename="appointments.{export_type}"'
+        return response
+
+def manages_doctor(user, doctor_id):
+    return user.is_authenticated and (user.is_staff or doctor_id_for(user) == doctor_id)
+
+class DoctorCalendarView(APIView):
+    # Calendar apps can't send a bearer token, so the feed also accepts its ?token= secret
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, pk):
+        """
+        Streams the doctor's appointments and working hours as an iCalendar feed.
+        Auth:  a bearer token of the doctor or staff, or ?token= from doctors/<id>/calendar/
+        Sync:  ?sync_token=<X-Sync-Token of the last response> returns only what changed since
+               (X-Sync-Mode says whether the body is a delta or the full feed); If-None-Match and
+               If-Modified-Since return 304 when nothing changed at all.
+        """
+        doctor = DoctorProfile.objects.select_related('user').filter(pk=pk).first()
+        if not (ics.check_feed_token(doctor, request.query_params.get('token')) or manages_doctor(request.user, pk)):
+            return Response({"detail": "Not allowed to read this calendar"}, status=status.HTTP_403_FORBIDDEN)
+        if doctor is None:
+            raise Http404
+        now = timezone.now()
+        modified = ics.last_modified(doctor)
+        etag = f'"{ics.encode_sync_token(modified)}"'
+        not_modified = get_conditional_response(request, etag=etag, last_modified=int(modified.timestamp()))
+        if not_modified is not None:
+            return not_modified
+
+        since = ics.resolve_since(doctor, request.query_params.get('sync_token'), now)
+        response = StreamingHttpResponse(ics.stream_calendar(doctor, since), content_type='text/calendar; charset=utf-8')
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(modified.timestamp())
+        response['Cache-Control'] = 'private, no-cache'
+        response['X-Sync-Token'] = ics.encode_sync_token(now - ics.SYNC_OVERLAP)
+        response['X-Sync-Mode'] = 'full' if since is None else 'delta'
+        response['Content-Disposition'] = f'inline; filename="doctor-{pk}.ics"'
+        return response
+
+class DoctorCalendarLinkView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        """Subscription URL of the doctor's calendar feed, with the feed token calendar apps authenticate with."""
+        if not manages_doctor(request.user, pk):
+            return Response({"detail": "Not allowed to read this calendar"}, status=status.HTTP_403_FORBIDDEN)
+        doctor = get_object_or_404(DoctorProfile.objects.only('id', 'calendar_nonce'), pk=pk)
+        return Response({"url": self.feed_url(request, pk, ics.feed_token(doctor))})
+
+    def post(self, request, pk):
+        """Issue a new subscription URL; every URL handed out before stops working."""
+        if not manages_doctor(request.user, pk):
+            return Response({"detail": "Not allowed to read this calendar"}, status=status.HTTP_403_FORBIDDEN)
+        doctor = get_object_or_404(DoctorProfile.objects.only('id', 'calendar_nonce'), pk=pk)
+        return Response({"url": self.feed_url(request, pk, ics.reset_feed_token(doctor))})
+
+    def feed_url(self, request, pk, token):
+        url = request.build_absolute_uri(reverse('doctor-calendar', args=[pk]))
+        return f"{url}?token={token}"
+
+class DoctorScheduleView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        """The doctor's weekly template and upcoming exceptions; an empty template means working hours every day."""
+        doctor = get_object_or_404(DoctorProfile, pk=pk)
+        return Response(self.schedule(doctor))
+
+    def put(self, request, pk):
+        """
+        Replaces the weekly template and the exceptions from today on.
+        {"weekly": [{"weekday": 0-6 (Monday first), "start", "end", "slot_minutes"?}, ...],
+         "exceptions": [{"date", "start"?, "end"?, "slot_minutes"?, "reason"?}, ...]}
+        Blocks of one day with a gap between them make a break; an exception without hours is a day off.
+        """
+        if not manages_doctor(request.user, pk):
+            return Response({"detail": "Not allowed to change this schedule"}, status=status.HTTP_403_FORBIDDEN)
+        doctor = get_object_or_404(DoctorProfile, pk=pk)
+        serializer = DoctorScheduleSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        schedules.replace_schedule(doctor, serializer.validated_data['weekly'], serializer.validated_data['exceptions'])
+        return Response(self.schedule(doctor))
+
+    def schedule(self, doctor):
+        upcoming = doctor.schedule_exceptions.filter(date__gte=timezone.localdate())
+        return {
+            "doctor": doctor.id,
+            "slot_minutes": doctor.slot_minutes,
+            "weekly": ScheduleBlockSerializer(doctor.schedule_blocks.all(), many=True).data,
+            "exceptions": ScheduleExceptionSerializer(upcoming, many=True).data,
+        }
+
+class HolidayListView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        """Upcoming clinic holidays: no doctor has slots on them unless they added hours for that date."""
+        holidays = ScheduleException.objects.filter(doctor=None, date__gte=timezone.localdate())
+        return Response(HolidaySerializer(holidays, many=True).data)
+
+    def post(self, request):
+        if not request.user.is_staff:
+            return Response({"detail": "Only staff can add holidays"}, status=status.HTTP_403_FORBIDDEN)
+        serializer = HolidaySerializer(data=request.data)
+        if serializer.is_valid():
+            serializer.save()
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+class HolidayDeleteView(DestroyAPIView):
+    queryset = ScheduleException.objects.filter(doctor=None)
+    serializer_class = HolidaySerializer
+    permission_classes = [IsAdminUser]
+
+class StatsView(APIView):
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+    def get(self, request):
+        """
+        Appointment counts and revenue from the daily rollups.
+        ?start=&end= (YYYY-MM-DD, default the last 30 days)
+        &group_by=day|month|year|doctor|specialization|city [&limit=] for doctor, specialization and city
+        Filters: specialization, city, doctor=<id>[,<id>...]; with doctors, also slots and utilization.
+        """
+        try:
+            start, end, group_by, filters, limit = rollups.parse_stats_query(request.query_params)
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(rollups.stats(start, end, group_by, filters, limit))
+
+class TimelineCacheStatsView(APIView):
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+    def get(self, request):
+        return Response(caching.stats())
+
 class AppointmentViewSet(viewsets.ModelViewSet):
     queryset = Appointment.objects.all()
     serializer_class = AppointmentSerializer
@@ -123,42 +417,54 @@ class AppointmentViewSet(viewsets.ModelViewSet):
 class AvailableSlotsView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
+    @conditional_get('doctors', 'appointments')
     def get(self, request):
         """
-        Returns available time slots for a given doctor and date.
-        Expects query parameters: ?doctor=<id>&date=<YYYY-MM-DD>
+        Returns available time slots for one or more doctors.
+        Single day:  ?doctor=<id>&date=<YYYY-MM-DD>
+        Date range:  ?doctor=<id>[,<id>...]&start=<YYYY-MM-DD>&end=<YYYY-MM-DD>
         """
-        doctor_id = request.query_params.get('doctor')
-        date_str = request.query_params.get('date')
-        if not doctor_id or not date_str:
-            return Response({"detail": "Doctor and date are required"}, status=status.HTTP_400_BAD_REQUEST)
-        # Parse inputs
         try:
-            doctor = DoctorProfile.objects.get(id=int(doctor_id))
-        except DoctorProfile.DoesNotExist:
+            doctor_ids, start, end, single_day = availability.parse_slot_query(request.query_params)
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        doctors = list(DoctorProfile.objects.filter(id__in=doctor_ids))
+        if len(doctors) != len(set(doctor_ids)):
             return Response({"detail": "Doctor not found"}, status=status.HTTP_404_NOT_FOUND)
-        try:
-            date = timezone.datetime.strptime(date_str, "%Y-%m-%d").date()
-        except ValueError:
-            return Response({"detail": "Invalid date format, use YYYY-MM-DD"}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Get all appointments for this doctor on that date
-        booked = Appointment.objects.filter(doctor=doctor, date=date).values_list('time', flat=True)
-        booked_times = set(booked)
-        # Generate 2-hour interval slots between working_start and working_end
-        start = doctor.working_start
-        end = doctor.working_end
-        available_slots = []
-        current = timezone.datetime.combine(date, start)
-        end_datetime = timezone.datetime.combine(date, end)
-        slot_delta = timezone.timedelta(hours=2)
-        # Loop from start to end, stepping 2 hours
-        while current + slot_delta <= end_datetime:
-            slot_time = current.time()
-            if slot_time not in booked_times:
-                available_slots.append(slot_time.strftime("%H:%M"))
-            current += slot_delta
-        return Response({"doctor": doctor.id, "date": date_str, "available_slots": available_slots})
+        slots = availability.available_slots(doctors, start, end)
+        return Response(availability.slots_payload(doctors, slots, start, end, single_day))
+
+
+def thumbnail_media(request, path):
+    # Development server only (routed when DEBUG is on). Thumbnail names are content hashes, so clients
+    # may cache them indefinitely; a production web server should send the same Cache-Control
+    response = serve(request, path, document_root=Path(settings.MEDIA_ROOT) / thumbnails.UPLOAD_TO)
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+class MetricsView(APIView):
+    """
+    Prometheus text format. Scrapers send METRICS_TOKEN as a bearer token; with no token configured
+    (development), staff users only.
+    """
+
+    def token(self):
+        return getattr(settings, 'METRICS_TOKEN', None)
+
+    def get_authenticators(self):
+        # The scrape token is not a JWT
+        return [] if self.token() else super().get_authenticators()
+
+    def get_permissions(self):
+        return [] if self.token() else [IsAuthenticated(), IsAdminUser()]
+
+    def get(self, request):
+        token = self.token()
+        if token and not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return HttpResponseForbidden()
+        return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4')
 
 class DoctorCreateView(APIView):
     parser_classes = [MultiPartParser, FormParser]
@@ -167,6 +473,13 @@ class DoctorCreateView(APIView):
     def post(self, request):
         data = request.data
         files = request.FILES
+        hours = WorkingHoursSerializer(data={
+            'working_start': data.get('working_start'),
+            'working_end': data.get('working_end'),
+            'slot_minutes': data.get('slot_minutes', 120),
+        })
+        if not hours.is_valid():
+            return Response(hours.errors, status=status.HTTP_400_BAD_REQUEST)
 
         # Extract name fields
         first_name = data.get('first_name', '')
@@ -192,8 +505,7 @@ class DoctorCreateView(APIView):
             qualification = data.get('qualification', ''),
             experience_years = data.get('experience_years', ''),
             consultation_fee = data.get('consultation_fee', ''),
-            working_start=data['working_start'],
-            working_end=data['working_end'],
+            **hours.validated_data,
             gender = data.get('gender', ''),
             phone = data.get('phone', ''),
             profile_image=files.get('profile_image')
@@ -201,9 +513,41 @@ class DoctorCreateView(APIView):
 
         return Response({"message": "Doctor created successfully"}, status=201)
 
+class BulkImportView(APIView):
+    parser_classes = [MultiPartParser, FormParser]
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+    def post(self, request, kind):
+        """
+        Bulk creates doctors or patients from an uploaded CSV or JSONL `file` of up to
+        importers.MAX_UPLOAD_ROWS rows. Returns the number created and a per-row error report.
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({"detail": "A CSV or JSONL file is required"}, status=status.HTTP_400_BAD_REQUEST)
+        file_type = request.data.get('file_type') or upload.name.rsplit('.', 1)[-1].lower()
+        if file_type not in ('csv', 'jsonl'):
+            return Response({"detail": "file_type must be csv or jsonl"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            # Read (and for CSV, decode) everything before the first batch commits
+            rows = list(islice(importers.read_rows(upload, file_type), importers.MAX_UPLOAD_ROWS + 1))
+        except (ValueError, UnicodeDecodeError, csv.Error) as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        if len(rows) > importers.MAX_UPLOAD_ROWS:
+            return Response(
+                {"detail": f"Upload at most {importers.MAX_UPLOAD_ROWS} rows; import bigger files with manage.py import_users"},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            )
+        try:
+            report = importers.import_rows(kind, rows, workers=0)  # no process pool inside a web worker
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(report, status=status.HTTP_201_CREATED if report['created'] else status.HTTP_400_BAD_REQUEST)
+
 class DoctorDetailView(APIView):
     permission_classes = [permissions.IsAuthenticated, permissions.IsAdminUser]
 
+    @conditional_get('doctors', 'users', 'appointments', 'patients')
     def get(self, request, pk):
         doctor = get_object_or_404(DoctorProfile, pk=pk)
         serializer = DoctorSerializer(doctor)
@@ -234,6 +578,9 @@ class DoctorEditView(APIView):
 
         data = request.data
         files = request.FILES
+        hours = WorkingHoursSerializer(data={field: data.get(field, getattr(doctor, field)) for field in WORKING_HOURS_FIELDS})
+        if not hours.is_valid():
+            return Response(hours.errors, status=status.HTTP_400_BAD_REQUEST)
 
         user = doctor.user
         user.first_name = data.get('first_name', user.first_name)
@@ -255,8 +602,7 @@ class DoctorEditView(APIView):
         doctor.qualification = data.get('qualification', doctor.qualification)
         doctor.experience_years = data.get('experience_years', doctor.experience_years)
         doctor.consultation_fee = data.get('consultation_fee', doctor.consultation_fee)
-        doctor.working_start = data.get('working_start', doctor.working_start)
-        doctor.working_end = data.get('working_end', doctor.working_end)
+        doctor.working_start, doctor.working_end, doctor.slot_minutes = (hours.validated_data[field] for field in WORKING_HOURS_FIELDS)
         doctor.gender = data.get('gender', doctor.gender)
         doctor.phone = data.get('phone', doctor.phone)
 
@@ -282,6 +628,9 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         token['username'] = user.username
         token['is_staff'] = user.is_staff
         token['is_superuser'] = user.is_superuser
+        # Profile ids let requests resolve the caller's role without loading User or profiles
+        for claim, value in profile_claims(user).items():
+            token[claim] = value
         return token
 
     def validate(self, attrs):
@@ -299,12 +648,13 @@ class CustomTokenObtainPairView(TokenObtainPairView):
 class UserProfileView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @conditional_get(per_user=True)
     def get(self, request):
-        serializer = UserProfileSerializer(request.user)
+        serializer = UserProfileSerializer(model_user(request.user))
         return Response(serializer.data)
 
     def put(self, request):
-        serializer = UserProfileSerializer(request.user, data=request.data, partial=True)
+        serializer = UserProfileSerializer(model_user(request.user), data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
             return Response(serializer.data)
@@ -314,7 +664,19 @@ class UserProfileView(APIView):
 class PatientListView(APIView):
     permission_classes = [IsAdminUser]
 
+    @conditional_get('patients', 'users', 'appointments', 'doctors')
     def get(self, request):
-        patients = PatientProfile.objects.select_related('user').all()
-        serializer = PatientProfileSerializer(patients, many=True)
-        return Response(serializer.data)
\ No newline at end of file
+        """
+        Cursor-paginated patient registry.
+        ?q=<name or phone prefix> searches server-side; ?expand=appointments nests each patient's
+        appointments, prefetched in one query for the whole page.
+        """
+        patients = search.filter_patients(request.query_params).select_related('user')
+        serializer_class = PatientListSerializer
+        if request.query_params.get('expand') == 'appointments':
+            appointments = Appointment.objects.select_related('doctor__user').order_by('date', 'time')
+            patients = patients.prefetch_related(Prefetch('appointments', queryset=appointments))
+            serializer_class = PatientProfileSerializer
+        paginator = PatientListPagination()
+        page = paginator.paginate_queryset(patients, request, view=self)
+        return paginator.get_paginated_response(serializer_class(page, many=True).data)
\ No newline at end of file
@@ -0,0 +1,81 @@
+"""
+DATABASES entries for the settings profiles.
+
+Plain functions that don't touch django.conf, so settings modules and the booking benchmark
+(appointments/management/commands/bench_booking.py) build connections the same way.
+"""
+from django.core.exceptions import ImproperlyConfigured
+
+
+def sqlite(name, busy_timeout_ms=5000, conn_max_age=600, wal=True):
+    """
+    Single-node SQLite tuned for concurrent requests: persistent connections, WAL so readers
+    never block the writer, and writers that queue for the lock instead of failing.
+    """
+    init_command = ['PRAGMA journal_mode=WAL', 'PRAGMA synchronous=NORMAL'] if wal else []
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': name,
+        'CONN_MAX_AGE': conn_max_age,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': busy_timeout_ms / 1000,  # sqlite3's timeout is SQLite's busy_timeout
+            # Take the write lock at BEGIN: a deferred transaction that reads and then writes can't
+            # wait for the lock once another writer holds it, and fails with "database is locked"
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': ';'.join(init_command),
+        },
+    }
+
+
+def postgresql(name, user, password, host, port, pool=True, pool_min=2, pool_max=20, conn_max_age=600,
+               server_side_cursors=True):
+    """
+    PostgreSQL through psycopg 3. With pool=True Django keeps a psycopg_pool connection pool per
+    process (requires psycopg[pool]); otherwise connections persist for conn_max_age seconds.
+    Set server_side_cursors=False behind a transaction-pooling PgBouncer.
+    """
+    database = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': name,
+        'USER': user,
+        'PASSWORD': password,
+        'HOST': host,
+        'PORT': port,
+        'CONN_MAX_AGE': conn_max_age,
+        'CONN_HEALTH_CHECKS': True,
+        'DISABLE_SERVER_SIDE_CURSORS': not server_side_cursors,
+        'OPTIONS': {},
+    }
+    if pool:
+        # Django's pool replaces persistent connections; the two can't be combined
+        database['CONN_MAX_AGE'] = 0
+        database['OPTIONS']['pool'] = {'min_size': pool_min, 'max_size': pool_max}
+    return database
+
+
+def from_env(environ, default_sqlite_path):
+    """The default database described by DB_* environment variables."""
+    engine = environ.get('DB_ENGINE', 'sqlite')
+    conn_max_age = int(environ.get('DB_CONN_MAX_AGE', 600))
+    if engine == 'sqlite':
+        return sqlite(
+            environ.get('DB_NAME', str(default_sqlite_path)),
+            busy_timeout_ms=int(environ.get('DB_BUSY_TIMEOUT_MS', 5000)),
+            conn_max_age=conn_max_age,
+            wal=environ.get('DB_SQLITE_WAL', '1') == '1',
+        )
+    if engine in ('postgres', 'postgresql'):
+        return postgresql(
+            environ.get('DB_NAME', 'appointments'),
+            environ.get('DB_USER', 'appointments'),
+            environ.get('DB_PASSWORD', ''),
+            environ.get('DB_HOST', 'localhost'),
+            environ.get('DB_PORT', '5432'),
+            pool=environ.get('DB_POOL', '1') == '1',
+            pool_min=int(environ.get('DB_POOL_MIN_SIZE', 2)),
+            pool_max=int(environ.get('DB_POOL_MAX_SIZE', 20)),
+            conn_max_age=conn_max_age,
+            server_side_cursors=environ.get('DB_SERVER_SIDE_CURSORS', '1') == '1',
+        )
+    raise ImproperlyConfigured(f"DB_ENGINE must be sqlite or postgresql, not {engine!r}")
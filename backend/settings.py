@@ -45,7 +45,8 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # Builds request.user from the signed claims instead of loading the User row per request
+        'rest_framework_simplejwt.authentication.JWTStatelessUserAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -53,6 +54,7 @@ REST_FRAMEWORK = {
 }
 
 MIDDLEWARE = [
+    'appointments.middleware.RequestMetricsMiddleware',  # outermost, so it times the whole stack
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -63,6 +65,10 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Request metrics: a warning is logged when one request runs more SQL queries than this
+QUERY_BUDGET = 50
+METRICS_TOKEN = None  # set to require "Authorization: Bearer <token>" on /api/metrics/
+
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",  # React dev server
     # (Add your production frontend domain later)
@@ -95,8 +101,29 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'timeout': 20,  # seconds a writer waits for the lock instead of failing with "database is locked"
+        },
+        'TEST': {
+            # File-backed test database: the in-memory shared-cache database fails concurrent
+            # writers immediately with "table is locked", which breaks the concurrency tests.
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
+    }
+}
+
+
+# Cache
+# Local memory is per process; point APPOINTMENT_CACHE_ALIAS at a shared backend
+# (e.g. django.core.cache.backends.redis.RedisCache) when running several workers.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'appointments',
     }
 }
+APPOINTMENT_CACHE_ALIAS = 'default'
+APPOINTMENT_CACHE_TIMEOUT = 300  # seconds a serialized appointment timeline is kept
 
 
 # Password validation
@@ -152,6 +179,18 @@ DEFAULT_FROM_EMAIL = "Appointment System <manzisakariyas@gmail.com>"
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+THUMBNAIL_SIZE = (256, 256)  # profile thumbnails are generated in the background, see appointments.thumbnails
+
+# Free-text doctor search: 'auto' uses SQLite FTS5 when available, else an in-process index ('fts5' / 'python' force one)
+DOCTOR_SEARCH_BACKEND = 'auto'
+
+# Clinic geocoding, run in the background when an address changes (see appointments.geocoding).
+# appointments.geocoding.LocalGeocoder is an offline stand-in for tests and development.
+GEOCODER = {
+    'BACKEND': 'appointments.geocoding.NominatimGeocoder',
+    'OPTIONS': {'user_agent': 'appt-booking-app'},  # Nominatim's usage policy asks for an identifying User-Agent
+}
+
 
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=30),  # default is 5 minutes
@@ -159,4 +198,8 @@ SIMPLE_JWT = {
     "ROTATE_REFRESH_TOKENS": True,
     "BLACKLIST_AFTER_ROTATION": True,
     "AUTH_HEADER_TYPES": ("Bearer",),
-}
\ No newline at end of file
+    "TOKEN_USER_CLASS": "appointments.authentication.ClaimsUser",
+    # Rotated refresh tokens are revoked in appointments.revocation, which prunes them once expired
+    "TOKEN_REFRESH_SERIALIZER": "appointments.authentication.RevocableTokenRefreshSerializer",
+}
+TOKEN_REVOCATION_PRUNE_INTERVAL = 3600  # seconds; also run `manage.py prune_revoked_tokens` from cron
\ No newline at end of file
@@ -0,0 +1,53 @@
+"""
+Production settings: the development settings with everything deployment-specific read from
+the environment. Select with DJANGO_SETTINGS_MODULE=backend.settings_production.
+
+DJANGO_SECRET_KEY         required
+DJANGO_ALLOWED_HOSTS      comma-separated host names
+DJANGO_CORS_ORIGINS       comma-separated frontend origins
+DJANGO_DEBUG              1 to enable (default 0)
+DB_ENGINE                 sqlite (default) or postgresql
+DB_NAME                   SQLite file path or PostgreSQL database name
+DB_CONN_MAX_AGE           seconds a connection is reused (default 600)
+DB_BUSY_TIMEOUT_MS        SQLite: how long a writer waits for the lock (default 5000)
+DB_SQLITE_WAL             SQLite: 1 (default) for WAL journaling
+DB_USER, DB_PASSWORD, DB_HOST, DB_PORT      PostgreSQL connection
+DB_POOL, DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE PostgreSQL: psycopg connection pool (default on, 2-20)
+DB_SERVER_SIDE_CURSORS    PostgreSQL: 0 behind a transaction-pooling PgBouncer
+REDIS_URL                 required: the cache every worker shares (ETag versions, timelines)
+METRICS_TOKEN             required: bearer token scrapers send to /api/metrics/
+"""
+import os
+from django.core.exceptions import ImproperlyConfigured
+from . import databases
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR
+
+try:
+    SECRET_KEY = os.environ['DJANGO_SECRET_KEY']
+except KeyError:
+    raise ImproperlyConfigured("Set DJANGO_SECRET_KEY for production")
+
+DEBUG = os.environ.get('DJANGO_DEBUG', '0') == '1'
+ALLOWED_HOSTS = [host for host in os.environ.get('DJANGO_ALLOWED_HOSTS', '').split(',') if host]
+CORS_ALLOWED_ORIGINS = [origin for origin in os.environ.get('DJANGO_CORS_ORIGINS', '').split(',') if origin]
+
+DATABASES = {
+    'default': databases.from_env(os.environ, BASE_DIR / 'db.sqlite3'),
+}
+
+# A per-process cache would leave the other workers answering 304 from version counters a write
+# never bumped in their process, so there is no fallback to the development LocMemCache
+try:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+except KeyError:
+    raise ImproperlyConfigured("Set REDIS_URL: production needs a cache shared by every worker")
+
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+if not METRICS_TOKEN:
+    raise ImproperlyConfigured("Set METRICS_TOKEN: /api/metrics/ is for the scraper that sends it")
@@ -15,8 +15,8 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
-from appointments.views import CustomTokenObtainPairView, ProfileView
+from django.urls import path, re_path, include
+from appointments.views import CustomTokenObtainPairView, ProfileView, thumbnail_media
 from django.conf import settings
 from django.conf.urls.static import static
 
@@ -29,4 +29,11 @@ urlpatterns = [
     path('api/auth/', CustomTokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/auth/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('api/profile/', ProfileView.as_view(), name='profile'),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+]
+
+if settings.DEBUG:
+    # Development only, like static(): in production the web server or storage backend serves media
+    urlpatterns += [
+        re_path(r'^%sthumbnails/(?P<path>.+)$' % settings.MEDIA_URL.lstrip('/'), thumbnail_media, name='thumbnail-media'),
+    ]
+urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -11,10 +11,16 @@ L.Icon.Default.mergeOptions({
   shadowUrl: require('leaflet/dist/images/marker-shadow.png'),
 });
 
-const GeocodedMap = ({ address }) => {
+const GeocodedMap = ({ address, latitude, longitude }) => {
   const [position, setPosition] = useState(null);
 
   useEffect(() => {
+    // The API geocodes clinics once server side; only fall back to Nominatim for addresses it couldn't place
+    if (latitude != null && longitude != null) {
+      setPosition([latitude, longitude]);
+      return;
+    }
+
     const fetchCoordinates = async () => {
       try {
         const response = await fetch(
@@ -33,7 +39,7 @@ const GeocodedMap = ({ address }) => {
     };
 
     fetchCoordinates();
-  }, [address]);
+  }, [address, latitude, longitude]);
 
   return position ? (
     <MapContainer center={position} zoom={13} style={{ height: "200px", width: "100%" }}>
@@ -1,18 +1,86 @@
-
+import { useEffect, useState } from 'react';
+import API from '../api';
 import AdminSidebar from '../components/AdminSidebar';
-import DoctorForm from '../components/DoctorForm';
 import Header from '../components/Header';
-import PatientList from './PatientsList';
+
+function isoDate(date) {
+    return date.toISOString().slice(0, 10);
+}
 
 function AdminDashboard() {
+    const [stats, setStats] = useState(null);
+    const [specializations, setSpecializations] = useState([]);
 
+    // Counted server side from the daily rollups, so this stays fast however much history there is
+    useEffect(() => {
+        const end = new Date();
+        const start = new Date(end.getFullYear() - 1, end.getMonth() + 1, 1);
+        const range = { start: isoDate(start), end: isoDate(end) };
+        API.get('stats/', { params: { ...range, group_by: 'month' } })
+            .then(res => setStats(res.data))
+            .catch(err => console.error('Error fetching stats', err));
+        API.get('stats/', { params: { ...range, group_by: 'specialization' } })
+            .then(res => setSpecializations(res.data.results))
+            .catch(err => console.error('Error fetching stats', err));
+    }, []);
 
     return (
         <div>
             <Header />
             <AdminSidebar/>
             <div className="p-4 sm:ml-64">
-                hello
+                {stats && (
+                    <>
+                        <div className="grid grid-cols-2 gap-4 mb-6">
+                            <div className="p-6 bg-white rounded-lg shadow">
+                                <p className="text-sm text-gray-500">Appointments, last 12 months</p>
+                                <p className="text-2xl font-semibold">{stats.totals.appointments}</p>
+                            </div>
+                            <div className="p-6 bg-white rounded-lg shadow">
+                                <p className="text-sm text-gray-500">Revenue, last 12 months</p>
+                                <p className="text-2xl font-semibold">{stats.totals.revenue}</p>
+                            </div>
+                        </div>
+                        <div className="grid grid-cols-2 gap-4">
+                            <table className="w-full text-sm text-left text-gray-500 bg-white shadow rounded-lg">
+                                <thead className="text-xs text-gray-700 uppercase bg-gray-100">
+                                    <tr>
+                                        <th className="p-4">Month</th>
+                                        <th className="p-4">Appointments</th>
+                                        <th className="p-4">Revenue</th>
+                                    </tr>
+                                </thead>
+                                <tbody>
+                                    {stats.results.map(row => (
+                                        <tr key={row.month} className="border-b">
+                                            <td className="p-4">{row.month.slice(0, 7)}</td>
+                                            <td className="p-4">{row.appointments}</td>
+                                            <td className="p-4">{row.revenue}</td>
+                                        </tr>
+                                    ))}
+                                </tbody>
+                            </table>
+                            <table className="w-full text-sm text-left text-gray-500 bg-white shadow rounded-lg">
+                                <thead className="text-xs text-gray-700 uppercase bg-gray-100">
+                                    <tr>
+                                        <th className="p-4">Specialization</th>
+                                        <th className="p-4">Appointments</th>
+                                        <th className="p-4">Revenue</th>
+                                    </tr>
+                                </thead>
+                                <tbody>
+                                    {specializations.map(row => (
+                                        <tr key={row.specialization} className="border-b">
+                                            <td className="p-4">{row.specialization}</td>
+                                            <td className="p-4">{row.appointments}</td>
+                                            <td className="p-4">{row.revenue}</td>
+                                        </tr>
+                                    ))}
+                                </tbody>
+                            </table>
+                        </div>
+                    </>
+                )}
             </div>
         </div>
     );
@@ -130,7 +130,7 @@ function DoctorView() {
                                     <p>{doctor.state} , {doctor.zipcode}</p>
                                 </div>
                                 <div className='w-2/3'>
-                                    <GeocodedMap address={fullAddress} />
+                                    <GeocodedMap address={fullAddress} latitude={doctor.latitude} longitude={doctor.longitude} />
                                 </div>
 
                             </div>
@@ -73,7 +73,7 @@ function DoctorsList() {
                                     <td className="flex items-center px-6 py-3 text-gray-900 whitespace-nowrap">
                                         <img
                                             className="w-10 h-10 rounded-full object-cover"
-                                            src={`http://localhost:8000${doc.profile_image}`}
+                                            src={`http://localhost:8000${doc.profile_thumbnail || doc.profile_image}`}
                                             alt="Doctor"
                                         />
                                         <div className="ps-3">
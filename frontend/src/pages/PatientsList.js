@@ -7,12 +7,30 @@ import { useNavigate } from 'react-router-dom';
 function PatientList() {
     const navigate = useNavigate();
     const [patients, setPatients] = useState([]);
+    const [next, setNext] = useState(null);
+    const [query, setQuery] = useState('');
 
+    // The list is cursor-paginated and searched server side; appointments are needed by PatientView
     useEffect(() => {
-        API.get('patients/')
-            .then(res => setPatients(res.data))
+        const timer = setTimeout(() => {
+            API.get('patients/', { params: { expand: 'appointments', q: query || undefined } })
+                .then(res => {
+                    setPatients(res.data.results);
+                    setNext(res.data.next);
+                })
+                .catch(err => console.error('Error fetching patient list', err));
+        }, 250);
+        return () => clearTimeout(timer);
+    }, [query]);
+
+    const loadMore = () => {
+        API.get(next)
+            .then(res => {
+                setPatients(current => [...current, ...res.data.results]);
+                setNext(res.data.next);
+            })
             .catch(err => console.error('Error fetching patient list', err));
-    }, []);
+    };
 
      const handleViewClick = (patient) => {
         navigate(`/patients/view/${patient.id}`, {
@@ -26,6 +44,13 @@ function PatientList() {
             <Header />
             <AdminSidebar />
             <div className='sm:ml-64 bg-gray-50 p-5'>
+                <input
+                    type="search"
+                    className="block w-full mb-4 py-3 px-4 shadow text-sm text-gray-900 rounded-full bg-white"
+                    placeholder="Search by name or phone..."
+                    value={query}
+                    onChange={e => setQuery(e.target.value)}
+                />
                 <div className="relative overflow-x-auto shadow-md sm:rounded-lg">
                     <table className="w-full text-sm text-left rtl:text-right text-gray-500">
                         <thead className="text-xs text-gray-700 uppercase bg-gray-100">
@@ -45,7 +70,7 @@ function PatientList() {
                                     <td className="flex items-center px-6 py-4 text-gray-900 whitespace-nowrap">
                                         <img
                                             className="w-10 h-10 rounded-full object-cover"
-                                            src={`http://localhost:8000${doc.profile_image}`}
+                                            src={`http://localhost:8000${doc.profile_thumbnail || doc.profile_image}`}
                                             alt="Doctor"
                                         />
                                         <div className="ps-3">
@@ -78,6 +103,11 @@ function PatientList() {
                         </tbody>
                     </table>
                 </div>
+                {next && (
+                    <button className="mt-4 py-2 px-5 rounded-full bg-blue-600 text-white text-sm" onClick={loadMore}>
+                        Load more
+                    </button>
+                )}
 
 
             </div>